@@ -0,0 +1,190 @@
+"""Invio non bloccante degli eventi di analytics.
+
+page e track (stessa firma del modulo analytics di Segment) mettono l'evento in una coda
+limitata in memoria e ritornano subito; un thread invia gli eventi a blocchi al backend.
+Se la coda è piena l'evento viene scartato secondo la politica scelta, senza mai bloccare
+il rerun. I backend sono intercambiabili: Segment, un file JSONL locale (per lavorare
+offline) oppure nessuno.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+#politiche quando la coda è piena: scartare l'evento nuovo o il più vecchio in coda
+DROP_NEWEST = "newest"
+DROP_OLDEST = "oldest"
+
+#un sink per nome e per processo, condiviso da tutti i rerun e da tutte le sessioni
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+class SegmentBackend(object):
+    def __init__(self, write_key: str):
+        import analytics
+        self.analytics = analytics
+        self.analytics.write_key = write_key
+
+    def send(self, events: list):
+        for event in events:
+            if event["type"] == "page":
+                self.analytics.page(event["user_id"], event["category"], event["name"], event["properties"],
+                                    timestamp=event["timestamp"])
+            else:
+                self.analytics.track(event["user_id"], event["event"], event["properties"],
+                                     timestamp=event["timestamp"])
+        self.analytics.flush()
+
+
+def json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
+
+
+class JsonlBackend(object):
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    def send(self, events: list):
+        with open(self.path, mode="a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(event, ensure_ascii=False, default=json_default) + "\n" for event in events))
+
+
+class NullBackend(object):
+    def send(self, events: list):
+        pass
+
+
+def backend_from_config(config: str, token_path: str = ".analytics_token"):
+    '''
+        "segment" (write key letta da token_path), "jsonl:<percorso>" oppure "none"
+    '''
+    if config == "segment":
+        with open(token_path) as f:
+            return SegmentBackend(f.read())
+    if config.startswith("jsonl:"):
+        return JsonlBackend(config[len("jsonl:"):])
+    if config == "none":
+        return NullBackend()
+    raise Exception(f"backend analytics sconosciuto: {config} (usare segment, jsonl:<percorso> o none)")
+
+
+class AnalyticsSink(object):
+    def __init__(self, backend, max_queue: int = 10000, batch_size: int = 100, flush_interval: float = 2.0,
+                 drop_policy: str = DROP_OLDEST):
+        if drop_policy not in (DROP_NEWEST, DROP_OLDEST):
+            raise Exception(f"politica di scarto sconosciuta: {drop_policy}")
+        self.backend = backend
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.drop_policy = drop_policy
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="analytics-sink", daemon=True)
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        self.flush_time = 0.0
+        self.last_flush_latency = None
+        self.max_flush_latency = 0.0
+        self.last_error = None
+
+    def start(self):
+        self._thread.start()
+        atexit.register(self.close)
+        return self
+
+    def page(self, user_id, category: str, name: str, properties: dict = None):
+        self._put({"type": "page", "user_id": user_id, "category": category, "name": name, "properties": properties or {}})
+
+    def track(self, user_id, event: str, properties: dict = None):
+        self._put({"type": "track", "user_id": user_id, "event": event, "properties": properties or {}})
+
+    def _put(self, event: dict):
+        event["timestamp"] = datetime.now()
+        with self._condition:
+            if len(self._queue) >= self.max_queue:
+                self.dropped += 1
+                if self.drop_policy == DROP_NEWEST:
+                    return
+                self._queue.popleft()
+            self._queue.append(event)
+            self.enqueued += 1
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._closed and len(self._queue) < self.batch_size:
+                    self._condition.wait(self.flush_interval)
+                if self._closed and not self._queue:
+                    return
+                batch = [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+            if batch:
+                self._send(batch)
+
+    def _send(self, batch: list):
+        start = time.perf_counter()
+        try:
+            self.backend.send(batch)
+            self.sent += len(batch)
+        except Exception as e:
+            #gli eventi di un blocco non inviato vengono persi: l'analytics non deve rallentare l'app
+            self.failed += len(batch)
+            self.last_error = repr(e)
+        latency = time.perf_counter() - start
+        self.batches += 1
+        self.flush_time += latency
+        self.last_flush_latency = latency
+        self.max_flush_latency = max(self.max_flush_latency, latency)
+
+    def close(self, timeout: float = 5.0):
+        '''
+            Invia gli eventi ancora in coda e ferma il thread
+        '''
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def metrics(self) -> dict:
+        with self._condition:
+            depth = len(self._queue)
+        return {
+            "queue_depth": depth,
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "sent": self.sent,
+            "failed": self.failed,
+            "batches": self.batches,
+            "last_flush_latency": self.last_flush_latency,
+            "mean_flush_latency": self.flush_time / self.batches if self.batches else None,
+            "max_flush_latency": self.max_flush_latency,
+            "last_error": self.last_error,
+        }
+
+
+def get_sink(name: str, factory) -> AnalyticsSink:
+    '''
+        Sink avviato con factory() alla prima richiesta e poi riutilizzato
+    '''
+    with _sinks_lock:
+        sink = _sinks.get(name)
+        if sink is None:
+            sink = _sinks[name] = factory().start()
+    return sink
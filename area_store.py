@@ -0,0 +1,81 @@
+"""Serie storiche per area (regione o provincia) pre-indicizzate.
+
+Il DataFrame viene ordinato una volta per (area, data) e ogni colonna è salvata come
+array contiguo: ogni area occupa un intervallo [inizio, fine) indicato da un dizionario.
+Selezionare un insieme di aree è quindi un lookup per area (più una take sulle posizioni)
+senza scansioni del frame.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class AreaSeriesStore(object):
+    def __init__(self, df: pd.DataFrame, area_column: str, group_column: str = None):
+        '''
+            area_column: colonna che identifica l'area (es. denominazione_provincia)
+            group_column: raggruppamento opzionale delle aree (es. denominazione_regione per le province)
+        '''
+        self.area_column = area_column
+        self.group_column = group_column
+        #con un raggruppamento la chiave è (gruppo, area): "In fase di definizione/aggiornamento"
+        #compare come provincia in ogni regione
+        key_columns = [group_column, area_column] if group_column is not None else [area_column]
+        ordered = df[df[area_column].notna()].copy()
+        keys = pd.MultiIndex.from_frame(ordered[key_columns]) if group_column is not None else pd.Index(ordered[area_column])
+        #ordine di prima comparsa delle chiavi, per restituire le selezioni nell'ordine del frame originale
+        ordered["_key_order"] = pd.factorize(keys)[0]
+        ordered = ordered.sort_values(["_key_order", "data"], kind="mergesort")
+        key_codes = ordered.pop("_key_order").values
+        self.frame = ordered.reset_index(drop=True)
+        self.columns = {column: self.frame[column].values for column in self.frame.columns}
+
+        boundaries = np.flatnonzero(key_codes[1:] != key_codes[:-1]) + 1
+        starts = np.concatenate([[0], boundaries]).astype(int) if len(key_codes) else np.array([], dtype=int)
+        ends = np.concatenate([boundaries, [len(key_codes)]]).astype(int) if len(key_codes) else np.array([], dtype=int)
+        areas = self.columns[area_column][starts]
+        groups = self.columns[group_column][starts] if group_column is not None else [None] * len(starts)
+
+        self.slices = {}
+        self.area_slices = {}
+        self.groups = {}
+        for area, group, start, end in zip(areas, groups, starts, ends):
+            key = (group, area) if group_column is not None else area
+            self.slices[key] = (start, end)
+            self.area_slices.setdefault(area, []).append((start, end))
+            if group_column is not None:
+                self.groups.setdefault(group, []).append(key)
+
+    def areas(self) -> list:
+        return list(self.area_slices)
+
+    def select(self, areas, columns=None) -> pd.DataFrame:
+        '''
+            Righe delle aree richieste (ordinate per area e data) come DataFrame
+        '''
+        wanted = set(areas)
+        return self._take([x for area, slices in self.area_slices.items() if area in wanted for x in slices], columns)
+
+    def select_groups(self, groups, columns=None) -> pd.DataFrame:
+        wanted = set(groups)
+        return self._take([self.slices[key] for group, keys in self.groups.items() if group in wanted for key in keys], columns)
+
+    def _take(self, slices, columns=None) -> pd.DataFrame:
+        frame = self.frame[columns] if columns else self.frame
+        if len(slices) == 1:
+            start, end = slices[0]
+            selected = frame.iloc[start:end].reset_index(drop=True)
+        else:
+            positions = np.concatenate([np.arange(start, end) for start, end in slices]) if slices else np.array([], dtype=int)
+            selected = frame.take(positions).reset_index(drop=True)
+        #le categorie delle aree non selezionate genererebbero gruppi (e tracce px) vuoti
+        for column in selected.select_dtypes(include="category").columns:
+            selected[column] = selected[column].cat.remove_unused_categories()
+        return selected
+
+    def series(self, area, column: str) -> np.array:
+        '''
+            Valori di una colonna per un'area; con un raggruppamento area è la coppia (gruppo, area)
+        '''
+        start, end = self.slices[area]
+        return self.columns[column][start:end]
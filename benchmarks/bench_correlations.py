@@ -0,0 +1,76 @@
+"""Confronto tra linear_reg chiamata per ogni coppia (metrica COVID, indicatore ISTAT) e batch_linear_regression.
+
+Con --processes viene misurato anche batch_significance (permutazioni e bootstrap) in un
+solo processo e sul pool con il numero di processi indicato.
+
+Uso (dalla root del repository):
+
+    python benchmarks/bench_correlations.py --days 60 --repeat 3 --processes 4
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+import synthetic
+from correlations import (batch_linear_regression, batch_significance, covid_metrics, istat_indicators,
+                          last_day_by_region)
+from utils import (add_area_statistics, get_conversion_indexes, get_istat_metadata, get_istat_series,
+                   linear_reg, prepare_regioni)
+
+
+def pairwise_regressions(x, y):
+    results = {}
+    for metric in x.columns:
+        for indicator in y.columns:
+            mask = y[indicator].notna()
+            _, _, r_value, mape = linear_reg(x[metric][mask], y[indicator][mask])
+            results[(metric, indicator)] = (r_value**2, mape)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=60)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    os.chdir(synthetic.REPO_ROOT)
+    pop, smokers, imprese = get_istat_series()
+    _, conversioni_regioni = get_conversion_indexes()
+    _, df_regioni, _ = synthetic.generate(days=args.days)
+    df_regioni = add_area_statistics(prepare_regioni(df_regioni, conversioni_regioni, pop), "denominazione_regione")
+    procapite_data = get_istat_metadata("DICA_ASIAUE1P_02042020145705482")["data_type_pro_capite"]
+
+    df_today = last_day_by_region(df_regioni)
+    x = covid_metrics(df_today)
+    x = x[np.isfinite(x.values).all(axis=1)]
+    y = istat_indicators(df_today, smokers, imprese, procapite_data).loc[x.index]
+
+    expected = pairwise_regressions(x, y)
+    result = batch_linear_regression(x, y)
+    for (i, metric) in enumerate(x.columns):
+        for (j, indicator) in enumerate(y.columns):
+            r2, mape = expected[(metric, indicator)]
+            if np.isfinite(result["r2"][i, j]):
+                assert np.isclose(r2, result["r2"][i, j]) and np.isclose(mape, result["mape"][i, j], equal_nan=True), (metric, indicator)
+
+    old = min(timeit.repeat(lambda: pairwise_regressions(x, y), number=1, repeat=args.repeat))
+    new = min(timeit.repeat(lambda: batch_linear_regression(x, y), number=1, repeat=args.repeat))
+    print(f"{x.shape[1]} metriche x {y.shape[1]} indicatori su {len(x)} regioni: "
+          f"linear_reg {old*1000:.1f} ms, matriciale {new*1000:.1f} ms, speedup x{old/new:.1f}")
+
+    if args.processes:
+        serial = min(timeit.repeat(lambda: batch_significance(x, y, processes=1), number=1, repeat=args.repeat))
+        pool = min(timeit.repeat(lambda: batch_significance(x, y, processes=args.processes, chunk_size=16), number=1, repeat=args.repeat))
+        print(f"significatività (permutazioni e bootstrap): 1 processo {serial*1000:.1f} ms, {args.processes} processi {pool*1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""Micro-benchmark della conversione delle date: convert_datetime + strftime per riga contro normalize_dates.
+
+Uso (dalla root del repository):
+
+    python benchmarks/bench_dates.py --days 1095 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import timeit
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic
+from utils import normalize_dates
+
+
+def convert_datetime(string_from):
+    #conversione per riga usata prima di normalize_dates, mantenuta qui come riferimento
+    dates = [datetime.strptime(x, "%Y-%m-%dT%H:%M:%S") for x in string_from]
+    return np.array(dates)
+
+
+def per_row_dates(df):
+    df = df.apply(lambda x: convert_datetime(x) if x.name == 'data' else x)
+    df["giorno"] = df["data"].apply(lambda x: x.strftime("%m/%d"))
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=3 * 365)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    df_province, _, _ = synthetic.generate(days=args.days)
+
+    expected = per_row_dates(df_province.copy())
+    result = normalize_dates(df_province.copy())
+    assert (expected["data"] == result["data"]).all()
+    assert (expected["giorno"] == result["giorno"].astype(str)).all()
+
+    old = min(timeit.repeat(lambda: per_row_dates(df_province.copy()), number=1, repeat=args.repeat))
+    new = min(timeit.repeat(lambda: normalize_dates(df_province.copy()), number=1, repeat=args.repeat))
+    print(f"{len(df_province)} righe ({args.days} giorni): per riga {old*1000:.1f} ms, vettorizzato {new*1000:.1f} ms, speedup x{old/new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
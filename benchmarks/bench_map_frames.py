@@ -0,0 +1,79 @@
+"""Dimensione del payload delle mappe animate: px.choropleth_mapbox (animation_frame="giorno") contro la mappa compatta.
+
+Scrive anche una pagina HTML per ogni mappa che misura nel browser il tempo medio per
+frame durante l'animazione (da aprire a mano, il risultato viene mostrato nella pagina).
+
+Uso (dalla root del repository):
+
+    python benchmarks/bench_map_frames.py --days 120 --html-dir /tmp/map_frames
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic
+from figures import (get_compact_provincial_map, get_compact_regional_map,
+                     get_provincial_map, get_regional_map)
+from utils import (add_area_statistics, get_conversion_indexes, get_istat_series,
+                   get_map_json, prepare_province, prepare_regioni, viridis)
+
+#tempo tra l'evento plotly_animatingframe di un frame e il successivo, misurato in pagina
+FRAME_TIMING_SCRIPT = """
+var gd = document.getElementById('{plot_id}');
+var times = [];
+var last = null;
+gd.on('plotly_animatingframe', function() {
+    var now = performance.now();
+    if (last !== null) { times.push(now - last); }
+    last = now;
+});
+gd.on('plotly_animated', function() {
+    var mean = times.reduce(function(a, b) { return a + b; }, 0) / Math.max(times.length, 1);
+    var p = document.createElement('p');
+    p.textContent = 'frame: ' + times.length + ', tempo medio per frame: ' + mean.toFixed(1) + ' ms';
+    document.body.insertBefore(p, document.body.firstChild);
+});
+Plotly.animate(gd, null, {frame: {duration: 0, redraw: true}, transition: {duration: 0}, mode: 'immediate'});
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--html-dir", default=None)
+    args = parser.parse_args()
+
+    os.chdir(synthetic.REPO_ROOT)
+    pop, _, _ = get_istat_series()
+    conversioni_province, conversioni_regioni = get_conversion_indexes()
+    df_province, df_regioni, _ = synthetic.generate(days=args.days)
+    df_province = add_area_statistics(prepare_province(df_province, conversioni_province, pop), "sigla_provincia")
+    df_regioni = add_area_statistics(prepare_regioni(df_regioni, conversioni_regioni, pop), "denominazione_regione")
+    province_map_json, regions_map_json = get_map_json()
+
+    builders = {
+        "regioni px": lambda: get_regional_map(df_regioni, regions_map_json, viridis, "totale_casi", "Casi Confermati"),
+        "regioni compatta": lambda: get_compact_regional_map(df_regioni, regions_map_json, viridis, "totale_casi", "Casi Confermati"),
+        "regioni compatta senza hover": lambda: get_compact_regional_map(df_regioni, regions_map_json, viridis, "totale_casi", "Casi Confermati", include_hover=False),
+        "province px": lambda: get_provincial_map(df_province, province_map_json, viridis),
+        "province compatta": lambda: get_compact_provincial_map(df_province, province_map_json, viridis),
+        "province compatta senza hover": lambda: get_compact_provincial_map(df_province, province_map_json, viridis, include_hover=False),
+    }
+    for name, build in builders.items():
+        start = time.perf_counter()
+        fig = build()
+        build_time = time.perf_counter() - start
+        payload = len(fig.to_json())
+        print(f"{name:30s} {len(fig.frames):4d} frame  {payload/1024:10.1f} KB  costruzione {build_time:6.2f} s")
+        if args.html_dir:
+            os.makedirs(args.html_dir, exist_ok=True)
+            fig.write_html(os.path.join(args.html_dir, name.replace(" ", "_") + ".html"), auto_play=False,
+                           post_script=FRAME_TIMING_SCRIPT)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""Tempo e memoria di picco di ogni fase della pipeline dei dati su dati sintetici di dimensione configurabile.
+
+I dati vengono generati con synthetic.py (--days giorni, --municipalities aree per
+provincia), salvati come CSV con la struttura del repository DPC e poi elaborati dalle
+stesse funzioni usate dall'app: lettura dei CSV, preparazione, statistiche (motore
+vettorizzato e groupby-apply + format_df), group_trentino e serie nazionale aggregata
+dalle regioni, stima di Rt per provincia, compattazione dei frame, get_dataset completo
+e costruzione delle mappe. Non serve la rete.
+
+Per ogni fase vengono misurati il tempo minimo su --repeat esecuzioni e la memoria di
+picco allocata (tracemalloc, in un'esecuzione separata). Con --output i risultati sono
+salvati in JSON insieme al commit, così si possono confrontare con --compare quelli
+di un altro commit.
+
+Uso (dalla root del repository):
+
+    python benchmarks/bench_pipeline.py --days 730 --municipalities 5 --output results.json
+    python benchmarks/bench_pipeline.py --days 730 --municipalities 5 --compare results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import synthetic
+import utils
+from figures import build_provincial_map, build_regional_map
+from frame_memory import compact_frame
+from rt import rt_frame
+from ingestion import DPCSource
+from utils import (add_area_statistics, add_statistics, format_df, get_conversion_indexes, get_istat_series,
+                   get_map_json, group_trentino, national_series, prepare_nazione, prepare_province, prepare_regioni, viridis)
+
+STAGES = ["generate", "write_csv", "read_csv", "prepare", "add_statistics_groupby", "add_area_statistics",
+          "group_trentino", "national_series", "rt", "compact_frame", "get_dataset", "regional_map", "provincial_map"]
+
+
+def measure(func, repeat: int) -> tuple:
+    '''
+        (risultato, tempo minimo in secondi, byte di picco allocati durante una esecuzione)
+    '''
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    del result
+
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, min(times), peak
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=synthetic.REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args, data_dir: str) -> dict:
+    os.chdir(synthetic.REPO_ROOT)
+    pop, _, _ = get_istat_series()
+    conversioni_province, conversioni_regioni = get_conversion_indexes()
+    skip = set(args.skip)
+    stages = {}
+
+    def stage(name, func, required=False):
+        #una fase saltata viene comunque eseguita (senza misura) se le successive ne usano il risultato
+        if name in skip:
+            return func() if required else None
+        result, seconds, peak = measure(func, args.repeat)
+        stages[name] = {"seconds": seconds, "peak_bytes": peak}
+        print(f"{name:24s} {seconds*1000:10.1f} ms  picco {peak/2**20:9.1f} MB", flush=True)
+        return result
+
+    df_province, df_regioni, df_nazione = stage("generate", lambda: synthetic.generate(
+        days=args.days, seed=args.seed, municipalities=args.municipalities), required=True)
+    stage("write_csv", lambda: synthetic.write_csv(data_dir, df_province, df_regioni, df_nazione), required=True)
+
+    source = DPCSource(data_dir)
+    raw = stage("read_csv", lambda: {x: source.read_full(x) for x in ("province", "regioni", "nazione")}, required=True)
+
+    def prepare():
+        return (prepare_province(raw["province"].copy(), conversioni_province, pop),
+                prepare_regioni(raw["regioni"].copy(), conversioni_regioni, pop),
+                prepare_nazione(raw["nazione"].copy()))
+    province, regioni, _ = stage("prepare", prepare, required=True)
+
+    stage("add_statistics_groupby", lambda: (format_df(province.copy().groupby("sigla_provincia").apply(add_statistics)),
+                                             format_df(regioni.copy().groupby("denominazione_regione").apply(add_statistics))))
+    province, regioni = stage("add_area_statistics", lambda: (add_area_statistics(province, "sigla_provincia"),
+                                                              add_area_statistics(regioni, "denominazione_regione")), required=True)
+
+    stage("group_trentino", lambda: group_trentino(regioni.copy()))
+    stage("national_series", lambda: national_series(regioni))
+    stage("rt", lambda: rt_frame(province, "denominazione_provincia"))
+    stage("compact_frame", lambda: (compact_frame(province), compact_frame(regioni)))
+
+    #get_dataset completo sulla cartella sintetica, senza la cache in memoria né quella su disco tra una ripetizione e l'altra
+    utils.DATA_SOURCE, utils.DATA_STORE_DIR, utils.DATASET_CACHE_DIR = data_dir, None, ""
+    stage("get_dataset", lambda: get_dataset_uncached(date.today()))
+
+    province_map_json, regions_map_json = get_map_json()
+    stage("regional_map", lambda: len(build_regional_map(regioni, regions_map_json, viridis, "totale_casi").to_json()))
+    stage("provincial_map", lambda: len(build_provincial_map(province, province_map_json, viridis).to_json()))
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "params": {"days": args.days, "municipalities": args.municipalities, "seed": args.seed, "repeat": args.repeat},
+        "rows": {"province": len(df_province), "regioni": len(df_regioni), "nazione": len(df_nazione)},
+        "stages": stages,
+    }
+
+
+def get_dataset_uncached(current_date):
+    utils.get_dataset.cache.clear()
+    return utils.get_dataset(current_date)
+
+
+def compare(results: dict, previous: dict):
+    print(f"\nconfronto con {previous.get('commit')} ({previous.get('timestamp')}, params {previous.get('params')})")
+    for name, stage in results["stages"].items():
+        old = previous.get("stages", {}).get(name)
+        if old is None:
+            continue
+        print(f"{name:24s} tempo x{stage['seconds']/max(old['seconds'], 1e-9):5.2f}  "
+              f"picco x{stage['peak_bytes']/max(old['peak_bytes'], 1):5.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--municipalities", type=int, default=1, help="aree sintetiche per provincia")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip", nargs="*", default=[], choices=STAGES, help="fasi da non misurare")
+    parser.add_argument("--data-dir", default=None, help="cartella in cui scrivere i CSV (default: temporanea)")
+    parser.add_argument("--output", default=None, help="file JSON in cui salvare i risultati")
+    parser.add_argument("--compare", default=None, help="file JSON di un'esecuzione precedente da confrontare")
+    args = parser.parse_args()
+    #run lavora dalla root del repository: i percorsi relativi sono risolti prima
+    output, previous = [os.path.abspath(x) if x else None for x in (args.output, args.compare)]
+
+    if args.data_dir:
+        results = run(args, os.path.abspath(args.data_dir))
+    else:
+        with tempfile.TemporaryDirectory() as data_dir:
+            results = run(args, data_dir)
+
+    if output:
+        with open(output, mode="w", encoding="utf-8") as f:
+            json.dump(results, f, indent=1)
+    if previous:
+        with open(previous, encoding="utf-8") as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Costo di st.SessionState() al crescere delle sessioni attive: implementazione precedente
+(scansione di tutte le sessioni e inspect.stack) contro registro delle sessioni e chiavi senza inspect.stack.
+
+Server e contesto streamlit vengono sostituiti da oggetti equivalenti con il numero di
+sessioni richiesto; le chiamate partono da una profondità di stack simile a quella del
+ScriptRunner di streamlit.
+
+Uso (dalla root del repository):
+
+    python benchmarks/bench_state.py --sessions 1 10 100 500 --calls 200
+"""
+
+import argparse
+import os
+import sys
+import threading
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import st_state_patch
+
+#implementazione precedente, compilata con il nome di file di st_state_patch così che
+#il confronto dei frame con __file__ funzioni come nel modulo originale
+LEGACY_SOURCE = '''
+def _get_session_object():
+    ctx = ReportThread.get_report_ctx()
+    this_session = None
+    current_server = Server.get_current()
+    if hasattr(current_server, '_session_infos'):
+        session_infos = Server.get_current()._session_infos.values()
+    else:
+        session_infos = Server.get_current()._session_info_by_id.values()
+    for session_info in session_infos:
+        s = session_info.session
+        if (
+            (hasattr(s, '_main_dg') and s._main_dg == ctx.main_dg)
+            or
+            (not hasattr(s, '_main_dg') and s.enqueue == ctx.enqueue)
+        ):
+            this_session = s
+    if this_session is None:
+        raise RuntimeError("session not found")
+    return this_session
+
+def _figure_out_key(key_counts):
+    stack = inspect.stack()
+    for stack_pos, stack_item in enumerate(stack):
+        filename = stack_item[1]
+        if filename != __file__:
+            break
+        else:
+            stack_item = None
+    if stack_item is None:
+        return None
+    filename = stack_item[1]
+    func_name = stack_item[3]
+    key = "%s :: %s :: %s" % (filename, func_name, stack_pos)
+    count = key_counts[key]
+    key_counts[key] += 1
+    key = "%s :: %s" % (key, count)
+    return key
+'''
+
+#profondità dello stack sotto lo script (ScriptRunner, exec, tornado...)
+STACK_DEPTH = 25
+
+
+class Session(object):
+    def enqueue(self, msg):
+        pass
+
+
+class SessionInfo(object):
+    def __init__(self, session):
+        self.session = session
+
+
+class Context(object):
+    def __init__(self, session):
+        self.enqueue = session.enqueue
+
+
+class FakeServer(object):
+    def __init__(self, sessions):
+        self._session_info_by_id = {idx: SessionInfo(x) for idx, x in enumerate(sessions)}
+
+
+class FakeReportThread(object):
+    ctx = None
+
+    @classmethod
+    def get_report_ctx(cls):
+        return cls.ctx
+
+
+def legacy_functions():
+    namespace = dict(vars(st_state_patch))
+    exec(compile(LEGACY_SOURCE, st_state_patch.__file__, "exec"), namespace)
+    return namespace["_get_session_object"], namespace["_figure_out_key"]
+
+
+def at_depth(depth, func):
+    if depth == 0:
+        return func()
+    return at_depth(depth - 1, func)
+
+
+def create_states(calls):
+    #una nuova "esecuzione" dello script: i contatori delle chiavi ripartono da zero
+    if hasattr(threading.current_thread(), "_key_counts"):
+        del threading.current_thread()._key_counts
+    return [st_state_patch.State() for _ in range(calls)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 100, 500])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    st_state_patch.ReportThread = FakeReportThread
+    legacy_session, legacy_key = legacy_functions()
+    current_session, current_key = st_state_patch._get_session_object, st_state_patch._figure_out_key
+
+    for count in args.sessions:
+        sessions = [Session() for _ in range(count)]
+        server = FakeServer(sessions)
+        st_state_patch.Server.get_current = classmethod(lambda cls, server=server: server)
+        #la sessione corrente è l'ultima: la scansione le visita tutte
+        FakeReportThread.ctx = Context(sessions[-1])
+
+        timings = {}
+        keys = {}
+        for name, (get_session, figure_out_key) in {"scansione + inspect.stack": (legacy_session, legacy_key),
+                                                    "registro + frame": (current_session, current_key)}.items():
+            st_state_patch._get_session_object = get_session
+            st_state_patch._figure_out_key = figure_out_key
+            at_depth(STACK_DEPTH, lambda: create_states(args.calls))
+            keys[name] = sorted(sessions[-1]._session_state)
+            del sessions[-1]._session_state
+            timings[name] = min(timeit.repeat(lambda: at_depth(STACK_DEPTH, lambda: create_states(args.calls)),
+                                              number=1, repeat=args.repeat)) / args.calls
+            del sessions[-1]._session_state
+        assert keys["scansione + inspect.stack"] == keys["registro + frame"], "le chiavi degli stati sono cambiate"
+
+        old, new = timings["scansione + inspect.stack"], timings["registro + frame"]
+        print(f"{count:5d} sessioni: precedente {old*1e6:9.1f} us/State, attuale {new*1e6:7.1f} us/State, speedup x{old/new:.0f}")
+
+    st_state_patch._get_session_object, st_state_patch._figure_out_key = current_session, current_key
+
+
+if __name__ == "__main__":
+    main()
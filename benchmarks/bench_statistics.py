@@ -0,0 +1,52 @@
+"""Confronto tra groupby-apply(add_statistics) + format_df e il motore vettorizzato add_area_statistics.
+
+Uso (dalla root del repository):
+
+    python benchmarks/bench_statistics.py --days 365 --repeat 3
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import synthetic
+from utils import (add_area_statistics, add_statistics, format_df, get_conversion_indexes,
+                   get_istat_series, prepare_province, prepare_regioni)
+
+
+def groupby_apply_statistics(df, area_column):
+    return format_df(df.groupby(area_column).apply(add_statistics))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.chdir(synthetic.REPO_ROOT)
+    pop, _, _ = get_istat_series()
+    conversioni_province, conversioni_regioni = get_conversion_indexes()
+    df_province, df_regioni, _ = synthetic.generate(days=args.days)
+    frames = {
+        "sigla_provincia": prepare_province(df_province, conversioni_province, pop),
+        "denominazione_regione": prepare_regioni(df_regioni, conversioni_regioni, pop),
+    }
+
+    for area_column, df in frames.items():
+        expected = groupby_apply_statistics(df.copy(), area_column)
+        result = add_area_statistics(df.copy(), area_column)
+        pd.testing.assert_frame_equal(expected.sort_index(), result.sort_index(), check_dtype=False)
+
+        old = min(timeit.repeat(lambda: groupby_apply_statistics(df.copy(), area_column), number=1, repeat=args.repeat))
+        new = min(timeit.repeat(lambda: add_area_statistics(df.copy(), area_column), number=1, repeat=args.repeat))
+        print(f"{area_column}: {len(df)} righe, groupby-apply {old*1000:.1f} ms, vettorizzato {new*1000:.1f} ms, speedup x{old/new:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Verifica che la memoria di picco dell'ingestione a blocchi del file province non cresca con lo storico.
+
+Per ogni lunghezza in --days viene generato un CSV province sintetico (synthetic.py) e
+caricato in uno store temporaneo con ingest_full, come al primo avvio con
+COVID_DATA_STORE. La memoria di picco (tracemalloc) viene confrontata con quella della
+lettura in un colpo solo (read_full + elaborazione dell'intero file). Il controllo
+fallisce (exit code 1) se il picco dell'ingestione a blocchi sullo storico più lungo
+supera --max-ratio volte quello sullo storico più corto.
+
+Uso (dalla root del repository):
+
+    python benchmarks/check_ingestion_memory.py --days 500 1000 2000 --chunksize 20000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthetic
+from ingestion import DPCSource, PartitionedStore, ingest_full
+from utils import add_area_statistics, get_conversion_indexes, get_istat_series, prepare_province, process_increment
+
+
+def traced(func) -> tuple:
+    '''
+        (secondi, byte di picco allocati) di una chiamata
+    '''
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, nargs="+", default=[500, 1000, 2000])
+    parser.add_argument("--municipalities", type=int, default=1, help="aree sintetiche per provincia")
+    parser.add_argument("--chunksize", type=int, default=20000)
+    parser.add_argument("--max-ratio", type=float, default=1.5)
+    args = parser.parse_args()
+
+    os.chdir(synthetic.REPO_ROOT)
+    pop, _, _ = get_istat_series()
+    conversioni_province, _ = get_conversion_indexes()
+    prepare = lambda x: prepare_province(x, conversioni_province, pop)
+    process = lambda new_raw, context: process_increment(new_raw, context, prepare, "sigla_provincia")
+
+    peaks = []
+    for days in sorted(args.days):
+        with tempfile.TemporaryDirectory() as root:
+            df_province, df_regioni, df_nazione = synthetic.generate(days=days, municipalities=args.municipalities)
+            synthetic.write_csv(os.path.join(root, "dpc"), df_province, df_regioni, df_nazione)
+            rows = len(df_province)
+            del df_province, df_regioni, df_nazione
+
+            source = DPCSource(os.path.join(root, "dpc"))
+            store = PartitionedStore(os.path.join(root, "store"))
+            chunked_time, chunked_peak = traced(lambda: ingest_full("province", source, store, process, args.chunksize))
+            full_time, full_peak = traced(lambda: add_area_statistics(prepare(source.read_full("province")), "sigla_provincia"))
+
+        peaks.append(chunked_peak)
+        print(f"{days:6d} giorni {rows:9d} righe | a blocchi: picco {chunked_peak/2**20:8.1f} MB in {chunked_time:6.1f} s"
+              f" | in un colpo: picco {full_peak/2**20:8.1f} MB in {full_time:6.1f} s", flush=True)
+
+    ratio = peaks[-1] / peaks[0]
+    print(f"picco a blocchi: storico più lungo / più corto = x{ratio:.2f} (massimo x{args.max_ratio})")
+    if ratio > args.max_ratio:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
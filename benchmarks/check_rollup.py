@@ -0,0 +1,66 @@
+"""Verifica che la serie nazionale aggregata dalle regioni coincida con quella ufficiale della Protezione Civile.
+
+La serie nazionale non viene più letta dalla pipeline ma ricavata dai dati regionali con
+il motore di aggregazione (rollup.py). Questo controllo legge anche il file nazionale
+ufficiale e confronta le due serie per data su ogni colonna dei conteggi; stampa le
+differenze e fallisce (exit code 1) se ce ne sono oltre --tolerance. Con --levels stampa
+anche l'ultimo giorno aggregato per ripartizione e per macro-area.
+
+Uso (dalla root del repository):
+
+    python benchmarks/check_rollup.py --source https://raw.githubusercontent.com/pcm-dpc/COVID-19/master
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+import synthetic
+from ingestion import DPCSource
+from rollup import MACRO_AREE, check_consistency
+from utils import (DATA_SOURCE, get_conversion_indexes, get_istat_series, national_series, prepare_nazione,
+                   prepare_regioni, rollup_areas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default=DATA_SOURCE, help="url o cartella con i CSV DPC (default: COVID_DATA_SOURCE)")
+    parser.add_argument("--tolerance", type=float, default=0)
+    parser.add_argument("--levels", action="store_true", help="stampa anche ripartizioni e macro-aree")
+    args = parser.parse_args()
+    source = args.source if "://" in args.source else os.path.abspath(args.source)
+
+    os.chdir(synthetic.REPO_ROOT)
+    pop, _, _ = get_istat_series()
+    _, conversioni_regioni = get_conversion_indexes()
+    dpc = DPCSource(source)
+    df_regioni = prepare_regioni(dpc.read_full("regioni"), conversioni_regioni, pop)
+    official = prepare_nazione(dpc.read_full("nazione"))
+
+    start = time.perf_counter()
+    derived = national_series(df_regioni)
+    print(f"serie nazionale aggregata da {len(df_regioni)} righe regionali in {(time.perf_counter() - start)*1000:.1f} ms")
+
+    mismatches = check_consistency(derived, official, tolerance=args.tolerance)
+    if args.levels:
+        last_day = df_regioni["data"].max()
+        for name, parent in (("ripartizione", "ripartizione"), ("macro_area", MACRO_AREE)):
+            levels = rollup_areas(df_regioni, parent, name)
+            print(levels[levels["data"] == last_day][[name, "totale_casi", "deceduti", "tamponi"]].to_string(index=False))
+
+    if mismatches.empty:
+        print(f"serie nazionale coerente con quella ufficiale su {derived['data'].nunique()} giorni")
+        return
+    with pd.option_context("display.max_rows", 200, "display.width", 200):
+        print(mismatches.to_string(index=False))
+    print(f"{len(mismatches)} differenze oltre la tolleranza {args.tolerance} in {mismatches['data'].nunique()} giorni")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Generatore di dati sintetici con la stessa struttura dei CSV della Protezione Civile.
+
+Le aree (regioni e province con sigle, codici e nomi) sono prese dalle tabelle di
+conversione e dal GeoJSON delle province del repository, così i dati generati passano
+per le stesse join della pipeline reale senza bisogno della rete. Per simulare una
+granularità comunale ogni provincia può essere divisa in più aree, e write_csv salva
+i dati in una cartella con la struttura del repository DPC (utilizzabile come
+COVID_DATA_SOURCE).
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from geo_index import AUTONOMOUS_PROVINCES
+from ingestion import DPC_FILES
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REGION_COLUMNS = ["ricoverati_con_sintomi", "terapia_intensiva", "totale_ospedalizzati", "isolamento_domiciliare",
+                  "totale_positivi", "variazione_totale_positivi", "nuovi_positivi", "dimessi_guariti",
+                  "deceduti", "totale_casi", "tamponi"]
+
+START_DATE = datetime(2020, 2, 24, 18)
+
+#giorni tra un'ondata e la successiva nelle serie lunghe
+WAVE_PERIOD = 180
+
+
+def get_areas():
+    regioni = pd.read_csv(os.path.join(REPO_ROOT, "codici_regioni.CSV"), encoding="ISO-8859-1", sep=";")
+    with open(os.path.join(REPO_ROOT, "map", "GeoJSON", "limits_IT_provinces_simple.json")) as map_file:
+        features = json.load(map_file)["features"]
+
+    #nei CSV DPC le province autonome hanno i codici 21 e 22, non il codice storico 4 del Trentino Alto Adige
+    codici_pa = {(regione, sigla): codice for codice, (regione, sigla) in AUTONOMOUS_PROVINCES.items()}
+    nomi_pa = {"BZ": "P.A. Bolzano", "TN": "P.A. Trento"}
+    codici_regioni = regioni["codice_storico"].copy()
+    for (_, sigla), codice in codici_pa.items():
+        codici_regioni[regioni["denominazione_regione"] == nomi_pa[sigla]] = codice
+    regioni = pd.DataFrame({"codice_regione": codici_regioni.values, "denominazione_regione": regioni["denominazione_regione"].values})
+
+    nomi_regioni = dict(zip(regioni["codice_regione"], regioni["denominazione_regione"]))
+    province = []
+    for feature in features:
+        p = feature["properties"]
+        codice_regione = codici_pa.get((p["reg_istat_code_num"], p["prov_acr"]), p["reg_istat_code_num"])
+        province.append((codice_regione, nomi_regioni[codice_regione], p["prov_istat_code_num"], p["prov_name"], p["prov_acr"]))
+    return regioni, pd.DataFrame(province,
+        columns=["codice_regione", "denominazione_regione", "codice_provincia", "denominazione_provincia", "sigla_provincia"])
+
+
+def epidemic_curve(days: int, areas: int, rng) -> np.array:
+    '''
+        Curva cumulativa dei casi per area (days x areas): crescita logistica con
+        picco e ampiezza diversi per area più rumore giornaliero non negativo
+    '''
+    t = np.arange(days)[:, None]
+    peak = rng.uniform(20, 60, areas)
+    size = rng.uniform(500, 20000, areas)
+    daily = size * np.exp(-(t - peak) ** 2 / (2 * 12 ** 2)) / (12 * np.sqrt(2 * np.pi))
+    #su più anni un'ondata ogni WAVE_PERIOD giorni, così la serie non resta piatta dopo la prima
+    for wave in range(1, (days - 1) // WAVE_PERIOD + 1):
+        wave_peak = wave * WAVE_PERIOD + rng.uniform(20, 60, areas)
+        wave_size = rng.uniform(500, 20000, areas)
+        daily = daily + wave_size * np.exp(-(t - wave_peak) ** 2 / (2 * 20 ** 2)) / (20 * np.sqrt(2 * np.pi))
+    daily = rng.poisson(daily)
+    return np.cumsum(daily, axis=0)
+
+
+def split_municipalities(province: pd.DataFrame, municipalities: int) -> pd.DataFrame:
+    '''
+        Divide ogni provincia in municipalities aree con lo stesso codice provincia (le join
+        restano valide) e nome e sigla propri (le statistiche restano per area)
+    '''
+    if municipalities <= 1:
+        return province
+    aree = province.loc[province.index.repeat(municipalities)].reset_index(drop=True)
+    numero = np.tile(np.arange(1, municipalities + 1), len(province))
+    aree["denominazione_provincia"] = aree["denominazione_provincia"] + " " + numero.astype(str)
+    aree["sigla_provincia"] = aree["sigla_provincia"] + np.char.zfill(numero.astype(str), 3)
+    return aree
+
+
+def generate(days: int = 45, seed: int = 0, start: datetime = START_DATE, municipalities: int = 1):
+    '''
+        Restituisce df_province, df_regioni e df_nazione con le colonne dei CSV DPC.
+        Con municipalities > 1 ogni provincia diventa municipalities aree nel livello province.
+    '''
+    rng = np.random.RandomState(seed)
+    regioni, province = get_areas()
+    province = split_municipalities(province, municipalities)
+    dates = [(start + timedelta(days=x)).strftime("%Y-%m-%dT%H:%M:%S") for x in range(days)]
+
+    #province vere più una riga "In fase di definizione/aggiornamento" per regione, senza sigla
+    in_definizione = pd.DataFrame({
+        "codice_regione": regioni["codice_regione"].values,
+        "denominazione_regione": regioni["denominazione_regione"].values,
+        "codice_provincia": 979 + np.arange(len(regioni)),
+        "denominazione_provincia": "In fase di definizione/aggiornamento",
+        "sigla_provincia": "",
+    })
+    aree_province = pd.concat([province, in_definizione], ignore_index=True)
+    casi_province = epidemic_curve(days, len(aree_province), rng)
+
+    df_province = pd.concat([aree_province] * days, ignore_index=True)
+    df_province.insert(0, "data", np.repeat(dates, len(aree_province)))
+    df_province.insert(1, "stato", "ITA")
+    df_province["lat"] = np.where(df_province["sigla_provincia"] == "", 0, rng.uniform(37, 46, len(df_province)).round(6))
+    df_province["long"] = np.where(df_province["sigla_provincia"] == "", 0, rng.uniform(7, 18, len(df_province)).round(6))
+    df_province["totale_casi"] = casi_province.ravel()
+    df_province["note_it"] = ""
+    df_province["note_en"] = ""
+
+    casi_regioni = epidemic_curve(days, len(regioni), rng)
+    df_regioni = pd.concat([regioni] * days, ignore_index=True)
+    df_regioni.insert(0, "data", np.repeat(dates, len(regioni)))
+    df_regioni.insert(1, "stato", "ITA")
+    df_regioni["lat"] = rng.uniform(37, 46, len(df_regioni)).round(6)
+    df_regioni["long"] = rng.uniform(7, 18, len(df_regioni)).round(6)
+    totale_casi = casi_regioni.ravel()
+    df_regioni["deceduti"] = (totale_casi * 0.1).astype(int)
+    df_regioni["dimessi_guariti"] = (totale_casi * 0.2).astype(int)
+    df_regioni["totale_positivi"] = totale_casi - df_regioni["deceduti"] - df_regioni["dimessi_guariti"]
+    df_regioni["terapia_intensiva"] = (df_regioni["totale_positivi"] * 0.05).astype(int)
+    df_regioni["ricoverati_con_sintomi"] = (df_regioni["totale_positivi"] * 0.3).astype(int)
+    df_regioni["totale_ospedalizzati"] = df_regioni["terapia_intensiva"] + df_regioni["ricoverati_con_sintomi"]
+    df_regioni["isolamento_domiciliare"] = df_regioni["totale_positivi"] - df_regioni["totale_ospedalizzati"]
+    df_regioni["variazione_totale_positivi"] = df_regioni.groupby("denominazione_regione")["totale_positivi"].diff().fillna(0).astype(int)
+    df_regioni["nuovi_positivi"] = df_regioni.groupby("denominazione_regione")["totale_positivi"].diff().fillna(0).clip(lower=0).astype(int)
+    df_regioni["totale_casi"] = totale_casi
+    df_regioni["tamponi"] = totale_casi * 8 + rng.randint(0, 100, len(df_regioni)).cumsum()
+    df_regioni = df_regioni[["data", "stato", "codice_regione", "denominazione_regione", "lat", "long"] + REGION_COLUMNS]
+    df_regioni["note_it"] = ""
+    df_regioni["note_en"] = ""
+
+    df_nazione = df_regioni.groupby(["data", "stato"], as_index=False)[REGION_COLUMNS].sum()
+    df_nazione["note_it"] = ""
+    df_nazione["note_en"] = ""
+
+    return df_province, df_regioni, df_nazione
+
+
+def write_csv(root: str, df_province: pd.DataFrame, df_regioni: pd.DataFrame, df_nazione: pd.DataFrame, daily: bool = False):
+    '''
+        Salva i tre livelli in root con la struttura del repository DPC; con daily anche i file giornalieri
+    '''
+    for level, df in (("province", df_province), ("regioni", df_regioni), ("nazione", df_nazione)):
+        folder, name = DPC_FILES[level]
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+        df.to_csv(os.path.join(root, folder, f"{name}.csv"), index=False)
+        if daily:
+            for day, rows in df.groupby(df["data"].str[:10]):
+                rows.to_csv(os.path.join(root, folder, f"{name}-{day.replace('-', '')}.csv"), index=False)
@@ -0,0 +1,243 @@
+"""Regressioni lineari di tutti gli indicatori ISTAT regionali contro le metriche COVID.
+
+Per ogni coppia (metrica COVID x, indicatore ISTAT y) vengono calcolati pendenza, intercetta,
+R^2 e MAPE come in utils.linear_reg, ma per tutte le coppie insieme: le somme necessarie
+ai minimi quadrati sono prodotti tra matrici regioni x metriche e regioni x indicatori.
+I valori mancanti di un indicatore escludono solo quella regione per quell'indicatore.
+
+Con poche regioni un R^2 alto può essere casuale: batch_significance aggiunge per ogni coppia
+un p-value di permutazione e un intervallo di confidenza bootstrap di R^2, calcolati per tutte
+le permutazioni e i campioni insieme con einsum.
+"""
+
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+#metriche COVID usate come asse x: nome -> (numeratore, denominatore)
+COVID_METRICS = {
+    "Deceduti per casi confermati": ("deceduti", "totale_casi"),
+    "Casi confermati pro capite": ("totale_casi", "Popolazione_Sesso_totale"),
+    "Deceduti pro capite": ("deceduti", "Popolazione_Sesso_totale"),
+    "Ricoverati in terapia intensiva pro capite": ("terapia_intensiva", "Popolazione_Sesso_totale"),
+    "Totale ospedalizzati pro capite": ("totale_ospedalizzati", "Popolazione_Sesso_totale"),
+    "Tamponi pro capite": ("tamponi", "Popolazione_Sesso_totale"),
+    "Growth rate (media 3 giorni)": ("smooth_growth_rate", None),
+}
+
+CORRELATION_COLUMNS = ["fonte", "indicatore", "metrica", "slope", "intercept", "r2", "mape", "regioni"]
+SIGNIFICANCE_COLUMNS = ["p_value", "r2_low", "r2_high"]
+
+#con circa 21 regioni R^2 alti si ottengono anche per caso: p-value di permutazione e intervallo bootstrap
+SIGNIFICANCE_PERMUTATIONS = 1000
+SIGNIFICANCE_BOOTSTRAP = 1000
+#indicatori elaborati insieme (la memoria cresce con permutazioni x metriche x indicatori)
+SIGNIFICANCE_CHUNK_SIZE = 64
+#sotto questo numero di coppie l'avvio dei processi costa più del calcolo
+SIGNIFICANCE_PARALLEL_PAIRS = 5000
+
+
+def last_day_by_region(df_regioni: pd.DataFrame) -> pd.DataFrame:
+    df_today = df_regioni.set_index("NUTS3")
+    return df_today[df_today["data"] == df_today["data"].max()]
+
+
+def covid_metrics(df_today: pd.DataFrame, metrics: dict = COVID_METRICS) -> pd.DataFrame:
+    columns = {}
+    for name, (numerator, denominator) in metrics.items():
+        values = df_today[numerator].astype(np.float64)
+        columns[name] = values / df_today[denominator].astype(np.float64) if denominator else values
+    return pd.DataFrame(columns, index=df_today.index)
+
+
+def istat_indicators(df_today: pd.DataFrame, smokers: pd.DataFrame, imprese: pd.DataFrame, imprese_pro_capite: dict) -> pd.DataFrame:
+    '''
+        Indicatori per regione (indice NUTS3) con colonne a due livelli (fonte, indicatore):
+            Fumatori: valori ISTAT così come sono
+            Imprese: pro capite per i tipi di dato indicati in imprese_pro_capite (come nella sezione Imprese)
+            Popolazione: quota della popolazione per fascia d'età, sesso e stato civile
+    '''
+    population = df_today["Popolazione_Sesso_totale"].astype(np.float64)
+
+    smokers = smokers.reindex(df_today.index).astype(np.float64)
+
+    imprese = imprese.reindex(df_today.index).astype(np.float64)
+    for data_type, pro_capite in imprese_pro_capite.items():
+        if pro_capite:
+            columns = [x for x in imprese.columns if x.startswith(data_type + "_")]
+            imprese[columns] = imprese[columns].div(population, axis=0)
+
+    breakdown = [x for x in df_today.columns if x.startswith("Popolazione_") and not x.lower().endswith(("_total", "_totale"))]
+    shares = df_today[breakdown].astype(np.float64).div(population, axis=0)
+
+    return pd.concat({"Fumatori": smokers, "Imprese": imprese, "Popolazione": shares}, axis=1)
+
+
+def regression_from_sums(n, sum_x, sum_y, sum_xx, sum_yy, sum_xy):
+    '''
+        Pendenza, intercetta e coefficiente di correlazione dalle somme dei minimi quadrati
+        (array della stessa forma, un elemento per regressione)
+    '''
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov_xy = sum_xy - sum_x * sum_y / n
+        var_x = sum_xx - sum_x ** 2 / n
+        var_y = sum_yy - sum_y ** 2 / n
+        #varianza nulla (a meno dell'arrotondamento): la regressione non è definita
+        var_x = np.where(var_x > 1e-12 * sum_xx, var_x, np.nan)
+        var_y = np.where(var_y > 1e-12 * sum_yy, var_y, np.nan)
+        slope = cov_xy / var_x
+        intercept = (sum_y - slope * sum_x) / n
+        r = np.clip(cov_xy / np.sqrt(var_x * var_y), -1, 1)
+    return slope, intercept, r
+
+
+def batch_linear_regression(x: pd.DataFrame, y: pd.DataFrame) -> dict:
+    '''
+        Regressione di ogni colonna di y su ogni colonna di x (stesse righe).
+        Restituisce matrici (colonne di x) x (colonne di y) con slope, intercept, r2, mape e regioni usate.
+        Le righe in cui y è NaN sono escluse per quella colonna; x non deve avere NaN.
+    '''
+    X = x.values.astype(np.float64)
+    Y = y.values.astype(np.float64)
+    W = np.isfinite(Y).astype(np.float64)
+    Y0 = np.where(W > 0, Y, 0.0)
+
+    #somme pesate con la maschera dei valori presenti: ogni elemento è (metrica, indicatore)
+    n = W.sum(axis=0)[None, :]
+    slope, intercept, r = regression_from_sums(n, X.T @ W, Y0.sum(axis=0)[None, :], (X ** 2).T @ W,
+                                               (Y0 ** 2).sum(axis=0)[None, :], X.T @ Y0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        #errore percentuale: righe x metriche x indicatori, le righe mancanti non contano nella media
+        prediction = intercept[None, :, :] + slope[None, :, :] * X[:, :, None]
+        error = np.abs((Y[:, None, :] - prediction) / Y[:, None, :])
+        mape = np.nanmean(np.where(W[:, None, :] > 0, error, np.nan), axis=0) * 100
+
+    return {"slope": slope, "intercept": intercept, "r2": r ** 2, "mape": mape,
+            "regioni": np.broadcast_to(n, slope.shape).astype(int)}
+
+
+def permutation_r(X: np.array, Y: np.array, permutations: np.array) -> np.array:
+    '''
+        Coefficienti di correlazione con le righe di X permutate: (permutazioni, metriche, indicatori)
+    '''
+    W = np.isfinite(Y).astype(np.float64)
+    Y0 = np.where(W > 0, Y, 0.0)
+    Xp = X[permutations]
+    n = W.sum(axis=0)[None, None, :]
+    _, _, r = regression_from_sums(n, np.einsum("pim,ik->pmk", Xp, W), Y0.sum(axis=0)[None, None, :],
+                                   np.einsum("pim,ik->pmk", Xp ** 2, W), (Y0 ** 2).sum(axis=0)[None, None, :],
+                                   np.einsum("pim,ik->pmk", Xp, Y0))
+    return r
+
+
+def bootstrap_r2(X: np.array, Y: np.array, weights: np.array) -> np.array:
+    '''
+        R^2 sui campioni bootstrap espressi come pesi (numero di estrazioni di ogni riga):
+        (campioni, metriche, indicatori)
+    '''
+    W = np.isfinite(Y).astype(np.float64)
+    Y0 = np.where(W > 0, Y, 0.0)
+    n = (weights @ W)[:, None, :]
+    _, _, r = regression_from_sums(n, np.einsum("bi,im,ik->bmk", weights, X, W), (weights @ Y0)[:, None, :],
+                                   np.einsum("bi,im,ik->bmk", weights, X ** 2, W), (weights @ Y0 ** 2)[:, None, :],
+                                   np.einsum("bi,im,ik->bmk", weights, X, Y0))
+    return r ** 2
+
+
+def significance_chunk(X: np.array, Y: np.array, permutations: np.array, weights: np.array, confidence: float):
+    '''
+        p-value di permutazione (bilaterale, su |r|) e intervallo di confidenza bootstrap di R^2
+        per un gruppo di indicatori; funzione di modulo per poter essere eseguita in un processo separato
+    '''
+    W = np.isfinite(Y).astype(np.float64)
+    Y0 = np.where(W > 0, Y, 0.0)
+    n = W.sum(axis=0)[None, :]
+    _, _, r = regression_from_sums(n, X.T @ W, Y0.sum(axis=0)[None, :], (X ** 2).T @ W,
+                                   (Y0 ** 2).sum(axis=0)[None, :], X.T @ Y0)
+
+    exceed = (np.abs(permutation_r(X, Y, permutations)) >= np.abs(r)[None, :, :] - 1e-12).sum(axis=0)
+    p_value = (exceed + 1) / (len(permutations) + 1)
+
+    r2 = bootstrap_r2(X, Y, weights)
+    alpha = (1 - confidence) / 2 * 100
+    with np.errstate(invalid="ignore"):
+        low, high = np.nanpercentile(r2, [alpha, 100 - alpha], axis=0)
+    return p_value, low, high
+
+
+def batch_significance(x: pd.DataFrame, y: pd.DataFrame, permutations: int = SIGNIFICANCE_PERMUTATIONS,
+                       bootstrap: int = SIGNIFICANCE_BOOTSTRAP, confidence: float = 0.95, seed: int = 0,
+                       processes: int = None, chunk_size: int = SIGNIFICANCE_CHUNK_SIZE) -> dict:
+    '''
+        p-value e intervallo di confidenza di R^2 per ogni coppia (colonna di x, colonna di y).
+        Permutazioni e campioni bootstrap sono estratti una volta sola (seed fisso), quindi il
+        risultato non dipende da come gli indicatori vengono divisi tra i processi.
+        Gli indicatori vengono elaborati a gruppi di chunk_size e i gruppi distribuiti su un pool
+        di processi: con processes=None solo da SIGNIFICANCE_PARALLEL_PAIRS coppie in su,
+        con processes=1 mai.
+    '''
+    X = x.values.astype(np.float64)
+    Y = y.values.astype(np.float64)
+    rng = np.random.RandomState(seed)
+    permutation_index = np.array([rng.permutation(len(X)) for _ in range(permutations)], dtype=np.intp)
+    weights = rng.multinomial(len(X), np.full(len(X), 1 / len(X)), size=bootstrap).astype(np.float64)
+
+    chunks = [chunk for chunk in np.array_split(np.arange(Y.shape[1]), max(1, math.ceil(Y.shape[1] / chunk_size))) if len(chunk)]
+    args = [(X, Y[:, chunk], permutation_index, weights, confidence) for chunk in chunks]
+    parallel = processes != 1 and (processes is not None or X.shape[1] * Y.shape[1] >= SIGNIFICANCE_PARALLEL_PAIRS)
+    if parallel and len(chunks) > 1:
+        #spawn: il server streamlit ha thread attivi e un fork potrebbe copiare lock acquisiti
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(significance_chunk, *zip(*args)))
+    else:
+        results = [significance_chunk(*x) for x in args]
+
+    if not results:
+        empty = np.empty((X.shape[1], 0))
+        return {"p_value": empty, "r2_low": empty, "r2_high": empty}
+    p_value, low, high = (np.concatenate(x, axis=1) for x in zip(*results))
+    return {"p_value": p_value, "r2_low": low, "r2_high": high}
+
+
+def correlation_table(df_regioni: pd.DataFrame, smokers: pd.DataFrame, imprese: pd.DataFrame, imprese_pro_capite: dict,
+                      significance: bool = False, **significance_args) -> pd.DataFrame:
+    '''
+        Tabella con una riga per coppia (metrica COVID, indicatore ISTAT), ordinata per R^2 decrescente.
+        Con significance=True vengono aggiunte le colonne di batch_significance (p_value, r2_low, r2_high).
+    '''
+    df_today = last_day_by_region(df_regioni)
+    x = covid_metrics(df_today)
+    x = x[np.isfinite(x.values).all(axis=1)]
+    y = istat_indicators(df_today, smokers, imprese, imprese_pro_capite).loc[x.index]
+
+    results = batch_linear_regression(x, y)
+    if significance:
+        results.update(batch_significance(x, y, **significance_args))
+    metric_index, indicator_index = np.meshgrid(np.arange(x.shape[1]), np.arange(y.shape[1]), indexing="ij")
+    table = pd.DataFrame({
+        "fonte": y.columns.get_level_values(0).values[indicator_index.ravel()],
+        "indicatore": y.columns.get_level_values(1).values[indicator_index.ravel()],
+        "metrica": x.columns.values[metric_index.ravel()],
+        **{name: values.ravel() for name, values in results.items()},
+    }, columns=CORRELATION_COLUMNS + (SIGNIFICANCE_COLUMNS if significance else []))
+    table = table[np.isfinite(table["r2"])]
+    return table.sort_values("r2", ascending=False, kind="mergesort").reset_index(drop=True)
+
+
+def regression_line(x, slope: float, intercept: float, points: int = 30):
+    '''
+        Punti della retta di regressione sull'intervallo di x, come in utils.linear_reg
+    '''
+    line_x = np.arange(x.min(), x.max(), (x.max() - x.min()) / points)
+    return line_x, line_x * slope + intercept
+
+
+def correlation_index(table: pd.DataFrame) -> dict:
+    '''
+        Risultati per coppia: (indicatore, metrica) -> dict con slope, intercept, r2 e mape
+    '''
+    return {(row["indicatore"], row["metrica"]): row for row in table.to_dict("records")}
@@ -3,9 +3,9 @@ import json
 import math
 import os
 import random
+import time
 from datetime import date, datetime, timedelta
 
-import analytics
 import geojson
 import numpy as np
 import pandas as pd
@@ -15,12 +15,38 @@ import scipy
 import streamlit as st
 
 import st_state_patch
-from utils import (calculate_line, exp_viridis, get_dataset, get_map_json,
-                   linear_reg, mean_absolute_percentage_error, pretty_colors,
-                   viridis)
-
-analytics_token = open(".analytics_token").read()
-analytics.write_key = analytics_token
+from analytics_sink import AnalyticsSink, backend_from_config, get_sink
+from area_store import AreaSeriesStore
+from correlations import COVID_METRICS, correlation_index, correlation_table, regression_line
+from figure_cache import FigureCache
+from figures import (REGIONAL_MAP_METRICS, calcolo_giorni_da_min_positivi, fig_growth_rate,
+                     fig_nuovi_casi_giornalieri, fig_rt, fig_tamponi_vs_positivi, fig_totale_casi_provincia,
+                     fig_totale_casi_regione, fig_totale_casi_su_tamponi, fig_window_metric, get_area_provincial_map,
+                     get_cached_provincial_map, get_cached_regional_map, warm_map_figures)
+from geojson_tools import level_for_zoom
+from metrics import add_window_metrics, window_metric_labels
+from rt import RT_WINDOW, add_rt, get_rt
+from refresher import DatasetRefresher, get_refresher
+from timing import timer, timing_table
+from utils import (REFRESH_INTERVAL, REFRESH_MAX_AGE, build_dataset, calculate_line,
+                   dataset_version, dpc_has_new_day, exp_viridis, get_istat_metadata,
+                   get_map_json, get_region_geometry_index, linear_reg, mean_absolute_percentage_error,
+                   pretty_colors, viridis)
+from versioned_cache import versioned_cache
+
+rerun_start = time.perf_counter()
+timer.begin_run()
+
+FIGURE_CACHE_DIR = os.environ.get("COVID_FIGURE_CACHE", "figure_cache")
+
+#gli eventi vengono messi in coda e inviati a blocchi da un thread, senza bloccare il rerun
+ANALYTICS_BACKEND = os.environ.get("COVID_ANALYTICS_BACKEND", "segment")
+ANALYTICS_QUEUE_SIZE = int(os.environ.get("COVID_ANALYTICS_QUEUE_SIZE", 10000))
+ANALYTICS_DROP_POLICY = os.environ.get("COVID_ANALYTICS_DROP_POLICY", "oldest")
+
+analytics = get_sink("analytics", lambda: AnalyticsSink(backend_from_config(ANALYTICS_BACKEND),
+                                                        max_queue=ANALYTICS_QUEUE_SIZE,
+                                                        drop_policy=ANALYTICS_DROP_POLICY))
 
 session_state = st.SessionState()
 if not session_state:
@@ -78,144 +104,79 @@ st.markdown(styling, unsafe_allow_html=True)
 st.write('<style>div.Widget.row-widget.stRadio > div{flex-direction:row;}</style>', unsafe_allow_html=True)
 
 
-@st.cache(show_spinner=False)
-def get_areas(df):
+@versioned_cache(max_entries=2, ignore=("df",))
+def get_areas(version, df):
     regions = df["denominazione_regione"].unique()
     provinces = df["denominazione_provincia"].unique()
     return regions,provinces
 
-def calcolo_giorni_da_min_positivi(df_regioni, min_positivi=100):
-    regione_piu_colpita = df_regioni[df_regioni["data"] == df_regioni["data"].max()][df_regioni["totale_casi"] == df_regioni["totale_casi"].max()]["denominazione_regione"].tolist()[0]
-    temp = df_regioni[df_regioni["totale_casi"] > min_positivi]
-    temp = temp[temp["denominazione_regione"] == regione_piu_colpita]
-    return len(temp['data'].tolist())
-
-@st.cache(suppress_st_warning=True,show_spinner=False)
-def get_regional_map(df_regioni,regions_map_json,cmap,data_selected,data_selected_label):
-    fig = px.choropleth_mapbox(
-                            data_frame=df_regioni, 
-                            geojson=regions_map_json, 
-                            locations='codice_regione', 
-                            featureidkey='properties.reg_istat_code_num',
-                            color=data_selected,
-                            color_continuous_scale=cmap,
-                            range_color=(0, math.ceil(df_regioni[data_selected].max()+1)),
-                            hover_data=["increased_cases", "increased_tamponi",data_selected],
-                            mapbox_style="carto-positron",
-                            zoom=4, center = {"lat": 42.00107394, "lon": 10.3283498},
-                            #opacity=1,
-                            animation_frame="giorno",
-                            labels={ data_selected:data_selected_label, 
-                                    "giorno":"Giorno",
-                                    'data': 'Data', "growth_rate": "Growth Rate", 
-                                    "increased_cases": "Nuovi Casi",
-                                    "increased_tamponi":"Nuovi Tamponi Effettuati",
-                                    "codice_regione":"Codice Regione"},
-                            height=600,
-                          )
-    return fig
-@st.cache(suppress_st_warning=True,show_spinner=False)
-def get_provincial_map(df_province,province_map_json,cmap):
-    fig = px.choropleth_mapbox(
-                            data_frame=df_province, 
-                            geojson=province_map_json, 
-                            locations='sigla_provincia', 
-                            featureidkey='properties.prov_acr',
-                            color='totale_casi',
-                            color_continuous_scale=cmap,
-                            range_color=(0, math.ceil(df_province['totale_casi'].max()+1)),
-                            hover_data=["growth_rate","increased_cases"],
-                            mapbox_style="carto-positron",
-                            zoom=4, center = {"lat": 42.00107394, "lon": 10.3283498},
-                            #opacity=1,
-                            animation_frame="giorno",
-                            labels={"giorno":"Giorno",
-                                    "totale_casi":"Totale Casi",
-                                    'data': 'Data', "growth_rate": "Growth Rate", 
-                                    "increased_cases": "Nuovi Casi",
-                                    "increased_tamponi":"Nuovi Tamponi Effettuati",
-                                    "sigla_provincia":"Sigla Provincia"},
-                            height=600,
-                          )
-    return fig
-
-@st.cache(allow_output_mutation=True,show_spinner=False)
-def fig_tamponi_vs_positivi(filtered_data):
-    fig = go.Figure()
-    fig.add_trace(go.Scatter(x=filtered_data["data"], 
-                            y=filtered_data["totale_casi"], 
-                            fill='tozeroy',
-                            #mode='lines+markers',
-                            name="Totale Casi Positivi",
-                            hovertemplate = "<b>%{x}</b><br><b>Totale casi positivi: %{y}</b><br><b>Percentuale tamponi per casi positivi: %{text:.2f}%</b><extra></extra>",
-                            text=filtered_data["totale_casi/tamponi"] * 100
-                            ))
-    fig.add_trace(go.Scatter(x=filtered_data["data"], 
-                            y=filtered_data["tamponi"], 
-                            fill='tonexty',
-                            #mode='lines+markers',
-                            name="Totale Tamponi",
-                            hovertemplate = "<b>%{x}</b><br><b>Totale tamponi effettuati: %{y}</b><extra></extra>",
-                            text=filtered_data["totale_casi/tamponi"] * 100
-                            ))
-    fig.update_layout(
-        title_text='Totale Tamponi comparato con Totale Casi Positivi'
-    )
-    return fig
-
-@st.cache(allow_output_mutation=True,show_spinner=False)
-def fig_totale_casi_regione(filtered_data,log_y):
-    fig = px.line(  data_frame=filtered_data,x="data",
-                    y="totale_casi",
-                    hover_data=["increased_cases"],
-                    log_y=log_y,
-                    color='denominazione_regione',
-                    title="Totale Casi per giorno", 
-                    labels={'totale_casi':'Casi confermati', 'data': 'Data', 'denominazione_regione': 'Regione'})
-    return fig.update_traces(mode='lines+markers')
-
-@st.cache(allow_output_mutation=True,show_spinner=False)
-def fig_totale_casi_provincia(filtered_data,log_y):
-    fig = px.line(  data_frame=filtered_data,
-                    x="data",
-                    y="totale_casi",
-                    log_y=log_y,
-                    hover_data=["increased_cases"],
-                    color='denominazione_provincia',
-                    title="Totale Casi per giorno", 
-                    labels={'totale_casi':'Casi confermati', 'data': 'Data', 'denominazione_provincia': 'Provincia'})
-    return fig.update_traces(mode='lines+markers')
-
-
-@st.cache(allow_output_mutation=True,show_spinner=False)
-def fig_totale_casi_su_tamponi(filtered_data):
-    fig = go.Figure()
-           
-    for region_name in filtered_data['denominazione_regione'].unique():
-        region = df_regioni[df_regioni["denominazione_regione"].isin([region_name])].reset_index()
-        fig.add_trace(go.Scatter(x=region["data"], 
-                                y=region["totale_casi/tamponi"]*100,
-                                #mode='lines+markers',
-                                name=region_name,
-                                line_shape='vh',
-                                fill='tozeroy',
-                                hovertemplate = "<b>%{x}</b><br><b>Percentuale tamponi per casi positivi: %{text:.2f}%</b><extra></extra>",
-                                text=region["totale_casi/tamponi"]*100))
-    fig.update_layout(
-        title_text='Rapporto del Totale Casi Positivi sul Totale Tamponi'
-    )
-    return fig
-
-@st.cache(allow_output_mutation=True,show_spinner=False)
-def fig_nuovi_casi_giornalieri(filtered_data):
-    fig = px.line(
-        data_frame=filtered_data,
-        x="data",
-        y="increased_cases",
-        color='denominazione_provincia',
-        title="Nuovi Casi al giorno", 
-        labels={'increased_cases':'Incremento Casi', 'data': 'Data', 'denominazione_provincia': 'Provincia'})
-    return fig.update_traces(mode='lines+markers')
+@versioned_cache(max_entries=2, ignore=("df", "df_regioni"))
+def get_area_stores(version, df, df_regioni):
+    #serie per provincia (raggruppate per regione) e per regione, con Rt, per selezioni senza scansioni del frame;
+    #le province hanno anche le metriche sulle finestre mobili del loro grafico
+    df_province = add_window_metrics(version, df, "denominazione_provincia")
+    return (AreaSeriesStore(add_rt(version, df_province, "denominazione_provincia"), "denominazione_provincia", group_column="denominazione_regione"),
+            AreaSeriesStore(add_rt(version, df_regioni, "denominazione_regione"), "denominazione_regione"))
+
+@versioned_cache(max_entries=2, ignore=("df_regioni",))
+def get_regional_metrics(version, df_regioni):
+    #regioni con le metriche sulle finestre mobili e Rt selezionabili nella mappa
+    return add_rt(version, add_window_metrics(version, df_regioni, "denominazione_regione"), "denominazione_regione")
+
+@versioned_cache(max_entries=1)
+def get_figure_cache():
+    return FigureCache(FIGURE_CACHE_DIR)
+
+def plotly_chart(fig):
+    #serializzazione della figura e invio al browser
+    with timer.stage("st.plotly_chart", figure=fig.layout.title.text):
+        st.plotly_chart(fig,use_container_width=True)
+
+def build_dataset_run(current_date):
+    #ogni costruzione in background ha il suo run, così il pannello dei tempi mostra solo l'ultima
+    timer.begin_run()
+    data = build_dataset(current_date)
+    #Rt di regioni e province e correlazioni ISTAT (con p-value e intervalli bootstrap) calcolati una
+    #volta per aggiornamento, fuori dai rerun: la versione è la stessa dello snapshot che verrà pubblicato
+    version = dataset_version(data[0], data[1])
+    get_rt(version, "denominazione_provincia", data[0])
+    get_rt(version, "denominazione_regione", data[1])
+    get_correlations(version, data[1], data[2], data[3])
+    return data
+
+def warm_snapshot_figures(snapshot):
+    #le mappe nazionali di ogni nuova versione dei dati vengono costruite dal thread del refresher, non dai rerun
+    df, df_regioni, _, _ = snapshot.data
+    province_map_json, regions_map_json = get_map_json()
+    warm_map_figures(get_figure_cache(), snapshot.version, df, get_regional_metrics(snapshot.version, df_regioni),
+                     province_map_json, regions_map_json, [viridis, exp_viridis(calcolo_giorni_da_min_positivi(df_regioni))])
+
+def create_dataset_refresher():
+    return DatasetRefresher(build=build_dataset_run, version=lambda data: dataset_version(data[0], data[1]),
+                            has_new_data=dpc_has_new_day, interval=REFRESH_INTERVAL, max_age=REFRESH_MAX_AGE,
+                            on_refresh=warm_snapshot_figures)
+
+def refresh_status_html(status):
+    text = f"Dati aggiornati il {status['last_refresh']:%d/%m alle %H:%M} ({status['last_duration']:.0f} s)"
+    if status["last_error_at"] is not None and status["last_error_at"] > status["last_refresh"]:
+        text += f"<br>Ultimo aggiornamento non riuscito il {status['last_error_at']:%d/%m alle %H:%M}"
+    return f"<p class='smallText'>{text}</p>"
+
+@versioned_cache(max_entries=2, ignore=("df_regioni", "smokers_series", "imprese_series"))
+def get_correlations(version, df_regioni, smokers_series, imprese_series):
+    #regressioni di tutti gli indicatori ISTAT contro tutte le metriche COVID, una volta per versione dei dati
+    procapite_data = get_istat_metadata("DICA_ASIAUE1P_02042020145705482")["data_type_pro_capite"]
+    table = correlation_table(df_regioni, smokers_series, imprese_series, procapite_data, significance=True)
+    return table, correlation_index(table)
+
+def regression_from_table(correlations, indicator, metric, x, y):
+    #linear_reg solo per le coppie che non sono in tabella (regressione non definita)
+    pair = correlations.get((indicator, metric))
+    if pair is None:
+        return linear_reg(x, y) + ("",)
+    line_x, line_y = regression_line(x, pair["slope"], pair["intercept"])
+    significance = f"<br><b>p-value</b> : {pair['p_value']:.3f} <br><b>IC 95% R^2</b> : {pair['r2_low']*100:.1f}% - {pair['r2_high']*100:.1f}%"
+    return line_x, line_y, math.sqrt(pair["r2"]), pair["mape"], significance
 
 mapbox_token = open(".mapbox_token").read()
 px.set_mapbox_access_token(mapbox_token)
@@ -239,10 +200,22 @@ st.sidebar.markdown("<hr/>",unsafe_allow_html=True)
 st.markdown(logo_html, unsafe_allow_html=True)
 st.markdown(subtitle_html, unsafe_allow_html=True)
         
-df, df_regioni, smokers_series, imprese_series = get_dataset(date.today())
+#i dati vengono ricostruiti da un thread in background: il rerun legge l'ultimo snapshot completo
+dataset_refresher = get_refresher("dataset", create_dataset_refresher)
+with timer.stage("dataset_snapshot"):
+    snapshot = dataset_refresher.snapshot()
+df, df_regioni, smokers_series, imprese_series = snapshot.data
+
+DATASET_VERSION = snapshot.version
+st.sidebar.markdown(refresh_status_html(dataset_refresher.status()), unsafe_allow_html=True)
 
 province_map_json,regions_map_json = get_map_json()
-regions,provinces = get_areas(df)
+regions,provinces = get_areas(DATASET_VERSION, df)
+province_store, region_store = get_area_stores(DATASET_VERSION, df, df_regioni)
+df_regioni_metriche = get_regional_metrics(DATASET_VERSION, df_regioni)
+
+#le mappe nazionali di questa versione sono preparate dal refresher (warm_snapshot_figures)
+figure_cache = get_figure_cache()
 
 #area_filter = st.sidebar.selectbox("Seleziona il raggio di interesse",["Nazione","Regione","Provincia"])
 area_filter = st.sidebar.radio("Seleziona il raggio di interesse",["Nazione","Regione","Provincia"])
@@ -276,33 +249,33 @@ if area_filter == "Nazione":
     st.sidebar.markdown("**Incrocia i Dati ISTAT con i dati del Ministero della Salute**")
     fumatori_switch = st.sidebar.checkbox("Fumatori",False)
     imprese_switch = st.sidebar.checkbox("Imprese",False)
-    ISTAT_switches = [fumatori_switch,imprese_switch]
-    ISTAT_switches_labels = ["Fumatori","Imprese"]
+    correlazioni_switch = st.sidebar.checkbox("Indicatori più correlati",False)
+    ISTAT_switches = [fumatori_switch,imprese_switch,correlazioni_switch]
+    ISTAT_switches_labels = ["Fumatori","Imprese","Indicatori più correlati"]
     df_province = df
 
-    nation_view = st.radio("Vista per ", ("Regioni", "Province"))
+    nation_view = st.radio("Vista per ", ("Regioni", "Province", "Regioni (animazione compatta)", "Province (animazione compatta)"))
+    #nella vista compatta la geometria viene inviata una volta sola e i frame contengono solo i valori
+    compact_map = nation_view.endswith("(animazione compatta)")
 
-    if nation_view == "Regioni":
+    if nation_view.startswith("Regioni"):
         def format_func_select(input_option):
-            data = {'totale_casi':'Casi Confermati', 'data': 'Data',"terapia_intensiva": "Ricoverati in terapia intensiva",
-            "totale_ospedalizzati": "Totale ospedalizzati", "isolamento_domiciliare": "Persone in isolamento domiciliare", "totale_positivi": "Totale attualmente positivi (ospedalizzati + isolamento domiciliare)", 
-            "dimessi_guariti": "Persone dimesse guarite", "deceduti": "Persone decedute", "tamponi": "Totale tamponi effettuati"}
-            return data[input_option]
+            return REGIONAL_MAP_METRICS[input_option]
 
 
-        data_selected = st.selectbox("Seleziona il dato da visualizzare",["totale_casi","terapia_intensiva","totale_ospedalizzati", "isolamento_domiciliare", "totale_positivi", "dimessi_guariti", "deceduti", "tamponi"], format_func=format_func_select)
+        data_selected = st.selectbox("Seleziona il dato da visualizzare",list(REGIONAL_MAP_METRICS), format_func=format_func_select)
         
         if data_selected != "totale_casi":
             analytics.track(USER_UNIQUE_ID, format_func_select(data_selected), {
                     'category':'Map Data Category',
                 })
-        fig = get_regional_map(df_regioni,regions_map_json,cmap,data_selected,format_func_select(data_selected))
+        fig = get_cached_regional_map(figure_cache,DATASET_VERSION,df_regioni_metriche,regions_map_json,cmap,data_selected,compact_map)
     else:
         analytics.track(USER_UNIQUE_ID, "Provincie", {
                     'category':'Map Data Category',
                 })
-        fig = get_provincial_map(df_province,province_map_json,cmap)
-    st.plotly_chart(fig,use_container_width=True)
+        fig = get_cached_provincial_map(figure_cache,DATASET_VERSION,df_province,province_map_json,cmap,compact_map)
+    plotly_chart(fig)
 
     if True in ISTAT_switches:
         st.markdown("---")
@@ -314,7 +287,7 @@ if area_filter == "Nazione":
         Ad ogni distribuzione di punti corrisponde una linea che ne approssima l'andamento per facilitarne la lettura.\n
         Muovendo il mouse su questa linea è possibile visualizzare **quanto si distacca l'approssimazione dai dati reali** ([*MAPE*](https://it.qwe.wiki/wiki/Mean_absolute_percentage_error)) e **quanto gli indicatori sono correlati ai dati di diffusione del COVID-19** ([*R^2*](https://it.wikipedia.org/wiki/Coefficiente_di_determinazione))
         """)
-        
+        correlations_table, correlations = get_correlations(DATASET_VERSION, df_regioni, smokers_series, imprese_series)
 
     if fumatori_switch:
 
@@ -341,13 +314,14 @@ if area_filter == "Nazione":
                                 
         for idx, column in enumerate(selected_columns):
 
-            line_x, line_y, r_value, mape = linear_reg(df_regioni_today["deceduti"]/df_regioni_today["totale_casi"], df_regioni_today[column])
+            line_x, line_y, r_value, mape, significance = regression_from_table(correlations, column, "Deceduti per casi confermati",
+                                                                  df_regioni_today["deceduti"]/df_regioni_today["totale_casi"], df_regioni_today[column])
 
             fig.add_trace(go.Scatter(
                                 x=line_x,
                                 y=line_y,
                                 mode='lines',
-                                hovertemplate = f"<b>R^2</b> : {str(round((r_value**2)*100, 2))}% <br><b>MAPE</b> : {str(round(mape, 2))}%  <extra></extra>",
+                                hovertemplate = f"<b>R^2</b> : {str(round((r_value**2)*100, 2))}% <br><b>MAPE</b> : {str(round(mape, 2))}%{significance}  <extra></extra>",
                                 legendgroup=column,
                                 showlegend =False,
                                 marker=go.scatter.Marker(color=pretty_colors[idx]))
@@ -369,7 +343,7 @@ if area_filter == "Nazione":
             )
         fig.update_xaxes(title_text='% popolazione deceduta per casi confermati')
         fig.update_yaxes(title_text='Metrica selezionata')
-        st.plotly_chart(fig,use_container_width=True)
+        plotly_chart(fig)
     
     if imprese_switch:
 
@@ -384,10 +358,8 @@ if area_filter == "Nazione":
 
         df_regioni_today = df_regioni_today.join(imprese_series)
 
-        with open(os.path.join("ISTAT_DATA","Imprese_metadata.json"), encoding="utf-8") as json_file:
-            json_dict = json.load(json_file)
-        with open(os.path.join("ISTAT_DATA","DICA_ASIAUE1P_02042020145705482_metadata.json")) as json_file:
-            procapite_data = json.load(json_file)["data_type_pro_capite"]
+        json_dict = get_istat_metadata("Imprese")
+        procapite_data = get_istat_metadata("DICA_ASIAUE1P_02042020145705482")["data_type_pro_capite"]
 
         scelta_dati_imprese = list(json_dict.keys())
         
@@ -418,13 +390,14 @@ if area_filter == "Nazione":
             else:
                 y = df_regioni_today[f"{selected_data_type}_{selected_column}_{segment}"]
 
-            line_x, line_y, r_value, mape = linear_reg(df_regioni_today["totale_casi"]/df_regioni_today["Popolazione_Sesso_totale"], y)
+            line_x, line_y, r_value, mape, significance = regression_from_table(correlations, f"{selected_data_type}_{selected_column}_{segment}", "Casi confermati pro capite",
+                                                                  df_regioni_today["totale_casi"]/df_regioni_today["Popolazione_Sesso_totale"], y)
 
             fig.add_trace(go.Scatter(
                                 x=100*line_x,
                                 y=line_y,
                                 mode='lines',
-                                hovertemplate = f"<b>R^2</b> : {str(round((r_value**2)*100, 2))}% <br><b>MAPE</b> : {str(round(mape, 2))}%  <extra></extra>",
+                                hovertemplate = f"<b>R^2</b> : {str(round((r_value**2)*100, 2))}% <br><b>MAPE</b> : {str(round(mape, 2))}%{significance}  <extra></extra>",
                                 legendgroup=segment,
                                 showlegend=False,
                                 marker=go.scatter.Marker(color=pretty_colors[idx]),
@@ -447,8 +420,35 @@ if area_filter == "Nazione":
             )
         fig.update_xaxes(title_text='% di popolazione contagiata')
         fig.update_yaxes(title_text=f"{selected_data_type} {pro_capite_text}")
-        st.plotly_chart(fig,use_container_width=True)
+        plotly_chart(fig)
     
+    if correlazioni_switch:
+
+        st.markdown("---")
+        st.markdown("### Indicatori ISTAT più correlati")
+        analytics.track(USER_UNIQUE_ID, "Indicatori più correlati", {
+                'category':'ISTAT Selected',
+            })
+
+        metrica = st.selectbox("Scegli la metrica COVID", ["Tutte"] + list(COVID_METRICS))
+        fonti = st.multiselect("Scegli le fonti ISTAT", ["Fumatori","Imprese","Popolazione"], default=["Fumatori","Imprese","Popolazione"])
+        top_n = st.slider("Numero di indicatori", min_value=5, max_value=50, value=15)
+
+        top = correlations_table[correlations_table["fonte"].isin(fonti)]
+        if metrica != "Tutte":
+            top = top[top["metrica"] == metrica]
+        top = top.head(top_n)
+        st.table(pd.DataFrame({
+            "Fonte": top["fonte"].values,
+            "Indicatore": [x.split("_")[-1] if fonte != "Imprese" else " | ".join(x.split("_")) for x, fonte in zip(top["indicatore"], top["fonte"])],
+            "Metrica COVID": top["metrica"].values,
+            "R^2 (%)": (top["r2"]*100).round(2).values,
+            "MAPE (%)": top["mape"].round(2).values,
+            "p-value": top["p_value"].round(3).values,
+            "IC 95% R^2 (%)": [f"{low*100:.1f} - {high*100:.1f}" for low, high in zip(top["r2_low"], top["r2_high"])],
+        }))
+        st.markdown("<p class='smallText'>p-value: frequenza con cui permutando a caso le regioni si ottiene una correlazione almeno altrettanto forte. IC 95%: intervallo bootstrap di R^2.</p>",unsafe_allow_html=True)
+
     ####### Correlation Analysis #########
     #smokers_series = ISTAT_return_filtered_series(df_istat_smokers,selected_column="Tipo dato")
         
@@ -483,7 +483,7 @@ elif area_filter == "Regione":
 
     st.sidebar.markdown("<p class='smallText marginTop'>Per un approfondimento sull'utilizzo di scale esponenziali per visualizzare l'andamento del virus clicca <a target='_blank' href=https://www.neodemos.info/articoli/la-curva-dei-contagiati-da-covid-19-la-ricerca-del-punto-di-svolta/>qui</a></p>",unsafe_allow_html=True)
 
-    regional_data = df_regioni[df_regioni["denominazione_regione"].isin(region_name)].reset_index()
+    regional_data = region_store.select(region_name)
     
     if region_name:
         for region in region_name:
@@ -495,37 +495,16 @@ elif area_filter == "Regione":
                     'category':'Regions combined'
                 })
 
-    filtered_province_data = df[df["denominazione_regione"].isin(region_name)]
+    filtered_province_data = province_store.select_groups(region_name)
 
     if not filtered_province_data.empty:
 
         st.markdown("### Mappa totale casi COVID19 confermati")
 
-        lat_sum = 0
-        lon_sum = 0
-        lats = regional_data.lat.unique()
-        lons = regional_data.long.unique()
-
-        for idx in range(len(lats)):
-            lat_sum+=lats[idx]
-            lon_sum+=lons[idx]
-
-        lat_sum/=len(lats)
-        lon_sum/=len(lons)
-
-        lat_max = regional_data.lat.max()
-        lat_min = regional_data.lat.min()
-        lon_max = regional_data.long.max()
-        lon_min = regional_data.long.min()
-
-        if (lat_max-lat_min)>6 or (lon_max-lon_min)>7:
-            
-            #@TODO FIX ZOOM
-            
-            zoom = 6
-
-        else:
-            zoom = 6
+        #solo le province delle regioni selezionate, con centro e zoom calcolati sul loro bounding box
+        region_codes = regional_data["codice_regione"].unique()
+        center, zoom = get_region_geometry_index("high").center_zoom(region_codes)
+        region_map_json = get_region_geometry_index(level_for_zoom(zoom)).feature_collection(region_codes)
 
         if cmap_radio == "Lineare":
             cmap = viridis
@@ -537,28 +516,8 @@ elif area_filter == "Regione":
                 'category':'Values_Scale',
             })
 
-        fig = px.choropleth_mapbox(
-                            data_frame=filtered_province_data, 
-                            geojson=province_map_json, 
-                            locations='sigla_provincia', 
-                            featureidkey='properties.prov_acr',
-                            color='totale_casi',
-                            color_continuous_scale=cmap,
-                            range_color=(0, math.ceil(filtered_province_data['totale_casi'].max()+1)),
-                            hover_data=["increased_cases"],
-                            mapbox_style="carto-positron",
-                            zoom=zoom, center = {"lat": lat_sum, "lon": lon_sum},
-                            #opacity=1,
-                            animation_frame="giorno",
-                            labels={"giorno":"Giorno",
-                                    "totale_casi":"Totale Casi",
-                                    'data': 'Data', "growth_rate": "Growth Rate", 
-                                    "increased_cases": "Nuovi Casi",
-                                    "increased_tamponi":"Nuovi Tamponi Effettuati",
-                                    "sigla_provincia":"Sigla Provincia"},
-                            height=600,
-                          )
-        st.plotly_chart(fig,use_container_width=True)
+        fig = get_area_provincial_map(filtered_province_data, region_map_json, cmap, center, zoom)
+        plotly_chart(fig)
 
         filtered_data = regional_data
 
@@ -568,31 +527,33 @@ elif area_filter == "Regione":
         Il grafico sottostante mostra il tasso di crescita dei casi positivi [(growth rate)](https://www.complexityeducation.com/2020/03/10/crescita-esponenziale-ed-epidemie/). \nValori inferiori ad 1 indicano che i contagi [non avvengono più su una curva esponenziale ma su una logaritmica](https://www.neodemos.info/articoli/la-curva-dei-contagiati-da-covid-19-la-ricerca-del-punto-di-svolta/), stanno quindi aumentando più lentamente ogni giorno.\n
         """)
         
-        fig = px.line(data_frame=filtered_data[filtered_data["data"] > datetime(2020,3,4)],x="data",
-                    y="smooth_growth_rate",
-                    hover_data=["increased_cases","denominazione_regione"],
-                    log_y=False,
-                    color='denominazione_regione',
-                    title="Growth rate media ultimi 3gg", 
-                    labels={'increased_cases':'Nuovi casi positivi', 'data': 'Data', 'denominazione_regione': 'Regione',"smooth_growth_rate":"Growth Rate"})
-        fig.update_traces(mode='lines+markers',hovertemplate = "<b>Growth Rate: %{y}</b><extra></extra>")
-        st.plotly_chart(fig,use_container_width=True)
+        fig = fig_growth_rate(DATASET_VERSION, region_name, filtered_data)
+        plotly_chart(fig)
+
+        st.markdown("---")
+
+        st.markdown(f"""
+        Il numero di riproduzione Rt è il numero medio di persone contagiate da ogni caso, stimato dai nuovi casi giornalieri con il [metodo di Cori et al.](https://doi.org/10.1093/aje/kwt133) su finestre di {RT_WINDOW} giorni. \nValori inferiori ad 1 indicano che l'epidemia si sta riducendo; la banda colorata è l'intervallo di credibilità al 95%.
+        """)
+
+        fig = fig_rt(DATASET_VERSION, region_name, filtered_data, "denominazione_regione")
+        plotly_chart(fig)
 
         st.markdown("---")
 
         if len(filtered_data['denominazione_regione'].unique() ) == 1:
-            fig = fig_tamponi_vs_positivi(filtered_data)
-            st.plotly_chart(fig,use_container_width=True)
+            fig = fig_tamponi_vs_positivi(DATASET_VERSION, region_name, filtered_data)
+            plotly_chart(fig)
         
         else:
             
-            fig = fig_totale_casi_regione(filtered_data,cmap_radio=="Esponenziale")
+            fig = fig_totale_casi_regione(DATASET_VERSION, region_name, filtered_data,cmap_radio=="Esponenziale")
 
-            st.plotly_chart(fig,use_container_width=True)
+            plotly_chart(fig)
             st.markdown("---")
 
-            fig = fig_totale_casi_su_tamponi(filtered_data)
-            st.plotly_chart(fig,use_container_width=True)
+            fig = fig_totale_casi_su_tamponi(DATASET_VERSION, region_name, region_store)
+            plotly_chart(fig)
 
     else:
         st.markdown("--- \n ### Seleziona una o più Regioni")
@@ -621,17 +582,22 @@ elif area_filter == "Provincia":
                 })
         
 
-    _filter = df["denominazione_provincia"].isin(province_name)
-
-    filtered_data = df[_filter]
+    filtered_data = province_store.select(province_name)
     if not filtered_data.empty:
         log_y = st.sidebar.radio("Scegli andamento asse y", (False, True), format_func=lambda x:"Esponenziale" if x else "Lineare",index=1)
         st.sidebar.markdown("<p class='smallText marginTop'>Per un approfondimento sull'utilizzo di scale esponenziali per visualizzare l'andamento del virus clicca <a target='_blank' href=https://www.neodemos.info/articoli/la-curva-dei-contagiati-da-covid-19-la-ricerca-del-punto-di-svolta/>qui</a></p>",unsafe_allow_html=True)
         
-        fig = fig_totale_casi_provincia(filtered_data,log_y)
-        st.plotly_chart(fig,use_container_width=True)
-        fig = fig_nuovi_casi_giornalieri(filtered_data)
-        st.plotly_chart(fig,use_container_width=True)
+        fig = fig_totale_casi_provincia(DATASET_VERSION, province_name, filtered_data,log_y)
+        plotly_chart(fig)
+        fig = fig_nuovi_casi_giornalieri(DATASET_VERSION, province_name, filtered_data)
+        plotly_chart(fig)
+        fig = fig_rt(DATASET_VERSION, province_name, filtered_data, "denominazione_provincia")
+        plotly_chart(fig)
+
+        window_metrics = window_metric_labels()
+        window_metric = st.selectbox("Seleziona la metrica su finestra mobile", list(window_metrics), format_func=window_metrics.get)
+        fig = fig_window_metric(DATASET_VERSION, province_name, filtered_data, "denominazione_provincia", window_metric)
+        plotly_chart(fig)
     else:
         st.markdown("--- \n ### Seleziona una provincia")
 
@@ -644,3 +610,13 @@ st.markdown("""
     <p>Puoi trovare il nostro source code su <a target='_blank' href='http://github.com/neurality/covid19'>Github</a></p>
     </div>
 """,unsafe_allow_html=True)
+
+if timer.enabled:
+    timer.record("rerun", time.perf_counter() - rerun_start)
+    if st.sidebar.checkbox("Mostra tempi di esecuzione", False):
+        st.sidebar.markdown("**Tempi di questo rerun**")
+        st.sidebar.table(timing_table(timer.records(run=timer.current_run())))
+        refresh_records = timer.records(thread="dataset-refresher")
+        if refresh_records:
+            st.sidebar.markdown("**Ultima costruzione del dataset**")
+            st.sidebar.table(timing_table([x for x in refresh_records if x["run"] == refresh_records[-1]["run"]]))
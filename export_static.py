@@ -0,0 +1,316 @@
+"""Esportazione statica di mappe e grafici, senza passare dal server streamlit.
+
+Ogni vista standard dell'app (le mappe nazionali per ogni metrica e color map, la mappa
+e i grafici di ogni regione, i grafici di ogni provincia) viene salvata in HTML e in JSON
+plotly in una cartella che si può servire con un qualsiasi web server statico, insieme
+a index.html e a una sola copia di plotly.min.js. Le viste sono costruite in parallelo
+su un pool di processi.
+
+Con --incremental vengono ricostruite solo le viste il cui input è cambiato rispetto
+all'esportazione precedente: per ogni vista manifest.json contiene l'hash delle righe
+dei dati che usa, dei suoi parametri, del codice delle figure e dei GeoJSON.
+
+Uso (dalla root del repository):
+
+    python export_static.py --output static --processes 4 --incremental
+"""
+
+import argparse
+import glob
+import hashlib
+import html
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import pandas as pd
+from plotly.offline import get_plotlyjs
+
+from area_store import AreaSeriesStore
+from figures import (REGIONAL_MAP_METRICS, build_provincial_map, build_regional_map,
+                     calcolo_giorni_da_min_positivi, fig_growth_rate, fig_nuovi_casi_giornalieri,
+                     fig_rt, fig_tamponi_vs_positivi, fig_totale_casi_provincia, fig_window_metric,
+                     get_area_provincial_map)
+from geojson_tools import GEOJSON_DIR, level_for_zoom
+from metrics import add_window_metrics, window_metric_labels
+from rt import get_rt
+from utils import dataset_version, exp_viridis, get_dataset, get_map_json, get_region_geometry_index, viridis
+
+MANIFEST_FILE = "manifest.json"
+PLOTLYJS_FILE = "plotly.min.js"
+
+#le stesse scelte di color map e asse y offerte dall'app
+COLOR_SCALES = ("lineare", "esponenziale")
+
+#righe dei casi non ancora attribuiti a una provincia: non sono un'area da esportare
+UNASSIGNED_PROVINCE = "In fase di definizione/aggiornamento"
+
+#se cambia il codice che costruisce le figure (o i confini) tutte le viste vanno ricostruite
+CODE_FILES = ("figures.py", "export_static.py", "metrics.py", "rt.py", "utils.py")
+
+#dati e store del processo, preparati una volta per processo da init_context
+_context = {}
+
+
+def slugify(name: str) -> str:
+    name = unicodedata.normalize("NFKD", str(name)).encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+
+def init_context(df, df_regioni, rt_province=None, rt_regioni=None):
+    #Rt viene calcolato dal processo principale (eventualmente con il suo pool) e passato ai worker
+    version = dataset_version(df, df_regioni)
+    if rt_province is None:
+        rt_province = get_rt(version, "denominazione_provincia", df)
+    if rt_regioni is None:
+        rt_regioni = get_rt(version, "denominazione_regione", df_regioni)
+    _context.clear()
+    _context.update({
+        "version": version,
+        "df": df,
+        "df_regioni": df_regioni,
+        "rt_province": rt_province,
+        "rt_regioni": rt_regioni,
+        "df_regioni_metriche": pd.concat([add_window_metrics(version, df_regioni, "denominazione_regione"), rt_regioni], axis=1),
+        "province_store": AreaSeriesStore(pd.concat([add_window_metrics(version, df, "denominazione_provincia"), rt_province], axis=1),
+                                          "denominazione_provincia", group_column="denominazione_regione"),
+        "region_store": AreaSeriesStore(pd.concat([df_regioni, rt_regioni], axis=1), "denominazione_regione"),
+    })
+
+
+def list_views(df, df_regioni) -> list:
+    '''
+        Tutte le viste da esportare: dict con name (nome dei file), section, title, kind e args
+    '''
+    views = []
+    for cmap in COLOR_SCALES:
+        for compact in (False, True):
+            suffix = "-compatta" if compact else ""
+            title_suffix = " (animazione compatta)" if compact else ""
+            for metric, label in REGIONAL_MAP_METRICS.items():
+                views.append({"name": f"nazione-regioni-{slugify(metric)}-{cmap}{suffix}", "section": "Nazione",
+                              "title": f"Regioni - {label} - scala {cmap}{title_suffix}",
+                              "kind": "regional_map", "args": {"metric": metric, "cmap": cmap, "compact": compact}})
+            views.append({"name": f"nazione-province-{cmap}{suffix}", "section": "Nazione",
+                          "title": f"Province - Casi Confermati - scala {cmap}{title_suffix}",
+                          "kind": "provincial_map", "args": {"cmap": cmap, "compact": compact}})
+
+    provinces_by_region = df.groupby("denominazione_regione", observed=True)["denominazione_provincia"].unique()
+    for region in sorted(df_regioni["denominazione_regione"].unique()):
+        slug = slugify(region)
+        if region in provinces_by_region.index:
+            for cmap in COLOR_SCALES:
+                views.append({"name": f"regione-{slug}-mappa-{cmap}", "section": "Regioni",
+                              "title": f"{region} - Mappa totale casi - scala {cmap}",
+                              "kind": "region_map", "args": {"region": region, "cmap": cmap}})
+        views.append({"name": f"regione-{slug}-growth-rate", "section": "Regioni", "title": f"{region} - Growth rate",
+                      "kind": "region_growth_rate", "args": {"region": region}})
+        views.append({"name": f"regione-{slug}-tamponi", "section": "Regioni",
+                      "title": f"{region} - Tamponi e casi positivi", "kind": "region_tamponi", "args": {"region": region}})
+        views.append({"name": f"regione-{slug}-rt", "section": "Regioni", "title": f"{region} - Rt",
+                      "kind": "region_rt", "args": {"region": region}})
+
+    for province in sorted(df["denominazione_provincia"].unique()):
+        if province == UNASSIGNED_PROVINCE:
+            continue
+        slug = slugify(province)
+        for cmap in COLOR_SCALES:
+            views.append({"name": f"provincia-{slug}-totale-casi-{cmap}", "section": "Province",
+                          "title": f"{province} - Totale casi - scala {cmap}",
+                          "kind": "province_totale_casi", "args": {"province": province, "log_y": cmap == "esponenziale"}})
+        views.append({"name": f"provincia-{slug}-nuovi-casi", "section": "Province", "title": f"{province} - Nuovi casi",
+                      "kind": "province_nuovi_casi", "args": {"province": province}})
+        views.append({"name": f"provincia-{slug}-rt", "section": "Province", "title": f"{province} - Rt",
+                      "kind": "province_rt", "args": {"province": province}})
+        for metric, label in window_metric_labels().items():
+            views.append({"name": f"provincia-{slug}-{slugify(metric)}", "section": "Province", "title": f"{province} - {label}",
+                          "kind": "province_window_metric", "args": {"province": province, "metric": metric}})
+    return views
+
+
+def view_frames(view) -> list:
+    '''
+        Righe dei dati lette dalla vista (usate sia per costruirla sia per il suo hash)
+    '''
+    kind, args = view["kind"], view["args"]
+    if kind == "regional_map":
+        return [_context["df_regioni_metriche"]]
+    if kind == "provincial_map":
+        return [_context["df"]]
+    if kind == "region_map":
+        return [_context["region_store"].select([args["region"]]), _context["province_store"].select_groups([args["region"]])]
+    if kind in ("region_growth_rate", "region_tamponi", "region_rt"):
+        return [_context["region_store"].select([args["region"]])]
+    return [_context["province_store"].select([args["province"]])]
+
+
+def national_cmap(name: str):
+    if name == "lineare":
+        return viridis
+    return exp_viridis(calcolo_giorni_da_min_positivi(_context["df_regioni"]))
+
+
+def build_view(view):
+    kind, args = view["kind"], view["args"]
+    version = _context["version"]
+    frames = view_frames(view)
+
+    if kind == "regional_map":
+        _, regions_map_json = get_map_json()
+        return build_regional_map(frames[0], regions_map_json, national_cmap(args["cmap"]), args["metric"], args["compact"])
+    if kind == "provincial_map":
+        province_map_json, _ = get_map_json()
+        return build_provincial_map(frames[0], province_map_json, national_cmap(args["cmap"]), args["compact"])
+    if kind == "region_map":
+        regional_data, filtered_province_data = frames
+        region_codes = regional_data["codice_regione"].unique()
+        center, zoom = get_region_geometry_index("high").center_zoom(region_codes)
+        region_map_json = get_region_geometry_index(level_for_zoom(zoom)).feature_collection(region_codes)
+        cmap = viridis if args["cmap"] == "lineare" else exp_viridis(calcolo_giorni_da_min_positivi(regional_data))
+        return get_area_provincial_map(filtered_province_data, region_map_json, cmap, center, zoom)
+    if kind == "region_growth_rate":
+        return fig_growth_rate(version, [args["region"]], frames[0])
+    if kind == "region_tamponi":
+        return fig_tamponi_vs_positivi(version, [args["region"]], frames[0])
+    if kind == "region_rt":
+        return fig_rt(version, [args["region"]], frames[0], "denominazione_regione")
+    if kind == "province_totale_casi":
+        return fig_totale_casi_provincia(version, [args["province"]], frames[0], args["log_y"])
+    if kind == "province_nuovi_casi":
+        return fig_nuovi_casi_giornalieri(version, [args["province"]], frames[0])
+    if kind == "province_rt":
+        return fig_rt(version, [args["province"]], frames[0], "denominazione_provincia")
+    if kind == "province_window_metric":
+        return fig_window_metric(version, [args["province"]], frames[0], "denominazione_provincia", args["metric"])
+    raise Exception(f"vista sconosciuta: {kind}")
+
+
+def code_hash(root: str = ".") -> str:
+    sha = hashlib.sha1()
+    paths = [os.path.join(root, x) for x in CODE_FILES] + sorted(glob.glob(os.path.join(root, GEOJSON_DIR, "**", "*.json"), recursive=True))
+    for path in paths:
+        with open(path, mode="rb") as f:
+            sha.update(f.read())
+    return sha.hexdigest()
+
+
+def view_fingerprint(view, code: str) -> str:
+    sha = hashlib.sha1(code.encode("utf-8"))
+    sha.update(json.dumps([view["kind"], view["args"]], sort_keys=True).encode("utf-8"))
+    for frame in view_frames(view):
+        sha.update(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+    return sha.hexdigest()
+
+
+def write_atomic(path: str, text: str):
+    with open(path + ".tmp", mode="w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(path + ".tmp", path)
+
+
+def render_view(view, output: str):
+    '''
+        Costruisce una vista e ne scrive HTML e JSON; restituisce (nome, secondi, errore).
+        Una vista che non si riesce a costruire viene riportata con il suo errore senza
+        interrompere l'esportazione delle altre.
+    '''
+    start = time.perf_counter()
+    try:
+        fig = build_view(view)
+        write_atomic(os.path.join(output, view["name"] + ".json"), fig.to_json())
+        #plotly.min.js è scritto una volta sola nella cartella e referenziato da tutte le pagine
+        write_atomic(os.path.join(output, view["name"] + ".html"),
+                     fig.to_html(include_plotlyjs="directory", full_html=True, default_width="100%"))
+    except Exception as e:
+        return view["name"], time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return view["name"], time.perf_counter() - start, None
+
+
+def render_views(views: list, output: str, processes: int = None) -> list:
+    if processes == 1 or len(views) <= 1:
+        return [render_view(x, output) for x in views]
+    #spawn come in batch_significance: niente lock copiati da un fork; ogni worker riceve i frame una volta
+    with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=init_context, initargs=(_context["df"], _context["df_regioni"],
+                                                                 _context["rt_province"], _context["rt_regioni"])) as pool:
+        return list(pool.map(render_view, views, [output] * len(views), chunksize=4))
+
+
+def read_manifest(output: str) -> dict:
+    try:
+        with open(os.path.join(output, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {"views": {}}
+
+
+def index_html(views: list, version: str) -> str:
+    sections = []
+    for section in dict.fromkeys(x["section"] for x in views):
+        links = "".join(f"<li><a href='{x['name']}.html'>{html.escape(x['title'])}</a> (<a href='{x['name']}.json'>json</a>)</li>"
+                        for x in views if x["section"] == section)
+        sections.append(f"<h2>{section}</h2><ul>{links}</ul>")
+    return (f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>Covid19 Data Analysis</title></head><body>"
+            f"<h1>Covid19 Data Analysis</h1><p>Versione dei dati {version}</p>{''.join(sections)}</body></html>")
+
+
+def export(output: str, processes: int = None, incremental: bool = False, current_date: date = None) -> dict:
+    df, df_regioni, _, _ = get_dataset(current_date or date.today())
+    init_context(df, df_regioni)
+    os.makedirs(output, exist_ok=True)
+    if not os.path.exists(os.path.join(output, PLOTLYJS_FILE)):
+        write_atomic(os.path.join(output, PLOTLYJS_FILE), get_plotlyjs())
+
+    views = list_views(df, df_regioni)
+    code = code_hash()
+    fingerprints = {x["name"]: view_fingerprint(x, code) for x in views}
+
+    previous = read_manifest(output)["views"] if incremental else {}
+    to_build = [x for x in views
+                if previous.get(x["name"], {}).get("fingerprint") != fingerprints[x["name"]]
+                or not os.path.exists(os.path.join(output, x["name"] + ".html"))]
+
+    start = time.perf_counter()
+    results = render_views(to_build, output, processes)
+    elapsed = time.perf_counter() - start
+    failed = {name: error for name, _, error in results if error is not None}
+    timings = [(name, seconds) for name, seconds, error in results if error is None]
+
+    #le viste non riuscite restano fuori da manifest e indice: la prossima esportazione incrementale le ricostruisce
+    exported = [x for x in views if x["name"] not in failed]
+    manifest = {"version": _context["version"], "exported_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "views": {x["name"]: {"title": x["title"], "section": x["section"], "fingerprint": fingerprints[x["name"]]}
+                          for x in exported}}
+    write_atomic(os.path.join(output, MANIFEST_FILE), json.dumps(manifest, indent=1, ensure_ascii=False))
+    write_atomic(os.path.join(output, "index.html"), index_html(exported, _context["version"]))
+
+    return {"views": len(views), "built": len(timings), "skipped": len(views) - len(results), "failed": failed,
+            "elapsed": elapsed, "slowest": sorted(timings, key=lambda x: -x[1])[:5]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="static", help="cartella in cui scrivere le viste")
+    parser.add_argument("--processes", type=int, default=None, help="processi del pool (default: numero di CPU)")
+    parser.add_argument("--incremental", action="store_true", help="ricostruisce solo le viste con input cambiato")
+    args = parser.parse_args()
+
+    result = export(args.output, processes=args.processes, incremental=args.incremental)
+    print(f"{result['built']} viste costruite, {result['skipped']} invariate su {result['views']} in {result['elapsed']:.1f} s")
+    for name, seconds in result["slowest"]:
+        print(f"  {seconds:6.2f} s  {name}")
+    if result["failed"]:
+        print(f"{len(result['failed'])} viste non esportate:")
+        for name, error in result["failed"].items():
+            print(f"  {name}: {error}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Cache persistente su disco delle figure plotly già costruite.
+
+Ogni figura viene serializzata in JSON in un file il cui nome è l'hash della chiave
+(per esempio versione del dataset, codice delle figure, vista, metrica e color map),
+così sopravvive ai riavvii del server. Le entry sono eliminate in ordine LRU (data di
+ultimo accesso) quando si superano il numero massimo di file o i byte totali.
+
+Una chiave viene costruita da un solo thread alla volta: chi la chiede mentre è in
+costruzione (per esempio un rerun durante il warm-up) aspetta il risultato invece di
+costruire la stessa figura una seconda volta.
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import plotly.io as pio
+
+
+class FigureCache(object):
+    def __init__(self, root: str, max_entries: int = 128, max_bytes: int = 512 * 1024 * 1024):
+        self.root = root
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        #hash della chiave -> Event impostato quando la costruzione in corso termina
+        self._building = {}
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def key_hash(key: dict) -> str:
+        return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def _path(self, key: dict) -> str:
+        return os.path.join(self.root, self.key_hash(key) + ".json")
+
+    def __contains__(self, key: dict) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get(self, key: dict):
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                fig_json = f.read()
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            self._local.hit = False
+            return None
+        #l'accesso aggiorna la data usata dall'eviction LRU; se intanto un altro processo ha
+        #eliminato il file il contenuto è già stato letto e la voce resta un hit
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.hits += 1
+        self._local.hit = True
+        return pio.from_json(fig_json)
+
+    def last_hit(self):
+        '''
+            Esito dell'ultima get fatta dal thread corrente (None se non ce ne sono state)
+        '''
+        return getattr(self._local, "hit", None)
+
+    def put(self, key: dict, fig):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, mode="w", encoding="utf-8") as f:
+            f.write(fig.to_json())
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def _claim(self, key: dict):
+        '''
+            (Event, True) se il thread corrente deve costruire la chiave, (Event, False) se la sta già costruendo un altro
+        '''
+        name = self.key_hash(key)
+        with self._lock:
+            building = self._building.get(name)
+            if building is not None:
+                return building, False
+            building = self._building[name] = threading.Event()
+            return building, True
+
+    def _build(self, key: dict, build, building):
+        try:
+            fig = build()
+            self.put(key, fig)
+            return fig
+        finally:
+            with self._lock:
+                del self._building[self.key_hash(key)]
+            building.set()
+
+    def get_or_build(self, key: dict, build):
+        while True:
+            fig = self.get(key)
+            if fig is not None:
+                return fig
+            building, owner = self._claim(key)
+            if owner:
+                return self._build(key, build, building)
+            #se la costruzione dell'altro thread fallisce la chiave viene riletta e, se manca, costruita qui
+            building.wait()
+
+    def warm(self, key: dict, build) -> bool:
+        '''
+            Costruisce e salva la chiave solo se non è già in cache né in costruzione; True se è stata costruita
+        '''
+        if key in self:
+            return False
+        building, owner = self._claim(key)
+        if not owner:
+            return False
+        self._build(key, build, building)
+        return True
+
+    def entries(self) -> list:
+        '''
+            (path, bytes, ultimo accesso) delle entry, dalla meno recente
+        '''
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda x: x[2])
+
+    def evict(self):
+        with self._lock:
+            entries = self.entries()
+            total_bytes = sum(x[1] for x in entries)
+            while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+                path, size, _ = entries.pop(0)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_bytes -= size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        entries = self.entries()
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "entries": len(entries), "bytes": sum(x[1] for x in entries)}
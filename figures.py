@@ -0,0 +1,373 @@
+import hashlib
+import math
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+from figure_cache import FigureCache
+from metrics import window_metric_labels
+from timing import timer
+from versioned_cache import versioned_cache
+
+#dati selezionabili nella mappa per regioni
+REGIONAL_MAP_METRICS = {'totale_casi':'Casi Confermati', "terapia_intensiva": "Ricoverati in terapia intensiva",
+            "totale_ospedalizzati": "Totale ospedalizzati", "isolamento_domiciliare": "Persone in isolamento domiciliare", "totale_positivi": "Totale attualmente positivi (ospedalizzati + isolamento domiciliare)",
+            "dimessi_guariti": "Persone dimesse guarite", "deceduti": "Persone decedute", "tamponi": "Totale tamponi effettuati",
+            #metriche sulle finestre mobili (metrics.add_window_metrics) e Rt (rt.add_rt)
+            **window_metric_labels(), "rt": "Numero di riproduzione Rt (stima)"}
+
+
+def get_regional_map(df_regioni,regions_map_json,cmap,data_selected,data_selected_label):
+    fig = px.choropleth_mapbox(
+                            data_frame=df_regioni,
+                            geojson=regions_map_json,
+                            locations='codice_regione',
+                            featureidkey='properties.reg_istat_code_num',
+                            color=data_selected,
+                            color_continuous_scale=cmap,
+                            range_color=(min(0, math.floor(df_regioni[data_selected].min())), math.ceil(df_regioni[data_selected].max()+1)),
+                            hover_data=["increased_cases", "increased_tamponi",data_selected],
+                            mapbox_style="carto-positron",
+                            zoom=4, center = {"lat": 42.00107394, "lon": 10.3283498},
+                            #opacity=1,
+                            animation_frame="giorno",
+                            labels={ data_selected:data_selected_label,
+                                    "giorno":"Giorno",
+                                    'data': 'Data', "growth_rate": "Growth Rate",
+                                    "increased_cases": "Nuovi Casi",
+                                    "increased_tamponi":"Nuovi Tamponi Effettuati",
+                                    "codice_regione":"Codice Regione"},
+                            height=600,
+                          )
+    return fig
+
+def get_provincial_map(df_province,province_map_json,cmap):
+    fig = px.choropleth_mapbox(
+                            data_frame=df_province,
+                            geojson=province_map_json,
+                            locations='sigla_provincia',
+                            featureidkey='properties.prov_acr',
+                            color='totale_casi',
+                            color_continuous_scale=cmap,
+                            range_color=(0, math.ceil(df_province['totale_casi'].max()+1)),
+                            hover_data=["growth_rate","increased_cases"],
+                            mapbox_style="carto-positron",
+                            zoom=4, center = {"lat": 42.00107394, "lon": 10.3283498},
+                            #opacity=1,
+                            animation_frame="giorno",
+                            labels={"giorno":"Giorno",
+                                    "totale_casi":"Totale Casi",
+                                    'data': 'Data', "growth_rate": "Growth Rate",
+                                    "increased_cases": "Nuovi Casi",
+                                    "increased_tamponi":"Nuovi Tamponi Effettuati",
+                                    "sigla_provincia":"Sigla Provincia"},
+                            height=600,
+                          )
+    return fig
+
+
+def compact_choropleth_map(df, geojson, locations, featureidkey, color, cmap, hover_data, labels, include_hover=True, decimals=2):
+    '''
+        Mappa animata per giorno in cui geometria e id delle aree sono nella sola traccia iniziale:
+        ogni frame contiene solo i valori di colore (e, se include_hover, quelli dell'hover).
+        I valori sono arrotondati a decimals cifre e salvati come interi quando possibile,
+        così il JSON dei frame resta compatto.
+    '''
+    day_codes, days = pd.factorize(df["giorno"], sort=True)
+    location_codes, location_ids = pd.factorize(df[locations])
+
+    def day_matrix(column):
+        #una riga per giorno e una colonna per area; a parità di area vince l'ultima riga, come nelle mappe px
+        matrix = np.full((len(days), len(location_ids)), np.nan)
+        matrix[day_codes, location_codes] = df[column].values
+        matrix = np.round(matrix, decimals)
+        if not np.isnan(matrix).any() and (matrix == np.round(matrix)).all():
+            return matrix.astype(np.int64)
+        return matrix
+
+    z = day_matrix(color)
+    hover_columns = [x for x in hover_data if x != color] if include_hover else []
+    customdata = np.stack([day_matrix(x) for x in hover_columns], axis=-1) if hover_columns else None
+
+    hovertemplate = f"<b>%{{location}}</b><br>{labels.get(color, color)}: %{{z}}"
+    for idx, column in enumerate(hover_columns):
+        hovertemplate += f"<br>{labels.get(column, column)}: %{{customdata[{idx}]}}"
+
+    trace = go.Choroplethmapbox(
+                            geojson=geojson,
+                            locations=location_ids,
+                            featureidkey=featureidkey,
+                            z=z[0],
+                            customdata=customdata[0] if customdata is not None else None,
+                            zmin=min(0, math.floor(np.nanmin(z))),
+                            zmax=math.ceil(np.nanmax(z)+1),
+                            colorscale=cmap,
+                            colorbar={"title": {"text": labels.get(color, color)}},
+                            hovertemplate=hovertemplate + "<extra></extra>",
+                            marker_line_width=0.5,
+                          )
+    frames = []
+    for idx, day in enumerate(days):
+        frame_data = go.Choroplethmapbox(z=z[idx], customdata=customdata[idx] if customdata is not None else None)
+        frames.append(go.Frame(name=str(day), data=[frame_data], traces=[0]))
+
+    play_args = {"frame": {"duration": 500, "redraw": True}, "mode": "immediate", "fromcurrent": True, "transition": {"duration": 0}}
+    fig = go.Figure(data=[trace], frames=frames)
+    fig.update_layout(
+        mapbox={"style": "carto-positron", "zoom": 4, "center": {"lat": 42.00107394, "lon": 10.3283498}},
+        margin={"t": 60},
+        height=600,
+        updatemenus=[{"type": "buttons", "direction": "left", "x": 0.1, "y": 0, "xanchor": "right", "yanchor": "top",
+                      "pad": {"r": 10, "t": 70}, "showactive": False,
+                      "buttons": [{"label": "&#9654;", "method": "animate", "args": [None, play_args]},
+                                  {"label": "&#9724;", "method": "animate", "args": [[None], dict(play_args, frame={"duration": 0, "redraw": True})]}]}],
+        sliders=[{"active": 0, "x": 0.1, "y": 0, "xanchor": "left", "yanchor": "top", "len": 0.9, "pad": {"b": 10, "t": 60},
+                  "currentvalue": {"prefix": labels.get("giorno", "giorno") + "="},
+                  "steps": [{"label": str(day), "method": "animate",
+                             "args": [[str(day)], dict(play_args, frame={"duration": 0, "redraw": True})]} for day in days]}],
+    )
+    return fig
+
+def get_compact_regional_map(df_regioni,regions_map_json,cmap,data_selected,data_selected_label,include_hover=True):
+    return compact_choropleth_map(df_regioni, regions_map_json, 'codice_regione', 'properties.reg_istat_code_num',
+                                  data_selected, cmap, ["increased_cases", "increased_tamponi", data_selected],
+                                  {data_selected: data_selected_label, "giorno": "Giorno", "increased_cases": "Nuovi Casi",
+                                   "increased_tamponi": "Nuovi Tamponi Effettuati"},
+                                  include_hover=include_hover)
+
+def get_compact_provincial_map(df_province,province_map_json,cmap,include_hover=True):
+    return compact_choropleth_map(df_province, province_map_json, 'sigla_provincia', 'properties.prov_acr',
+                                  'totale_casi', cmap, ["growth_rate", "increased_cases"],
+                                  {"totale_casi": "Totale Casi", "giorno": "Giorno", "growth_rate": "Growth Rate",
+                                   "increased_cases": "Nuovi Casi"},
+                                  include_hover=include_hover)
+
+
+def calcolo_giorni_da_min_positivi(df_regioni, min_positivi=100):
+    #una sola maschera per filtro: l'indicizzazione a catena riallinea la seconda maschera (e avvisa) ad ogni chiamata
+    regione_piu_colpita = df_regioni[(df_regioni["data"] == df_regioni["data"].max()) & (df_regioni["totale_casi"] == df_regioni["totale_casi"].max())]["denominazione_regione"].tolist()[0]
+    return int(((df_regioni["totale_casi"] > min_positivi) & (df_regioni["denominazione_regione"] == regione_piu_colpita)).sum())
+
+@timer.timed()
+def get_area_provincial_map(filtered_province_data,region_map_json,cmap,center,zoom):
+    fig = px.choropleth_mapbox(
+                            data_frame=filtered_province_data, 
+                            geojson=region_map_json, 
+                            locations='sigla_provincia', 
+                            featureidkey='properties.prov_acr',
+                            color='totale_casi',
+                            color_continuous_scale=cmap,
+                            range_color=(0, math.ceil(filtered_province_data['totale_casi'].max()+1)),
+                            hover_data=["increased_cases"],
+                            mapbox_style="carto-positron",
+                            zoom=zoom, center = center,
+                            #opacity=1,
+                            animation_frame="giorno",
+                            labels={"giorno":"Giorno",
+                                    "totale_casi":"Totale Casi",
+                                    'data': 'Data', "growth_rate": "Growth Rate", 
+                                    "increased_cases": "Nuovi Casi",
+                                    "increased_tamponi":"Nuovi Tamponi Effettuati",
+                                    "sigla_provincia":"Sigla Provincia"},
+                            height=600,
+                          )
+    return fig
+
+@timer.timed()
+@versioned_cache(max_entries=64, ignore=("filtered_data",))
+def fig_growth_rate(version, region_names, filtered_data):
+    fig = px.line(data_frame=filtered_data[filtered_data["data"] > datetime(2020,3,4)],x="data",
+                y="smooth_growth_rate",
+                hover_data=["increased_cases","denominazione_regione"],
+                log_y=False,
+                color='denominazione_regione',
+                title="Growth rate media ultimi 3gg", 
+                labels={'increased_cases':'Nuovi casi positivi', 'data': 'Data', 'denominazione_regione': 'Regione',"smooth_growth_rate":"Growth Rate"})
+    return fig.update_traces(mode='lines+markers',hovertemplate = "<b>Growth Rate: %{y}</b><extra></extra>")
+
+@timer.timed()
+@versioned_cache(max_entries=64, ignore=("filtered_data",))
+def fig_tamponi_vs_positivi(version, region_names, filtered_data):
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=filtered_data["data"], 
+                            y=filtered_data["totale_casi"], 
+                            fill='tozeroy',
+                            #mode='lines+markers',
+                            name="Totale Casi Positivi",
+                            hovertemplate = "<b>%{x}</b><br><b>Totale casi positivi: %{y}</b><br><b>Percentuale tamponi per casi positivi: %{text:.2f}%</b><extra></extra>",
+                            text=filtered_data["totale_casi/tamponi"] * 100
+                            ))
+    fig.add_trace(go.Scatter(x=filtered_data["data"], 
+                            y=filtered_data["tamponi"], 
+                            fill='tonexty',
+                            #mode='lines+markers',
+                            name="Totale Tamponi",
+                            hovertemplate = "<b>%{x}</b><br><b>Totale tamponi effettuati: %{y}</b><extra></extra>",
+                            text=filtered_data["totale_casi/tamponi"] * 100
+                            ))
+    fig.update_layout(
+        title_text='Totale Tamponi comparato con Totale Casi Positivi'
+    )
+    return fig
+
+@timer.timed()
+@versioned_cache(max_entries=64, ignore=("filtered_data",))
+def fig_totale_casi_regione(version, region_names, filtered_data,log_y):
+    fig = px.line(  data_frame=filtered_data,x="data",
+                    y="totale_casi",
+                    hover_data=["increased_cases"],
+                    log_y=log_y,
+                    color='denominazione_regione',
+                    title="Totale Casi per giorno", 
+                    labels={'totale_casi':'Casi confermati', 'data': 'Data', 'denominazione_regione': 'Regione'})
+    return fig.update_traces(mode='lines+markers')
+
+@timer.timed()
+@versioned_cache(max_entries=64, ignore=("filtered_data",))
+def fig_totale_casi_provincia(version, province_names, filtered_data,log_y):
+    fig = px.line(  data_frame=filtered_data,
+                    x="data",
+                    y="totale_casi",
+                    log_y=log_y,
+                    hover_data=["increased_cases"],
+                    color='denominazione_provincia',
+                    title="Totale Casi per giorno", 
+                    labels={'totale_casi':'Casi confermati', 'data': 'Data', 'denominazione_provincia': 'Provincia'})
+    return fig.update_traces(mode='lines+markers')
+
+
+@timer.timed()
+@versioned_cache(max_entries=64, ignore=("region_store",))
+def fig_totale_casi_su_tamponi(version, region_names, region_store):
+    fig = go.Figure()
+           
+    for region_name in [x for x in region_names if x in region_store.slices]:
+        rapporto = region_store.series(region_name, "totale_casi/tamponi")*100
+        fig.add_trace(go.Scatter(x=region_store.series(region_name, "data"), 
+                                y=rapporto,
+                                #mode='lines+markers',
+                                name=region_name,
+                                line_shape='vh',
+                                fill='tozeroy',
+                                hovertemplate = "<b>%{x}</b><br><b>Percentuale tamponi per casi positivi: %{text:.2f}%</b><extra></extra>",
+                                text=rapporto))
+    fig.update_layout(
+        title_text='Rapporto del Totale Casi Positivi sul Totale Tamponi'
+    )
+    return fig
+
+@timer.timed()
+@versioned_cache(max_entries=64, ignore=("filtered_data",))
+def fig_nuovi_casi_giornalieri(version, province_names, filtered_data):
+    fig = px.line(
+        data_frame=filtered_data,
+        x="data",
+        y="increased_cases",
+        color='denominazione_provincia',
+        title="Nuovi Casi al giorno", 
+        labels={'increased_cases':'Incremento Casi', 'data': 'Data', 'denominazione_provincia': 'Provincia'})
+    return fig.update_traces(mode='lines+markers')
+
+
+@timer.timed()
+@versioned_cache(max_entries=64, ignore=("filtered_data",))
+def fig_rt(version, area_names, filtered_data, area_column):
+    '''
+        Rt stimato (rt.py) per area, con l'intervallo di credibilità come banda e la soglia Rt = 1
+    '''
+    fig = go.Figure()
+    colors = px.colors.qualitative.Plotly
+    for idx, (area, rows) in enumerate(filtered_data[filtered_data["rt"].notna()].groupby(area_column, observed=True, sort=False)):
+        color = colors[idx % len(colors)]
+        fillcolor = f"rgba({int(color[1:3], 16)},{int(color[3:5], 16)},{int(color[5:7], 16)},0.2)"
+        fig.add_trace(go.Scatter(x=pd.concat([rows["data"], rows["data"][::-1]]),
+                                y=np.concatenate([rows["rt_high"].values, rows["rt_low"].values[::-1]]),
+                                fill='toself',
+                                fillcolor=fillcolor,
+                                line={"width": 0},
+                                hoverinfo='skip',
+                                legendgroup=str(area),
+                                showlegend=False))
+        fig.add_trace(go.Scatter(x=rows["data"],
+                                y=rows["rt"],
+                                mode='lines',
+                                line={"color": color},
+                                name=str(area),
+                                legendgroup=str(area),
+                                hovertemplate = "<b>%{x}</b><br><b>Rt: %{y:.2f}</b><br>IC 95%: %{text}<extra></extra>",
+                                text=[f"{low:.2f} - {high:.2f}" for low, high in zip(rows["rt_low"], rows["rt_high"])]))
+    fig.update_layout(
+        title_text='Numero di riproduzione Rt stimato',
+        xaxis_title='Data',
+        yaxis_title='Rt',
+        shapes=[{"type": "line", "xref": "paper", "x0": 0, "x1": 1, "y0": 1, "y1": 1, "line": {"color": "grey", "dash": "dash"}}]
+    )
+    return fig
+
+
+@timer.timed()
+@versioned_cache(max_entries=64, ignore=("filtered_data",))
+def fig_window_metric(version, area_names, filtered_data, area_column, metric):
+    '''
+        Metrica su finestra mobile (metrics.add_window_metrics) per area
+    '''
+    label = window_metric_labels()[metric]
+    fig = px.line(
+        data_frame=filtered_data,
+        x="data",
+        y=metric,
+        color=area_column,
+        title=label,
+        labels={metric: label, 'data': 'Data', 'denominazione_provincia': 'Provincia', 'denominazione_regione': 'Regione'})
+    return fig.update_traces(mode='lines+markers')
+
+
+def code_hash(paths) -> str:
+    sha = hashlib.sha1()
+    for path in paths:
+        with open(path, mode="rb") as f:
+            sha.update(f.read())
+    return sha.hexdigest()[:12]
+
+#le mappe salvate su disco vanno ricostruite anche quando cambia il codice che le costruisce
+MAP_CODE_HASH = code_hash([os.path.abspath(__file__), os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics.py")])
+
+def map_figure_key(version:str, view:str, metric:str, cmap, compact:bool=False):
+    return {"version": version, "code": MAP_CODE_HASH, "view": view, "metric": metric, "cmap": cmap, "compact": compact}
+
+@timer.timed()
+def build_regional_map(df_regioni, regions_map_json, cmap, data_selected, compact=False):
+    builder = get_compact_regional_map if compact else get_regional_map
+    return builder(df_regioni, regions_map_json, cmap, data_selected, REGIONAL_MAP_METRICS[data_selected])
+
+@timer.timed()
+def build_provincial_map(df_province, province_map_json, cmap, compact=False):
+    builder = get_compact_provincial_map if compact else get_provincial_map
+    return builder(df_province, province_map_json, cmap)
+
+def get_cached_regional_map(cache:FigureCache, version:str, df_regioni, regions_map_json, cmap, data_selected, compact=False):
+    key = map_figure_key(version, "Regioni", data_selected, cmap, compact)
+    with timer.stage("get_cached_regional_map", cache=cache, metric=data_selected, compact=compact):
+        return cache.get_or_build(key, lambda: build_regional_map(df_regioni, regions_map_json, cmap, data_selected, compact))
+
+def get_cached_provincial_map(cache:FigureCache, version:str, df_province, province_map_json, cmap, compact=False):
+    key = map_figure_key(version, "Province", "totale_casi", cmap, compact)
+    with timer.stage("get_cached_provincial_map", cache=cache, compact=compact):
+        return cache.get_or_build(key, lambda: build_provincial_map(df_province, province_map_json, cmap, compact))
+
+def warm_map_figures(cache:FigureCache, version:str, df_province, df_regioni, province_map_json, regions_map_json, cmaps):
+    '''
+        Costruisce e salva in cache tutte le mappe nazionali (ogni metrica per ogni color map)
+        per una versione del dataset, saltando quelle già presenti o che un rerun sta già costruendo
+    '''
+    for compact in (False, True):
+        for cmap in cmaps:
+            for data_selected in REGIONAL_MAP_METRICS:
+                cache.warm(map_figure_key(version, "Regioni", data_selected, cmap, compact),
+                           lambda: build_regional_map(df_regioni, regions_map_json, cmap, data_selected, compact))
+            cache.warm(map_figure_key(version, "Province", "totale_casi", cmap, compact),
+                       lambda: build_provincial_map(df_province, province_map_json, cmap, compact))
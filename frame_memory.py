@@ -0,0 +1,86 @@
+"""Rappresentazione compatta dei DataFrame elaborati e report sulla memoria occupata.
+
+compact_frame converte le stringhe ripetute (nomi, sigle, codici, note) in categoriche,
+i conteggi nel tipo intero più piccolo che li contiene e i tassi in float32.
+memory_report restituisce i byte occupati per colonna e per frame, prima e dopo la conversione.
+"""
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_float_dtype, is_integer_dtype
+
+#una colonna di stringhe diventa categorica se i valori distinti sono al massimo questa frazione delle righe
+CATEGORY_MAX_RATIO = 0.5
+#colonne sempre float32 anche quando contengono solo valori interi (es. coordinate a 0 o tassi nulli)
+FLOAT_COLUMNS = ("lat", "lon", "long", "growth_rate", "smooth_growth_rate", "totale_casi/tamponi")
+
+
+def is_integer_valued(values: pd.Series) -> bool:
+    values = values.values
+    return bool(np.isfinite(values).all() and (values == np.floor(values)).all())
+
+
+def compact_frame(df: pd.DataFrame, category_max_ratio: float = CATEGORY_MAX_RATIO, float_columns=FLOAT_COLUMNS) -> pd.DataFrame:
+    '''
+        Copia di df con tipi compatti:
+            stringhe con pochi valori distinti -> category
+            interi e float con soli valori interi (conteggi, popolazione) -> intero più piccolo possibile
+            altri float e float_columns (tassi, coordinate) -> float32
+        Le date e le colonne già categoriche restano invariate.
+    '''
+    df = df.copy()
+    for column in df.columns:
+        values = df[column]
+        if values.dtype == object:
+            if values.nunique(dropna=False) <= max(1, category_max_ratio * len(values)):
+                df[column] = values.astype("category")
+        elif is_integer_dtype(values.dtype):
+            df[column] = pd.to_numeric(values, downcast="integer")
+        elif column in float_columns:
+            df[column] = values.astype(np.float32)
+        elif is_float_dtype(values.dtype):
+            if len(values) and is_integer_valued(values):
+                df[column] = pd.to_numeric(values.astype(np.int64), downcast="integer")
+            else:
+                df[column] = values.astype(np.float32)
+    return df
+
+
+def memory_report(frames: dict, compacted: dict = None) -> pd.DataFrame:
+    '''
+        Byte occupati da ogni colonna di ogni frame (frames: nome -> DataFrame).
+        Se compacted contiene gli stessi frame in forma compatta vengono aggiunte le colonne
+        con tipo e byte dopo la conversione.
+    '''
+    rows = []
+    for name, df in frames.items():
+        usage = df.memory_usage(deep=True, index=False)
+        compact_usage = compacted[name].memory_usage(deep=True, index=False) if compacted else None
+        for column in df.columns:
+            row = {"frame": name, "colonna": column, "tipo": str(df[column].dtype), "byte": int(usage[column])}
+            if compacted:
+                row["tipo_compatto"] = str(compacted[name][column].dtype)
+                row["byte_compatti"] = int(compact_usage[column])
+            rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def format_memory_report(report: pd.DataFrame) -> str:
+    '''
+        Testo con il totale per frame e le colonne ordinate per memoria occupata
+    '''
+    lines = []
+    compacted = "byte_compatti" in report
+    for name, columns in report.groupby("frame", sort=False):
+        total = columns["byte"].sum()
+        if compacted:
+            total_compact = columns["byte_compatti"].sum()
+            lines.append(f"{name}: {total/1024**2:.2f} MB -> {total_compact/1024**2:.2f} MB ({len(columns)} colonne)")
+        else:
+            lines.append(f"{name}: {total/1024**2:.2f} MB ({len(columns)} colonne)")
+        for row in columns.sort_values("byte", ascending=False).itertuples():
+            if compacted:
+                lines.append(f"    {row.colonna:75s} {row.tipo:>14s} {row.byte/1024:10.1f} KB -> {row.tipo_compatto:>14s} {row.byte_compatti/1024:10.1f} KB")
+            else:
+                lines.append(f"    {row.colonna:75s} {row.tipo:>14s} {row.byte/1024:10.1f} KB")
+    return "\n".join(lines)
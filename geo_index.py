@@ -0,0 +1,103 @@
+"""Indice delle geometrie provinciali raggruppate per codice regione.
+
+Le feature e i bounding box vengono calcolati una volta sola alla costruzione
+dell'indice: per qualsiasi insieme di regioni la FeatureCollection, il bounding box,
+il centro e lo zoom della mappa si ottengono con un lookup per regione selezionata.
+
+Il GeoJSON usa i codici ISTAT delle regioni (Trentino-Alto Adige = 4), mentre i dati
+DPC usano 21 per la P.A. di Bolzano e 22 per la P.A. di Trento: i due codici sono
+indicizzati con le sole province autonome corrispondenti. Se nessuna regione
+selezionata ha geometrie si usano l'intera Italia e la vista nazionale.
+"""
+
+import math
+
+import numpy as np
+
+#dimensioni di riferimento della mappa (px) usate per stimare lo zoom
+MAP_WIDTH = 700
+MAP_HEIGHT = 600
+TILE_SIZE = 512
+MIN_ZOOM = 3
+MAX_ZOOM = 9
+
+#vista nazionale, la stessa delle mappe per regioni e province
+NATIONAL_CENTER = {"lat": 42.00107394, "lon": 10.3283498}
+NATIONAL_ZOOM = 4
+
+#codici DPC delle province autonome -> (codice ISTAT della regione, sigla della provincia)
+AUTONOMOUS_PROVINCES = {21: (4, "BZ"), 22: (4, "TN")}
+
+
+def geometry_bbox(geometry: dict) -> tuple:
+    polygons = [geometry["coordinates"]] if geometry["type"] == "Polygon" else geometry["coordinates"]
+    points = np.concatenate([np.asarray(ring) for polygon in polygons for ring in polygon])
+    lon_min, lat_min = points.min(axis=0)
+    lon_max, lat_max = points.max(axis=0)
+    return lon_min, lat_min, lon_max, lat_max
+
+
+def merge_bbox(bboxes) -> tuple:
+    bboxes = list(bboxes)
+    return (min(x[0] for x in bboxes), min(x[1] for x in bboxes),
+            max(x[2] for x in bboxes), max(x[3] for x in bboxes))
+
+
+def mercator_y(lat: float) -> float:
+    lat = math.radians(lat)
+    return math.log(math.tan(math.pi / 4 + lat / 2))
+
+
+class RegionGeometryIndex(object):
+    def __init__(self, province_map_json: dict, region_key: str = "reg_istat_code_num", province_key: str = "prov_acr"):
+        self.all_features = province_map_json["features"]
+        self.features = {}
+        self.bboxes = {}
+        for feature in self.all_features:
+            self._add(feature["properties"][region_key], feature)
+            for code, (region, sigla) in AUTONOMOUS_PROVINCES.items():
+                if feature["properties"][region_key] == region and feature["properties"].get(province_key) == sigla:
+                    self._add(code, feature)
+
+    def _add(self, region, feature):
+        self.features.setdefault(region, []).append(feature)
+        bbox = geometry_bbox(feature["geometry"])
+        self.bboxes[region] = merge_bbox([self.bboxes[region], bbox]) if region in self.bboxes else bbox
+
+    def regions(self, region_codes) -> list:
+        return [int(x) for x in dict.fromkeys(region_codes) if int(x) in self.features]
+
+    def features_of(self, region_codes) -> list:
+        #senza duplicati: con 4 e 21 selezionati insieme la provincia di Bolzano compare una volta sola
+        features = {id(feature): feature for region in self.regions(region_codes) for feature in self.features[region]}
+        return list(features.values())
+
+    def feature_collection(self, region_codes) -> dict:
+        '''
+            Province delle regioni selezionate (tutta l'Italia se nessuna ha geometrie)
+        '''
+        return {"type": "FeatureCollection", "features": self.features_of(region_codes) or self.all_features}
+
+    def bbox(self, region_codes) -> tuple:
+        regions = self.regions(region_codes)
+        if not regions:
+            return None
+        return merge_bbox(self.bboxes[region] for region in regions)
+
+    def center_zoom(self, region_codes, width: int = MAP_WIDTH, height: int = MAP_HEIGHT):
+        '''
+            Centro e zoom mapbox che contengono tutte le province delle regioni selezionate
+            (la vista nazionale se nessuna ha geometrie)
+        '''
+        bbox = self.bbox(region_codes)
+        if bbox is None:
+            return dict(NATIONAL_CENTER), NATIONAL_ZOOM
+        lon_min, lat_min, lon_max, lat_max = bbox
+        y_min, y_max = mercator_y(lat_min), mercator_y(lat_max)
+        center = {"lat": math.degrees(math.atan(math.sinh((y_min + y_max) / 2))), "lon": (lon_min + lon_max) / 2}
+
+        #a zoom z il mondo è largo TILE_SIZE * 2^z pixel (360 gradi in longitudine, 2*pi in y mercatore)
+        zoom_lon = math.log2(width * 360 / (TILE_SIZE * max(lon_max - lon_min, 1e-6)))
+        zoom_lat = math.log2(height * 2 * math.pi / (TILE_SIZE * max(y_max - y_min, 1e-6)))
+        zoom = min(max(min(zoom_lon, zoom_lat) - 0.2, MIN_ZOOM), MAX_ZOOM)
+        return center, zoom
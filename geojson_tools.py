@@ -0,0 +1,159 @@
+"""Preprocessing offline dei confini GeoJSON usati dalle mappe.
+
+Per ogni file in map/GeoJSON vengono generate versioni compatte in map/GeoJSON/compact:
+    - delle properties restano solo le chiavi usate dalle join (prov_acr, reg_istat_code_num)
+    - le coordinate sono quantizzate a un numero fisso di decimali
+    - per ogni livello di dettaglio i poligoni sono semplificati con Douglas-Peucker
+
+Uso (dalla root del repository):
+
+    python geojson_tools.py
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+GEOJSON_DIR = os.path.join("map", "GeoJSON")
+COMPACT_DIR = os.path.join(GEOJSON_DIR, "compact")
+
+SOURCES = {
+    "province": ("limits_IT_provinces_simple.json", ["prov_acr", "reg_istat_code_num"]),
+    "regioni": ("limits_IT_regions_simplified.json", ["reg_istat_code_num"]),
+}
+
+#tolleranza di semplificazione (gradi) e decimali mantenuti per ogni livello
+LEVELS = {
+    "low": {"tolerance": 0.02, "precision": 3},
+    "medium": {"tolerance": 0.005, "precision": 3},
+    "high": {"tolerance": 0.0, "precision": 4},
+}
+
+#livello di dettaglio da usare in base allo zoom della mappa
+ZOOM_LEVELS = ((5, "low"), (7, "medium"))
+
+
+def level_for_zoom(zoom: float) -> str:
+    for max_zoom, level in ZOOM_LEVELS:
+        if zoom <= max_zoom:
+            return level
+    return "high"
+
+
+def compact_path(name: str, level: str) -> str:
+    return os.path.join(COMPACT_DIR, f"{name}.{level}.json")
+
+
+def douglas_peucker(points: np.array, tolerance: float) -> np.array:
+    '''
+        Maschera dei punti da mantenere secondo l'algoritmo di Douglas-Peucker
+    '''
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        inner = points[start + 1:end] - points[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        farthest = np.argmax(distances)
+        if distances[farthest] > tolerance:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return keep
+
+
+def compact_ring(ring: list, tolerance: float, precision: int):
+    points = np.asarray(ring, dtype=float)
+    if tolerance > 0 and len(points) > 4:
+        points = points[douglas_peucker(points, tolerance)]
+    points = np.round(points, precision)
+    #dopo l'arrotondamento punti consecutivi possono coincidere
+    distinct = np.ones(len(points), dtype=bool)
+    distinct[1:] = np.any(points[1:] != points[:-1], axis=1)
+    points = points[distinct]
+    if len(points) < 4:
+        return None
+    return points.tolist()
+
+
+def compact_polygon(polygon: list, tolerance: float, precision: int):
+    exterior = compact_ring(polygon[0], tolerance, precision)
+    if exterior is None:
+        #un poligono non sparisce mai: se la semplificazione lo annulla si tiene solo l'arrotondamento
+        exterior = compact_ring(polygon[0], 0, precision) or polygon[0]
+    holes = [compact_ring(x, tolerance, precision) for x in polygon[1:]]
+    return [exterior] + [x for x in holes if x is not None]
+
+
+def compact_geojson(geojson: dict, keep_properties: list, tolerance: float, precision: int) -> dict:
+    features = []
+    for feature in geojson["features"]:
+        geometry = feature["geometry"]
+        if geometry["type"] == "Polygon":
+            coordinates = compact_polygon(geometry["coordinates"], tolerance, precision)
+        else:
+            coordinates = [compact_polygon(x, tolerance, precision) for x in geometry["coordinates"]]
+        features.append({
+            "type": "Feature",
+            "properties": {x: feature["properties"][x] for x in keep_properties},
+            "geometry": {"type": geometry["type"], "coordinates": coordinates},
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def build_compact_maps():
+    '''
+        Genera tutti i livelli e restituisce un report con byte e tempi di caricamento
+    '''
+    os.makedirs(COMPACT_DIR, exist_ok=True)
+    report = []
+    for name, (filename, keep_properties) in SOURCES.items():
+        source_path = os.path.join(GEOJSON_DIR, filename)
+        with open(source_path) as map_file:
+            geojson = json.load(map_file)
+        source_bytes = os.path.getsize(source_path)
+        report.append((name, "originale", source_bytes, load_time(source_path)))
+
+        for level, params in LEVELS.items():
+            compact = compact_geojson(geojson, keep_properties, params["tolerance"], params["precision"])
+            path = compact_path(name, level)
+            with open(path, mode="w") as map_file:
+                json.dump(compact, map_file, separators=(",", ":"))
+            report.append((name, level, os.path.getsize(path), load_time(path)))
+    return report
+
+
+def load_time(path: str, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with open(path) as map_file:
+            json.load(map_file)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera i GeoJSON compatti in " + COMPACT_DIR)
+    parser.parse_args()
+    report = build_compact_maps()
+    original = {}
+    for name, level, size, seconds in report:
+        original.setdefault(name, size)
+        print(f"{name:10s} {level:10s} {size/1024:9.1f} KB  (-{100*(1-size/original[name]):4.1f}%)  caricamento {seconds*1000:6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
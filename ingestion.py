@@ -0,0 +1,269 @@
+"""Ingestione incrementale dei dati DPC.
+
+I CSV della Protezione Civile vengono letti da una sorgente intercambiabile
+(l'url del repository GitHub oppure una cartella locale con la stessa struttura,
+utile per lavorare offline) e salvati in uno store locale partizionato per giorno.
+Ad ogni aggiornamento si scaricano solo i file giornalieri dei giorni che non sono
+ancora nello store.
+
+Il primo caricamento di un livello legge il file completo a blocchi di righe con uno
+schema dichiarato (tipi, categorie, formato della data): ogni blocco viene filtrato,
+normalizzato, elaborato e scritto nello store appena letto, così la memoria di picco
+non cresce con la lunghezza dello storico.
+"""
+
+import os
+import shutil
+from datetime import date, datetime, timedelta
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+import pandas as pd
+
+from istat_store import file_checksum
+
+DPC_URL = "https://raw.githubusercontent.com/pcm-dpc/COVID-19/master"
+
+DPC_FILES = {
+    "province": ("dati-province", "dpc-covid19-ita-province"),
+    "regioni": ("dati-regioni", "dpc-covid19-ita-regioni"),
+    "nazione": ("dati-andamento-nazionale", "dpc-covid19-ita-andamento-nazionale"),
+}
+
+#"NA" è la sigla di Napoli, non un valore mancante
+READ_CSV_KWARGS = {
+    "province": {"keep_default_na": False, "na_values": [""]},
+    "regioni": {},
+    "nazione": {},
+}
+
+#giorni già elaborati da rileggere per ricalcolare shift e rolling delle statistiche
+STATS_CONTEXT_DAYS = 4
+
+DPC_DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+#schema dichiarato: i tipi non vengono dedotti blocco per blocco (le colonne non elencate sì)
+DPC_DTYPES = {
+    "province": {"stato": "category", "codice_regione": "int16", "denominazione_regione": "category",
+                 "codice_provincia": "int16", "denominazione_provincia": "category", "sigla_provincia": "category",
+                 "lat": "float64", "long": "float64", "totale_casi": "int32", "note_it": "object", "note_en": "object"},
+    "regioni": {},
+    "nazione": {},
+}
+
+#streamlit vuole "lon" per la longitudine invece di "long"
+DPC_RENAME = {
+    "province": {"long": "lon"},
+    "regioni": {},
+    "nazione": {},
+}
+
+#righe per blocco nella lettura a blocchi
+CHUNK_SIZE = 50000
+
+
+class DPCSource(object):
+    def __init__(self, root: str = DPC_URL):
+        self.root = root
+        self.is_local = not root.startswith(("http://", "https://"))
+
+    def _path(self, level: str, suffix: str = "") -> str:
+        folder, name = DPC_FILES[level]
+        if self.is_local:
+            return os.path.join(self.root, folder, f"{name}{suffix}.csv")
+        return f"{self.root}/{folder}/{name}{suffix}.csv"
+
+    def checksum(self, level: str) -> str:
+        '''
+            Checksum del file completo di un livello (solo sorgenti locali, vedi mirror)
+        '''
+        return file_checksum(self._path(level))
+
+    def mirror(self, directory: str, levels=tuple(DPC_FILES)) -> "DPCSource":
+        '''
+            Sorgente locale con i file completi dei livelli: la stessa sorgente se è già locale,
+            altrimenti una copia scaricata in directory (un solo download, usato per il checksum e per la lettura)
+        '''
+        if self.is_local:
+            return self
+        mirror = DPCSource(directory)
+        for level in levels:
+            path = mirror._path(level)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with urlopen(self._path(level), timeout=60) as response, open(path + ".tmp", mode="wb") as f:
+                shutil.copyfileobj(response, f)
+            os.replace(path + ".tmp", path)
+        return mirror
+
+    def read_full(self, level: str) -> pd.DataFrame:
+        return pd.read_csv(self._path(level), **READ_CSV_KWARGS[level])
+
+    def read_chunks(self, level: str, chunksize: int = CHUNK_SIZE):
+        '''
+            Blocchi normalizzati (vedi normalize_chunk) del file completo di un livello, letti con lo schema
+            dichiarato. Le sorgenti remote vengono comunque scaricate per intero da pandas prima della lettura.
+        '''
+        reader = pd.read_csv(self._path(level), chunksize=chunksize, dtype=DPC_DTYPES[level], **READ_CSV_KWARGS[level])
+        for chunk in reader:
+            yield normalize_chunk(level, chunk)
+
+    def read_chunked(self, level: str, chunksize: int = CHUNK_SIZE) -> pd.DataFrame:
+        return concat_frames(list(self.read_chunks(level, chunksize)))
+
+    def read_day(self, level: str, day: date):
+        '''
+            Legge (normalizzato) il file giornaliero di un livello, None se il giorno non è ancora stato pubblicato
+        '''
+        try:
+            raw = pd.read_csv(self._path(level, "-" + day.strftime("%Y%m%d")), dtype=DPC_DTYPES[level], **READ_CSV_KWARGS[level])
+        except (FileNotFoundError, HTTPError, URLError):
+            return None
+        return normalize_chunk(level, raw)
+
+    def is_published(self, level: str, day: date) -> bool:
+        '''
+            True se il file giornaliero di un livello esiste, senza scaricarlo (HEAD per le sorgenti remote)
+        '''
+        path = self._path(level, "-" + day.strftime("%Y%m%d"))
+        if self.is_local:
+            return os.path.exists(path)
+        try:
+            with urlopen(Request(path, method="HEAD"), timeout=30):
+                return True
+        except (HTTPError, URLError):
+            return False
+
+
+def day_of(data: pd.Series) -> pd.Series:
+    return pd.to_datetime(data).dt.date
+
+
+def normalize_chunk(level: str, chunk: pd.DataFrame) -> pd.DataFrame:
+    '''
+        Scarta le righe senza data, rinomina le colonne e converte "data" con il formato DPC
+    '''
+    chunk = chunk.dropna(subset=["data"]).rename(columns=DPC_RENAME[level])
+    chunk["data"] = pd.to_datetime(chunk["data"], format=DPC_DATE_FORMAT)
+    return chunk
+
+
+def concat_frames(frames: list) -> pd.DataFrame:
+    '''
+        pd.concat che mantiene categoriche le colonne categoriche (non ordinate) in tutti i frame
+        (pd.concat le convertirebbe in object se le categorie sono diverse)
+    '''
+    frames = [x for x in frames if x is not None]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True, sort=False)
+    for column in frames[0].columns:
+        if pd.api.types.is_categorical_dtype(df[column]):
+            continue
+        values = [x[column] for x in frames if column in x]
+        if len(values) == len(frames) and all(pd.api.types.is_categorical_dtype(x) and not x.cat.ordered for x in values):
+            df[column] = pd.api.types.union_categoricals(values)
+    return df
+
+
+def complete_days(chunks):
+    '''
+        Riorganizza i blocchi (ordinati per data) in modo che ognuno contenga solo giorni completi:
+        le righe dell'ultimo giorno di un blocco passano al successivo
+    '''
+    pending = None
+    for chunk in chunks:
+        if pending is not None:
+            chunk = concat_frames([pending, chunk])
+        day = chunk["data"].dt.normalize()
+        last_day = day == day.iloc[-1]
+        pending = chunk[last_day]
+        if not last_day.all():
+            yield chunk[~last_day]
+    if pending is not None and not pending.empty:
+        yield pending
+
+
+def last_days(df: pd.DataFrame, days: int) -> pd.DataFrame:
+    day = df["data"].dt.normalize()
+    return df[day >= day.drop_duplicates().nlargest(days).min()]
+
+
+class PartitionedStore(object):
+    '''
+        Store su disco con una partizione (pickle) per livello e per giorno:
+            <root>/<level>/<YYYY-MM-DD>.pkl
+    '''
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def _level_dir(self, level: str) -> str:
+        return os.path.join(self.root, level)
+
+    def days(self, level: str) -> list:
+        path = self._level_dir(level)
+        if not os.path.isdir(path):
+            return []
+        return sorted(datetime.strptime(x[:-4], "%Y-%m-%d").date() for x in os.listdir(path) if x.endswith(".pkl"))
+
+    def last_day(self, level: str):
+        days = self.days(level)
+        return days[-1] if days else None
+
+    def write(self, level: str, df: pd.DataFrame):
+        os.makedirs(self._level_dir(level), exist_ok=True)
+        for day, partition in df.groupby(day_of(df["data"])):
+            path = os.path.join(self._level_dir(level), f"{day.isoformat()}.pkl")
+            #scrittura atomica: chi legge lo store non vede mai una partizione a metà
+            partition.to_pickle(path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    def read(self, level: str, since: date = None) -> pd.DataFrame:
+        days = [x for x in self.days(level) if since is None or x >= since]
+        if not days:
+            return pd.DataFrame()
+        partitions = [pd.read_pickle(os.path.join(self._level_dir(level), f"{x.isoformat()}.pkl")) for x in days]
+        return concat_frames(partitions)
+
+
+def ingest_full(level: str, source: DPCSource, store: PartitionedStore, process, chunksize: int = CHUNK_SIZE):
+    '''
+        Carica nello store il file completo di un livello a blocchi di giorni completi. Ogni blocco viene
+        elaborato con process(new_raw, context), dove context sono le ultime STATS_CONTEXT_DAYS giornate
+        già elaborate, e scritto subito: in memoria restano solo un blocco e il contesto.
+    '''
+    context = None
+    for block in complete_days(source.read_chunks(level, chunksize)):
+        processed = process(block, context)
+        store.write(level, processed)
+        context = last_days(concat_frames([context, processed]), STATS_CONTEXT_DAYS)
+
+
+def update_store(level: str, source: DPCSource, store: PartitionedStore, current_date: date, process=None) -> pd.DataFrame:
+    '''
+        Aggiunge allo store i giorni nuovi pubblicati dalla sorgente e restituisce il livello completo.
+        process(new_raw, context) riceve le righe grezze dei giorni nuovi e le ultime
+        STATS_CONTEXT_DAYS partizioni già elaborate, e restituisce le righe da salvare.
+    '''
+    if process is None:
+        process = lambda new_raw, context: new_raw
+
+    last_day = store.last_day(level)
+    if last_day is None:
+        ingest_full(level, source, store, process)
+        return store.read(level)
+
+    new_days = []
+    day = last_day + timedelta(days=1)
+    while day <= current_date:
+        raw = source.read_day(level, day)
+        if raw is None:
+            break
+        new_days.append(raw)
+        day += timedelta(days=1)
+
+    if new_days:
+        context = store.read(level, since=last_day - timedelta(days=STATS_CONTEXT_DAYS - 1))
+        store.write(level, process(concat_frames(new_days), context))
+
+    return store.read(level)
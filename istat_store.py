@@ -0,0 +1,85 @@
+"""Store colonnare precompilato degli indicatori ISTAT.
+
+Tutte le serie ISTAT già pivotate (indicizzate per codice NUTS) vengono salvate come
+matrici .npy caricabili in memory map, insieme a un manifest JSON con versione,
+colonne, metadati e checksum dei file sorgente. Lo store viene ricompilato solo
+quando cambia uno dei file in ISTAT_DATA (o la versione del formato).
+"""
+
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+STORE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+SOURCE_PATTERNS = ("*.csv", "*.json", "*.zip")
+
+
+def file_checksum(path: str) -> str:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class IstatStore(object):
+    def __init__(self, source_dir: str, store_dir: str = None):
+        self.source_dir = source_dir
+        self.store_dir = store_dir or os.path.join(source_dir, "store")
+
+    def source_checksums(self) -> dict:
+        paths = sorted(set(x for pattern in SOURCE_PATTERNS for x in glob.glob(os.path.join(self.source_dir, pattern))))
+        return {os.path.basename(x): file_checksum(x) for x in paths}
+
+    def read_manifest(self):
+        path = os.path.join(self.store_dir, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def is_current(self, manifest) -> bool:
+        return (manifest is not None
+                and manifest.get("version") == STORE_VERSION
+                and manifest.get("sources") == self.source_checksums())
+
+    def write(self, series: dict, metadata: dict):
+        '''
+            series: nome -> DataFrame numerico indicizzato per codice NUTS
+            metadata: nome -> dizionario JSON (metadati dei dataset ISTAT)
+        '''
+        os.makedirs(self.store_dir, exist_ok=True)
+        manifest = {"version": STORE_VERSION, "series": {}, "metadata": metadata}
+        for name, df in series.items():
+            np.save(os.path.join(self.store_dir, f"{name}.index.npy"), np.array([str(x) for x in df.index]))
+            np.save(os.path.join(self.store_dir, f"{name}.values.npy"), np.ascontiguousarray(df.values))
+            manifest["series"][name] = {"columns": [str(x) for x in df.columns], "index_name": df.index.name}
+        #checksum calcolati dopo la compilazione: la build può generare i CSV compilati in ISTAT_DATA
+        manifest["sources"] = self.source_checksums()
+        path = os.path.join(self.store_dir, MANIFEST_NAME)
+        with open(path + ".tmp", mode="w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(path + ".tmp", path)
+        return manifest
+
+    def read_series(self, manifest, name: str) -> pd.DataFrame:
+        info = manifest["series"][name]
+        index = pd.Index(np.load(os.path.join(self.store_dir, f"{name}.index.npy")).astype(object), name=info["index_name"])
+        values = np.load(os.path.join(self.store_dir, f"{name}.values.npy"), mmap_mode="r")
+        return pd.DataFrame(values, index=index, columns=info["columns"], copy=False)
+
+    def load(self, build):
+        '''
+            Restituisce (series, metadata) dallo store, ricompilandolo con build() se i sorgenti sono cambiati.
+            build() deve restituire (series, metadata) come in write().
+        '''
+        manifest = self.read_manifest()
+        if not self.is_current(manifest):
+            manifest = self.write(*build())
+        series = {name: self.read_series(manifest, name) for name in manifest["series"]}
+        return series, manifest["metadata"]
@@ -0,0 +1,90 @@
+"""Metriche su finestre mobili di lunghezza configurabile per tutte le aree insieme.
+
+Per ogni finestra di w giorni vengono calcolate:
+    media_mobile_{w}g: media giornaliera dei nuovi casi negli ultimi w giorni
+    incidenza_{w}g_100k: nuovi casi negli ultimi w giorni ogni 100.000 abitanti (Popolazione_ETA1_Total)
+    variazione_{w}g: variazione % dei nuovi casi negli ultimi w giorni rispetto ai w precedenti
+                     (con w = 7 è la variazione settimana su settimana)
+
+totale_casi è già la somma cumulata dei nuovi casi, quindi la somma su una finestra è la
+differenza tra due valori cumulati: i valori sono disposti in una matrice aree x giorni
+(indice_giorno) e i valori w e 2w giorni prima sono letti per indice, senza rolling né
+groupby. I giorni mancanti di un'area danno NaN invece di spostare la finestra.
+I risultati di ogni finestra sono in cache per versione del dataset.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from timing import timer
+from versioned_cache import versioned_cache
+
+#finestre (giorni) delle metriche selezionabili nelle mappe, es. COVID_METRIC_WINDOWS=7,14
+METRIC_WINDOWS = tuple(int(x) for x in os.environ.get("COVID_METRIC_WINDOWS", "7,14").split(",") if x.strip())
+
+
+def window_metric_labels(windows=METRIC_WINDOWS) -> dict:
+    '''
+        Colonna -> etichetta delle metriche di ogni finestra
+    '''
+    labels = {}
+    for window in windows:
+        labels[f"media_mobile_{window}g"] = f"Nuovi casi, media mobile a {window} giorni"
+        labels[f"incidenza_{window}g_100k"] = f"Nuovi casi in {window} giorni ogni 100.000 abitanti"
+        labels[f"variazione_{window}g"] = f"Variazione % dei nuovi casi in {window} giorni rispetto ai {window} precedenti"
+    return labels
+
+
+def window_metrics(df: pd.DataFrame, area_column: str, window: int) -> pd.DataFrame:
+    '''
+        Metriche della finestra di window giorni per ogni riga di df (stesso indice), calcolate
+        per tutte le aree in un solo passaggio. Dove la finestra non è completa il valore è 0,
+        come per le altre statistiche dopo format_df.
+    '''
+    if window < 1:
+        raise Exception(f"Finestra non valida: {window}")
+    area_codes, areas = pd.factorize(df[area_column])
+    days = df["indice_giorno"].values.astype(np.int64)
+    first_day = days.min() if len(days) else 0
+    day_codes = days - first_day
+
+    cumulative = np.full((len(areas), day_codes.max() + 1 if len(days) else 0), np.nan)
+    valid = area_codes >= 0
+    cumulative[area_codes[valid], day_codes[valid]] = df["totale_casi"].values[valid]
+
+    def lagged(lag):
+        #valore cumulato lag giorni prima di ogni riga (NaN prima dell'inizio della serie)
+        values = np.full(len(df), np.nan)
+        rows = valid & (day_codes >= lag)
+        values[rows] = cumulative[area_codes[rows], day_codes[rows] - lag]
+        return values
+
+    current = np.where(valid, df["totale_casi"].values, np.nan).astype(np.float64)
+    previous, before_previous = lagged(window), lagged(2 * window)
+    window_cases = current - previous
+    previous_cases = previous - before_previous
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        metrics = pd.DataFrame({
+            f"media_mobile_{window}g": window_cases / window,
+            f"incidenza_{window}g_100k": window_cases / df["Popolazione_ETA1_Total"].values * 100000,
+            f"variazione_{window}g": (window_cases / previous_cases - 1) * 100,
+        }, index=df.index)
+    metrics = metrics.mask(~np.isfinite(metrics), 0)
+    return metrics.astype(np.float32)
+
+
+@timer.timed()
+@versioned_cache(max_entries=16, ignore=("df",))
+def get_window_metrics(version, area_column, window, df):
+    return window_metrics(df, area_column, window)
+
+
+def add_window_metrics(version, df: pd.DataFrame, area_column: str, windows=METRIC_WINDOWS) -> pd.DataFrame:
+    '''
+        Copia di df con le metriche di tutte le finestre (ogni finestra letta dalla cache della versione)
+    '''
+    frames = [get_window_metrics(version, area_column, window, df) for window in windows]
+    return pd.concat([df] + frames, axis=1)
@@ -0,0 +1,171 @@
+"""Aggiornamento dei dati in background con sostituzione atomica dello snapshot.
+
+Un thread controlla periodicamente la sorgente e, quando ci sono dati nuovi (o lo
+snapshot è più vecchio di max_age), costruisce il dataset successivo fuori dal rerun
+streamlit. Lo snapshot pubblicato viene sostituito con un solo assegnamento: le sessioni
+leggono sempre uno snapshot completo e non aspettano mai un aggiornamento, solo la
+prima costruzione all'avvio del processo. Dopo ogni sostituzione il thread può
+preparare il necessario per la nuova versione (on_refresh), per esempio le figure più
+richieste, così i rerun le trovano già in cache.
+"""
+
+import logging
+import threading
+import time
+import traceback
+from datetime import date, datetime
+
+logger = logging.getLogger(__name__)
+
+#un refresher per nome e per processo, condiviso da tutti i rerun e da tutte le sessioni
+_refreshers = {}
+_refreshers_lock = threading.Lock()
+
+
+class DatasetSnapshot(object):
+    def __init__(self, data, version: str, built_at: datetime, build_time: float):
+        self.data = data
+        self.version = version
+        self.built_at = built_at
+        self.build_time = build_time
+
+
+class DatasetRefresher(object):
+    def __init__(self, build, version, has_new_data, interval: float = 600, max_age: float = 6 * 3600, on_refresh=None):
+        '''
+            build(current_date): costruisce i dati (può impiegare minuti)
+            version(data): identificativo della versione dei dati
+            has_new_data(snapshot): True se la sorgente ha dati più recenti dello snapshot (controllo economico)
+            interval: secondi tra un controllo e il successivo
+            max_age: secondi dopo i quali lo snapshot viene ricostruito anche senza giorni nuovi
+                     (la sorgente può correggere i dati già pubblicati)
+            on_refresh(snapshot): chiamata dal thread del refresher dopo la pubblicazione di ogni snapshot
+        '''
+        self.build = build
+        self.version = version
+        self.has_new_data = has_new_data
+        self.interval = interval
+        self.max_age = max_age
+        self.on_refresh = on_refresh
+
+        self._snapshot = None
+        #impostato dopo il primo tentativo di costruzione, riuscito o no
+        self._attempted = threading.Event()
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.last_attempt = None
+        self.last_refresh = None
+        self.last_duration = None
+        self.last_error = None
+        self.last_error_at = None
+        self.refreshes = 0
+        self.failures = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="dataset-refresher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        self.refresh()
+        while not self._stop.wait(self.interval):
+            self.refresh_if_needed()
+
+    def snapshot(self, timeout: float = None) -> DatasetSnapshot:
+        '''
+            Snapshot pubblicato; aspetta solo se non ne è ancora stato costruito nessuno.
+            Se non c'è uno snapshot perché la costruzione è fallita viene sollevato l'errore.
+        '''
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        self.start()
+        if not self._attempted.wait(timeout):
+            raise Exception("timeout in attesa del primo snapshot del dataset")
+        if self._snapshot is None:
+            raise Exception(f"costruzione del dataset non riuscita:\n{self.last_error}")
+        return self._snapshot
+
+    def is_stale(self) -> bool:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return True
+        if (datetime.now() - snapshot.built_at).total_seconds() >= self.max_age:
+            return True
+        return self.has_new_data(snapshot)
+
+    def refresh_if_needed(self) -> bool:
+        try:
+            stale = self.is_stale()
+        except Exception:
+            self._record_failure()
+            return False
+        return self.refresh() if stale else False
+
+    def refresh(self) -> bool:
+        '''
+            Costruisce un nuovo snapshot e lo pubblica; in caso di errore resta pubblicato quello precedente
+        '''
+        with self._refresh_lock:
+            self.last_attempt = datetime.now()
+            start = time.perf_counter()
+            try:
+                data = self.build(date.today())
+                snapshot = DatasetSnapshot(data, self.version(data), datetime.now(), time.perf_counter() - start)
+            except Exception:
+                self._record_failure()
+                self._attempted.set()
+                return False
+
+            #sostituzione atomica: un solo assegnamento di riferimento
+            self._snapshot = snapshot
+            self.last_refresh = snapshot.built_at
+            self.last_duration = snapshot.build_time
+            self.refreshes += 1
+            self._attempted.set()
+
+        if self.on_refresh is not None:
+            #lo snapshot è già pubblicato: un errore qui non rende fallito l'aggiornamento
+            try:
+                self.on_refresh(snapshot)
+            except Exception:
+                logger.exception("preparazione dello snapshot %s non riuscita", snapshot.version)
+        return True
+
+    def _record_failure(self):
+        self.failures += 1
+        self.last_error = traceback.format_exc(limit=5)
+        self.last_error_at = datetime.now()
+        #l'errore resta in status(); sul log del server va con il traceback completo
+        logger.exception("aggiornamento del dataset non riuscito")
+
+    def status(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version if snapshot else None,
+            "last_attempt": self.last_attempt,
+            "last_refresh": self.last_refresh,
+            "last_duration": self.last_duration,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_error_at": self.last_error_at,
+            "interval": self.interval,
+        }
+
+
+def get_refresher(name: str, factory) -> DatasetRefresher:
+    '''
+        Refresher avviato con factory() alla prima richiesta e poi riutilizzato
+    '''
+    with _refreshers_lock:
+        refresher = _refreshers.get(name)
+        if refresher is None:
+            refresher = _refreshers[name] = factory().start()
+    return refresher
@@ -0,0 +1,149 @@
+"""Aggregazione delle aree DPC lungo una gerarchia dichiarativa (provincia -> regione -> ripartizione -> nazione).
+
+La gerarchia è costruita dalle tabelle di conversione: ogni regione (con la
+denominazione usata dalla Protezione Civile) ha il suo codice NUTS in
+codici_regioni.CSV, e il prefisso NUTS1 del codice indica la ripartizione. Le righe
+delle province riportano già la regione di appartenenza (anche quelle "In fase di
+definizione/aggiornamento", che nella tabella delle province non ci sono), quindi
+qualsiasi livello si aggrega in qualsiasi genitore passando per denominazione_regione.
+
+Oltre ai livelli standard si possono aggregare gruppi definiti dall'utente
+(gruppo -> lista di regioni), come le macro-aree o il Trentino Alto Adige.
+L'aggregazione è una sola riduzione raggruppata per (genitore, data) con una regola
+(somma, media, primo valore) per ogni colonna; le colonne derivate (tassi,
+incrementi) non vengono aggregate ma vanno ricalcolate sul risultato.
+"""
+
+import numpy as np
+import pandas as pd
+
+#ripartizioni geografiche ISTAT per prefisso NUTS1 (classificazione delle tabelle di conversione)
+RIPARTIZIONI = {"ITC": "Nord-Ovest", "ITD": "Nord-Est", "ITE": "Centro", "ITF": "Sud", "ITG": "Isole"}
+
+NAZIONE = "Italia"
+
+#gruppi definiti dall'utente: nome del gruppo -> regioni (denominazione DPC)
+TRENTINO_ALTO_ADIGE = {"Trentino Alto Adige": ["P.A. Bolzano", "P.A. Trento"]}
+MACRO_AREE = {
+    "Nord": ["Piemonte", "Valle d'Aosta", "Lombardia", "P.A. Bolzano", "P.A. Trento", "Veneto",
+             "Friuli Venezia Giulia", "Liguria", "Emilia-Romagna"],
+    "Centro": ["Toscana", "Umbria", "Marche", "Lazio"],
+    "Sud": ["Abruzzo", "Molise", "Campania", "Puglia", "Basilicata", "Calabria", "Sicilia", "Sardegna"],
+}
+
+#regole di aggregazione delle colonne DPC; le altre colonne vengono scartate
+AGGREGATION_RULES = {
+    "stato": "first",
+    "codice_regione": "first",
+    "lat": "mean",
+    "long": "mean",
+    "lon": "mean",
+    "ricoverati_con_sintomi": "sum",
+    "terapia_intensiva": "sum",
+    "totale_ospedalizzati": "sum",
+    "isolamento_domiciliare": "sum",
+    "totale_positivi": "sum",
+    "variazione_totale_positivi": "sum",
+    "nuovi_positivi": "sum",
+    "dimessi_guariti": "sum",
+    "deceduti": "sum",
+    "totale_casi": "sum",
+    "tamponi": "sum",
+}
+#colonne ISTAT unite ai dati DPC: la popolazione di un'area è la somma di quella delle sue parti
+SUM_PREFIXES = ("Popolazione_",)
+
+#colonne confrontate con la serie nazionale ufficiale
+NATIONAL_COLUMNS = ["ricoverati_con_sintomi", "terapia_intensiva", "totale_ospedalizzati", "isolamento_domiciliare",
+                    "totale_positivi", "variazione_totale_positivi", "nuovi_positivi", "dimessi_guariti",
+                    "deceduti", "totale_casi", "tamponi"]
+
+
+def get_hierarchy(conversioni_regioni: pd.DataFrame) -> pd.DataFrame:
+    '''
+        Gerarchia delle regioni dalla tabella codici_regioni: indice denominazione_regione,
+        colonne regione, ripartizione e nazione
+    '''
+    regioni = conversioni_regioni.reset_index()
+    ripartizioni = regioni["NUTS3"].str[:3].map(RIPARTIZIONI)
+    if ripartizioni.isna().any():
+        raise Exception(f"Codici NUTS senza ripartizione: {regioni['NUTS3'][ripartizioni.isna()].tolist()}")
+    return pd.DataFrame({
+        "regione": regioni["denominazione_regione"].values,
+        "ripartizione": ripartizioni.values,
+        "nazione": NAZIONE,
+    }, index=regioni["denominazione_regione"].values)
+
+
+def parent_index(hierarchy: pd.DataFrame, parent) -> pd.Series:
+    '''
+        Regione -> area genitore: parent è un livello della gerarchia ("regione", "ripartizione",
+        "nazione") oppure un dizionario di gruppi definiti dall'utente (gruppo -> regioni)
+    '''
+    if isinstance(parent, dict):
+        parents = pd.Series({regione: gruppo for gruppo, regioni in parent.items() for regione in regioni})
+        unknown = parents.index.difference(hierarchy.index)
+        if len(unknown):
+            raise Exception(f"Regioni sconosciute nei gruppi: {unknown.tolist()}")
+        return parents
+    if parent not in hierarchy.columns:
+        raise Exception(f"Livello sconosciuto: {parent}")
+    return hierarchy[parent]
+
+
+def aggregation_rules(columns) -> dict:
+    return {x: AGGREGATION_RULES.get(x, "sum") for x in columns
+            if x in AGGREGATION_RULES or x.startswith(SUM_PREFIXES)}
+
+
+def rollup(df: pd.DataFrame, parents: pd.Series, area_column: str = "denominazione_regione") -> pd.DataFrame:
+    '''
+        Aggrega le righe di df (province o regioni) nelle aree genitore per ogni data, in una sola
+        riduzione raggruppata. parents mappa denominazione_regione -> area (vedi parent_index);
+        le righe di regioni fuori da parents vengono ignorate. Il risultato ha le colonne aggregabili
+        di df più area_column con il nome dell'area genitore.
+    '''
+    keys = df["denominazione_regione"].astype(object).map(parents)
+    rows = keys.notna().values
+    rules = aggregation_rules(df.columns)
+    columns = {}
+    for column in rules:
+        values = df[column].values[rows]
+        #i conteggi compattati (int8/int16) sommati su più aree non devono andare in overflow
+        if rules[column] == "sum" and np.issubdtype(values.dtype, np.integer):
+            values = values.astype(np.int64)
+        elif rules[column] == "sum" and np.issubdtype(values.dtype, np.floating):
+            values = values.astype(np.float64)
+        columns[column] = values
+    columns[area_column] = keys.values[rows]
+    columns["data"] = df["data"].values[rows]
+
+    aggregated = pd.DataFrame(columns).groupby([area_column, "data"], sort=True).agg(rules)
+    aggregated = aggregated.reset_index()
+    return aggregated[["data", area_column] + [x for x in df.columns if x in rules and x != area_column]]
+
+
+def check_consistency(derived: pd.DataFrame, official: pd.DataFrame, columns: list = None, tolerance: float = 0) -> pd.DataFrame:
+    '''
+        Confronta per data la serie aggregata con quella ufficiale: una riga per ogni
+        (data, colonna) in cui la differenza assoluta supera tolerance, e per le date presenti
+        in una sola delle due serie
+    '''
+    columns = [x for x in (columns or NATIONAL_COLUMNS) if x in derived and x in official]
+    derived = derived.groupby("data")[columns].sum()
+    official = official.groupby("data")[columns].sum()
+    joined = derived.join(official, how="outer", lsuffix="_derivato", rsuffix="_ufficiale")
+
+    mismatches = []
+    for column in columns:
+        derived_values, official_values = joined[f"{column}_derivato"], joined[f"{column}_ufficiale"]
+        difference = derived_values - official_values
+        wrong = difference.abs().gt(tolerance) | derived_values.isna() | official_values.isna()
+        mismatches.append(pd.DataFrame({
+            "data": joined.index[wrong],
+            "colonna": column,
+            "derivato": derived_values[wrong].values,
+            "ufficiale": official_values[wrong].values,
+            "differenza": difference[wrong].values,
+        }))
+    return pd.concat(mismatches, ignore_index=True).sort_values(["data", "colonna"]).reset_index(drop=True)
@@ -0,0 +1,175 @@
+"""Stima del numero di riproduzione Rt per tutte le regioni e le province (metodo di Cori et al. 2013).
+
+Il modello di rinnovo assume che i nuovi casi del giorno t siano Poisson con media
+Rt * Λt, dove Λt = Σs ws * I(t-s) è l'infettività totale: i casi dei giorni precedenti
+pesati con la distribuzione discreta dell'intervallo seriale w (gamma con media e
+deviazione standard configurabili). Con un prior Gamma(a, scala b) su Rt, costante in
+una finestra di tau giorni, la posterior è Gamma(a + ΣI, scala 1 / (1/b + ΣΛ)) con le
+somme sulla finestra.
+
+Tutte le aree sono elaborate insieme come matrice aree x giorni: Λ è una somma di
+S matrici traslate, le somme sulle finestre sono differenze di somme cumulate e media
+e intervallo di credibilità della posterior sono calcolati in un'unica chiamata
+vettorizzata. Con molte aree (province) le righe della matrice vengono divise tra i
+processi di un pool. Dove i casi nella finestra sono meno di RT_MIN_CASES la stima non
+è affidabile e vale NaN.
+"""
+
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from timing import timer
+from versioned_cache import versioned_cache
+
+#intervallo seriale "media,deviazione standard" in giorni (default: stima sui focolai lombardi, Cereda et al. 2020)
+SERIAL_INTERVAL = tuple(float(x) for x in os.environ.get("COVID_RT_SERIAL_INTERVAL", "6.6,4.88").split(","))
+#giorni della finestra in cui Rt è considerato costante
+RT_WINDOW = int(os.environ.get("COVID_RT_WINDOW", "7"))
+#prior Gamma(forma, scala) di Rt, come nell'implementazione di riferimento EpiEstim
+RT_PRIOR = (1.0, 5.0)
+#casi minimi nella finestra per considerare affidabile la stima
+RT_MIN_CASES = 12
+RT_CONFIDENCE = 0.95
+#sotto questo numero di celle (aree x giorni) l'avvio dei processi costa più del calcolo. Misurato con
+#1000 giorni: in serie ~2.8 µs per cella, il pool spawn aggiunge 2.5-3.5 s fissi (avvio, import di scipy,
+#pickling delle righe), quindi con 2 processi conviene da ~2 milioni di celle (140 aree: 0.4 s in serie)
+RT_PARALLEL_CELLS = 2000000
+#aree elaborate da ogni processo
+RT_CHUNK_SIZE = 32
+
+RT_COLUMNS = ["rt", "rt_low", "rt_high"]
+
+
+def serial_interval_distribution(mean: float, sd: float, coverage: float = 0.999) -> np.array:
+    '''
+        Pesi w1..wS dell'intervallo seriale: gamma con media e sd date arrotondata al giorno più
+        vicino (ws = P(s-0.5 < x <= s+0.5), con la massa sotto 1.5 in w1 perché l'intervallo è
+        di almeno un giorno) fino a coverage della massa, normalizzati a 1
+    '''
+    if mean <= 0 or sd <= 0:
+        raise Exception(f"Intervallo seriale non valido: media {mean}, sd {sd}")
+    distribution = stats.gamma(a=(mean / sd) ** 2, scale=sd ** 2 / mean)
+    days = max(1, int(math.ceil(distribution.ppf(coverage))))
+    boundaries = np.concatenate([[0], np.arange(1, days + 1) + 0.5])
+    weights = np.diff(distribution.cdf(boundaries))
+    return weights / weights.sum()
+
+
+def window_sums(matrix: np.array, window: int) -> np.array:
+    '''
+        Somma sugli ultimi window giorni (colonne) di ogni riga, con finestre incomplete all'inizio
+    '''
+    cumulative = np.cumsum(matrix, axis=1)
+    sums = cumulative.copy()
+    sums[:, window:] -= cumulative[:, :-window]
+    return sums
+
+
+def estimate_rt(incidence: np.array, weights: np.array, window: int = RT_WINDOW, prior=RT_PRIOR,
+                min_cases: float = RT_MIN_CASES, confidence: float = RT_CONFIDENCE):
+    '''
+        Media e intervallo di credibilità della posterior di Rt per ogni cella di incidence
+        (aree x giorni di nuovi casi): tre matrici con la stessa forma, NaN dove la stima non è affidabile
+    '''
+    #infettività totale: Λt = Σs ws I(t-s), una traslazione della matrice per ogni giorno dell'intervallo seriale
+    infectiousness = np.zeros_like(incidence)
+    for lag, weight in enumerate(weights, start=1):
+        if lag >= incidence.shape[1]:
+            break
+        infectiousness[:, lag:] += weight * incidence[:, :-lag]
+
+    cases = window_sums(incidence, window)
+    shape = prior[0] + cases
+    rate = 1 / prior[1] + window_sums(infectiousness, window)
+    reliable = (cases >= min_cases) & (np.arange(incidence.shape[1]) >= window)
+
+    mean = np.where(reliable, shape / rate, np.nan)
+    tail = (1 - confidence) / 2
+    low = np.where(reliable, stats.gamma.ppf(tail, shape, scale=1 / rate), np.nan)
+    high = np.where(reliable, stats.gamma.ppf(1 - tail, shape, scale=1 / rate), np.nan)
+    return mean, low, high
+
+
+def rt_chunk(incidence: np.array, weights: np.array, window: int, prior, min_cases: float, confidence: float) -> np.array:
+    #funzione di modulo: con spawn i processi del pool la importano da qui
+    return np.stack(estimate_rt(incidence, weights, window, prior, min_cases, confidence))
+
+
+def batch_rt(incidence: np.array, weights: np.array, window: int = RT_WINDOW, prior=RT_PRIOR, min_cases: float = RT_MIN_CASES,
+             confidence: float = RT_CONFIDENCE, processes: int = None, chunk_size: int = RT_CHUNK_SIZE):
+    '''
+        estimate_rt con le righe (aree) divise in gruppi di chunk_size distribuiti su un pool di
+        processi: con processes=None solo da RT_PARALLEL_CELLS celle in su e con più di una CPU,
+        con processes=1 mai.
+        Le aree sono indipendenti, quindi il risultato non dipende dalla divisione.
+    '''
+    chunks = [chunk for chunk in np.array_split(np.arange(len(incidence)), max(1, math.ceil(len(incidence) / chunk_size))) if len(chunk)]
+    args = [(incidence[chunk], weights, window, prior, min_cases, confidence) for chunk in chunks]
+    parallel = processes != 1 and (processes is not None or (incidence.size >= RT_PARALLEL_CELLS and (os.cpu_count() or 1) > 1))
+    if parallel and len(chunks) > 1:
+        #spawn: il server streamlit ha thread attivi e un fork potrebbe copiare lock acquisiti
+        with ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(rt_chunk, *zip(*args)))
+    else:
+        results = [rt_chunk(*x) for x in args]
+
+    if not results:
+        empty = np.empty(incidence.shape)
+        return empty, empty, empty
+    mean, low, high = np.concatenate(results, axis=1)
+    return mean, low, high
+
+
+def incidence_matrix(df: pd.DataFrame, area_column: str):
+    '''
+        Nuovi casi per area e giorno (aree x giorni dal primo indice_giorno) da totale_casi,
+        con area_codes e day_codes di ogni riga di df. I giorni mancanti ripetono il totale
+        precedente e le correzioni al ribasso del totale non danno casi negativi.
+    '''
+    area_codes, areas = pd.factorize(df[area_column])
+    days = df["indice_giorno"].values.astype(np.int64)
+    day_codes = days - (days.min() if len(days) else 0)
+    valid = area_codes >= 0
+
+    cumulative = np.full((len(areas), day_codes.max() + 1 if len(days) else 0), np.nan)
+    cumulative[area_codes[valid], day_codes[valid]] = df["totale_casi"].values[valid]
+    cumulative = pd.DataFrame(cumulative).ffill(axis=1).fillna(0).values
+    #il primo giorno di ogni area conta i casi accumulati fino ad allora
+    incidence = np.diff(cumulative, axis=1, prepend=0)
+    return np.clip(incidence, 0, None), areas, area_codes, day_codes
+
+
+def rt_frame(df: pd.DataFrame, area_column: str, serial_interval=SERIAL_INTERVAL, window: int = RT_WINDOW, processes: int = None) -> pd.DataFrame:
+    '''
+        Rt (media e intervallo di credibilità) di ogni riga di df, con lo stesso indice
+    '''
+    incidence, _, area_codes, day_codes = incidence_matrix(df, area_column)
+    weights = serial_interval_distribution(*serial_interval)
+    mean, low, high = batch_rt(incidence, weights, window, processes=processes)
+
+    valid = area_codes >= 0
+    columns = {}
+    for column, matrix in zip(RT_COLUMNS, (mean, low, high)):
+        values = np.full(len(df), np.nan)
+        values[valid] = matrix[area_codes[valid], day_codes[valid]]
+        columns[column] = values.astype(np.float32)
+    return pd.DataFrame(columns, index=df.index)
+
+
+@timer.timed()
+@versioned_cache(max_entries=4, ignore=("df",))
+def get_rt(version, area_column, df):
+    return rt_frame(df, area_column)
+
+
+def add_rt(version, df: pd.DataFrame, area_column: str) -> pd.DataFrame:
+    '''
+        Copia di df con le colonne di Rt (lette dalla cache della versione)
+    '''
+    return pd.concat([df, get_rt(version, area_column, df)], axis=1)
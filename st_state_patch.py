@@ -72,12 +72,28 @@ exact State object you want:
     s1 = st.State(key="user metadata")
 
     print(s0 == s1)  # Prints True
+
+
+Lifecycle
+---------
+
+Global states live in a store bounded to GLOBAL_STATE_MAX_ENTRIES objects: when
+it is full the least recently used state is evicted. The state of a session is
+dropped when the session disconnects (checked every time a new session shows up,
+or explicitly with evict_disconnected_sessions()).
+
+To see how many states exist and roughly how much memory they hold:
+
+    import st_state_patch
+    st_state_patch.state_stats()
 """
 
 import inspect
 import os
 import threading
 import collections
+import pickle
+import weakref
 
 from streamlit.server.Server import Server
 import streamlit as st
@@ -89,6 +105,22 @@ import streamlit.ReportThread as ReportThread
 import sys
 GLOBAL_CONTAINER = sys
 
+# Sessions already looked up, by report context (see _context_key). Entries go
+# away on their own when Streamlit drops the session.
+_sessions_by_context = weakref.WeakValueDictionary()
+_sessions_lock = threading.Lock()
+
+_THIS_FILE = inspect.currentframe().f_code.co_filename
+
+# Global State objects kept at most; the least recently used ones are evicted.
+GLOBAL_STATE_MAX_ENTRIES = 1000
+
+_global_lock = threading.Lock()
+
+# Sessions that have a _session_state, so they can be inspected and cleaned up
+# when they disconnect.
+_sessions_with_state = weakref.WeakSet()
+
 
 class State(object):
     def __new__(cls, key=None, is_global=False):
@@ -100,6 +132,10 @@ class State(object):
         if key is None:
             key = _figure_out_key(key_counts)
 
+        if is_global:
+            with _global_lock:
+                return _get_or_create_global(cls, states_dict, key)
+
         if key in states_dict:
             return states_dict[key]
 
@@ -118,12 +154,34 @@ class State(object):
         return name in self.__dict__
 
 
+def _get_or_create_global(cls, states_dict, key):
+    if key in states_dict:
+        states_dict.move_to_end(key)
+        return states_dict[key]
+
+    state = super(State, cls).__new__(cls)
+    states_dict[key] = state
+
+    while len(states_dict) > GLOBAL_STATE_MAX_ENTRIES:
+        states_dict.popitem(last=False)
+        GLOBAL_CONTAINER._global_state_evictions += 1
+
+    return state
+
+
 def _get_global_state():
     if not hasattr(GLOBAL_CONTAINER, '_global_state'):
-        GLOBAL_CONTAINER._global_state = {}
-        GLOBAL_CONTAINER._key_counts = collections.defaultdict(int)
+        GLOBAL_CONTAINER._global_state = collections.OrderedDict()
+        GLOBAL_CONTAINER._global_state_evictions = 0
+
+    curr_thread = threading.current_thread()
+
+    if not hasattr(curr_thread, '_global_key_counts'):
+        # Like the session key counts: a process-wide counter would give every
+        # rerun new keys, and so a new global State each time.
+        curr_thread._global_key_counts = collections.defaultdict(int)
 
-    return GLOBAL_CONTAINER._global_state, GLOBAL_CONTAINER._key_counts
+    return GLOBAL_CONTAINER._global_state, curr_thread._global_key_counts
 
 
 def _get_session_state():
@@ -133,6 +191,7 @@ def _get_session_state():
 
     if not hasattr(session, '_session_state'):
         session._session_state = {}
+        _sessions_with_state.add(session)
 
     if not hasattr(curr_thread, '_key_counts'):
         # Put this in the thread because it gets cleared on every run.
@@ -146,24 +205,57 @@ def _get_session_object():
 
     ctx = ReportThread.get_report_ctx()
 
-    this_session = None
-    
+    # Constant-time lookup: sessions are registered the first time they are seen,
+    # and a hit is validated with the same check used by the full scan.
+    key = _context_key(ctx)
+    this_session = _sessions_by_context.get(key)
+    if this_session is not None and _session_matches(this_session, ctx):
+        return this_session
+
+    this_session = _find_session_object(ctx)
+    with _sessions_lock:
+        _sessions_by_context[key] = this_session
+
+    # A session seen for the first time is a good moment to drop the state of
+    # the ones that went away.
+    evict_disconnected_sessions()
+
+    return this_session
+
+
+def _context_key(ctx):
+    # Streamlit >= 0.54.0: ctx.enqueue is the session's bound method, its owner
+    # identifies the session. Streamlit < 0.54.0: the main DeltaGenerator does.
+    owner = getattr(ctx.enqueue, '__self__', None) if hasattr(ctx, 'enqueue') else None
+    if owner is not None:
+        return id(owner)
+    return id(ctx.main_dg)
+
+
+def _session_matches(s, ctx):
+    return (
+        # Streamlit < 0.54.0
+        (hasattr(s, '_main_dg') and s._main_dg == ctx.main_dg)
+        or
+        # Streamlit >= 0.54.0
+        (not hasattr(s, '_main_dg') and s.enqueue == ctx.enqueue)
+    )
+
+
+def _get_session_infos():
     current_server = Server.get_current()
     if hasattr(current_server, '_session_infos'):
         # Streamlit < 0.56        
-        session_infos = Server.get_current()._session_infos.values()
-    else:
-        session_infos = Server.get_current()._session_info_by_id.values()
+        return list(current_server._session_infos.values())
+    return list(current_server._session_info_by_id.values())
 
-    for session_info in session_infos:
+
+def _find_session_object(ctx):
+    this_session = None
+
+    for session_info in _get_session_infos():
         s = session_info.session
-        if (
-            # Streamlit < 0.54.0
-            (hasattr(s, '_main_dg') and s._main_dg == ctx.main_dg)
-            or
-            # Streamlit >= 0.54.0
-            (not hasattr(s, '_main_dg') and s.enqueue == ctx.enqueue)
-        ):
+        if _session_matches(s, ctx):
             this_session = s
 
     if this_session is None:
@@ -175,24 +267,21 @@ def _get_session_object():
 
 
 def _figure_out_key(key_counts):
-    stack = inspect.stack()
+    # Walk the frames directly: inspect.stack() would also read the source
+    # context of every frame, which is by far the most expensive part.
+    frame = sys._getframe(0)
+    stack_pos = 0
 
-    for stack_pos, stack_item in enumerate(stack):
-        filename = stack_item[1]
-        if filename != __file__:
-            break
-        else:
-            stack_item = None
+    while frame is not None and frame.f_code.co_filename == _THIS_FILE:
+        frame = frame.f_back
+        stack_pos += 1
 
-    if stack_item is None:
+    if frame is None:
         return None
 
     # Just breaking these out for readability.
-    #frame_id = id(stack_item[0])
-    filename = stack_item[1]
-    # line_no = stack_item[2]
-    func_name = stack_item[3]
-    # code_context = stack_item[4]
+    filename = frame.f_code.co_filename
+    func_name = frame.f_code.co_name
 
     key = "%s :: %s :: %s" % (filename, func_name, stack_pos)
 
@@ -204,6 +293,52 @@ def _figure_out_key(key_counts):
     return key
 
 
+def evict_disconnected_sessions():
+    """Drop the state of sessions that are no longer known to the server.
+
+    Returns the number of sessions cleaned up.
+    """
+    live = {id(session_info.session) for session_info in _get_session_infos()}
+    evicted = 0
+
+    for session in list(_sessions_with_state):
+        if id(session) not in live:
+            session.__dict__.pop('_session_state', None)
+            _sessions_with_state.discard(session)
+            evicted += 1
+
+    return evicted
+
+
+def _approx_size(state):
+    size = sys.getsizeof(state)
+    for value in state.__dict__.values():
+        try:
+            size += len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+        except Exception:
+            size += sys.getsizeof(value)
+    return size
+
+
+def state_stats():
+    """Number of State objects and a rough estimate of the bytes they hold."""
+    global_states = list(getattr(GLOBAL_CONTAINER, '_global_state', {}).values())
+    sessions = list(_sessions_with_state)
+    session_states = [
+        state for session in sessions
+        for state in list(getattr(session, '_session_state', {}).values())]
+
+    return {
+        'global_states': len(global_states),
+        'global_bytes': sum(_approx_size(x) for x in global_states),
+        'global_max_entries': GLOBAL_STATE_MAX_ENTRIES,
+        'global_evictions': getattr(GLOBAL_CONTAINER, '_global_state_evictions', 0),
+        'sessions': len(sessions),
+        'session_states': len(session_states),
+        'session_bytes': sum(_approx_size(x) for x in session_states),
+    }
+
+
 class SessionState(object):
     def __new__(cls, key=None):
         return State(key=key, is_global=False)
@@ -0,0 +1,133 @@
+"""Misura dei tempi delle fasi dell'app (costruzione del dataset, figure, invio dei grafici).
+
+Ogni fase misurata produce un record con nome, durata, esito della cache (se la fase
+ne usa una), thread e rerun di appartenenza. I record restano in memoria per il pannello
+di debug nella sidebar e, se configurato, vengono scritti come righe JSON.
+
+La misura si attiva con COVID_TIMING; COVID_TIMING_LOG indica il file JSONL ("-" per
+stdout). Se è disattivata stage() restituisce un context manager vuoto e timed() lascia
+la funzione decorata invariata, quindi il costo è trascurabile.
+"""
+
+import contextlib
+import functools
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+import pandas as pd
+
+TIMING_ENABLED = bool(os.environ.get("COVID_TIMING"))
+TIMING_LOG = os.environ.get("COVID_TIMING_LOG")
+
+
+class _NullStage(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class StageTimer(object):
+    def __init__(self, enabled: bool = False, log_path: str = None, max_records: int = 2000):
+        self.enabled = enabled
+        self.log_path = log_path
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._runs = itertools.count(1)
+
+    def begin_run(self) -> int:
+        '''
+            Inizia un nuovo rerun nel thread corrente: i record successivi del thread vi appartengono
+        '''
+        self._local.run = next(self._runs)
+        return self._local.run
+
+    def current_run(self):
+        return getattr(self._local, "run", None)
+
+    def stage(self, name: str, cache=None, **fields):
+        '''
+            Context manager che misura una fase; cache (con last_hit()) indica l'esito della cache usata
+        '''
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._measure(name, cache, fields)
+
+    @contextlib.contextmanager
+    def _measure(self, name, cache, fields):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, hit=cache.last_hit() if cache is not None else None, **fields)
+
+    def timed(self, name: str = None):
+        '''
+            Decoratore: misura ogni chiamata della funzione; per le funzioni con @versioned_cache
+            registra anche se il valore veniva dalla cache
+        '''
+        def decorator(func):
+            if not self.enabled:
+                return func
+            stage_name = name or func.__name__
+            cache = getattr(func, "cache", None)
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self._measure(stage_name, cache, {}):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, name: str, seconds: float, hit=None, **fields):
+        record = dict(fields, stage=name, seconds=seconds, hit=hit, run=self.current_run(),
+                      thread=threading.current_thread().name, time=datetime.now())
+        with self._lock:
+            self._records.append(record)
+            if self.log_path:
+                self._write(record)
+
+    def _write(self, record):
+        line = json.dumps(record, default=lambda x: x.isoformat() if isinstance(x, datetime) else str(x)) + "\n"
+        if self.log_path == "-":
+            sys.stdout.write(line)
+            return
+        try:
+            with open(self.log_path, mode="a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError:
+            #il log dei tempi non deve mai interrompere l'app
+            pass
+
+    def records(self, run=None, thread: str = None) -> list:
+        with self._lock:
+            records = list(self._records)
+        return [x for x in records if (run is None or x["run"] == run) and (thread is None or x["thread"] == thread)]
+
+
+def timing_table(records: list) -> pd.DataFrame:
+    '''
+        Tabella dei record per il pannello di debug: fase, dettagli, millisecondi ed esito della cache
+    '''
+    details = [", ".join(f"{k}={v}" for k, v in x.items() if k not in ("stage", "seconds", "hit", "run", "thread", "time") and v is not None)
+               for x in records]
+    return pd.DataFrame({
+        "Fase": [x["stage"] for x in records],
+        "Dettagli": details,
+        "ms": [round(x["seconds"] * 1000, 1) for x in records],
+        "Cache": ["" if x["hit"] is None else ("hit" if x["hit"] else "miss") for x in records],
+    })
+
+
+timer = StageTimer(enabled=TIMING_ENABLED, log_path=TIMING_LOG)
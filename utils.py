@@ -1,6 +1,9 @@
 import difflib
+import glob
+import hashlib
 import json
 import os
+import tempfile
 from zipfile import ZipFile
 from datetime import datetime, timedelta, date
 
@@ -9,11 +12,38 @@ from scipy import stats
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-import streamlit as st
 from typing import List,Dict
 
+from dataset_cache import DatasetCache, fingerprint
+from ingestion import DPC_DATE_FORMAT, DPC_URL, DPCSource, PartitionedStore, update_store
+from frame_memory import compact_frame, format_memory_report, memory_report
+from geo_index import RegionGeometryIndex
+from geojson_tools import SOURCES as GEOJSON_SOURCES
+from geojson_tools import compact_path
+from istat_store import IstatStore, file_checksum
+from rollup import TRENTINO_ALTO_ADIGE, get_hierarchy, parent_index, rollup
+from timing import timer
+from versioned_cache import versioned_cache
+
 viridis = ((0.0, '#440154'), (0.1111111111, '#482878'), (0.2222222222, '#3e4989'), (0.3333333333, '#31688e'), (0.4444444444, '#26828e'), (0.5555555555, '#1f9e89'), (0.6666666666, '#35b779'), (0.7777777777, '#6ece58'), (0.8888888888, '#b5de2b'), (1.0, '#fde725'))
 
+#sorgente dei dati DPC (url o cartella locale) e store partizionato per l'ingestione incrementale
+DATA_SOURCE = os.environ.get("COVID_DATA_SOURCE", DPC_URL)
+DATA_STORE_DIR = os.environ.get("COVID_DATA_STORE")
+#cartella della cache del dataset elaborato, indicizzata per contenuto degli input ("" per disattivarla)
+DATASET_CACHE_DIR = os.environ.get("COVID_DATASET_CACHE", "dataset_cache")
+#livelli DPC letti dalla pipeline: la serie nazionale si ricava dalle regioni (national_series)
+DATASET_LEVELS = ("province", "regioni")
+#input della pipeline oltre ai CSV DPC e ai file ISTAT: se cambiano, il dataset in cache non vale più
+DATASET_INPUT_FILES = ("codici_province.CSV", "codici_regioni.CSV", "utils.py", "ingestion.py", "frame_memory.py", "istat_store.py")
+#se impostata, al caricamento dei dati viene stampato il report sulla memoria dei frame
+MEMORY_REPORT = os.environ.get("COVID_MEMORY_REPORT")
+#secondi tra due controlli della sorgente e età massima dello snapshot per l'aggiornamento in background
+REFRESH_INTERVAL = float(os.environ.get("COVID_REFRESH_INTERVAL", 600))
+REFRESH_MAX_AGE = float(os.environ.get("COVID_REFRESH_MAX_AGE", 6 * 3600))
+
+DPC_FIRST_DAY = pd.Timestamp(2020, 2, 24)
+
 pretty_colors = ["#9E0031","#92B9BD","#5D2E8C","#0C6291","#F1E8B8","#FFF07C","#80FF72","#7EE8FA","#F7E2E5","#E58C8A",
                 "#FF6666","#506568","#977AB5","#A0E4DD","#F8F4DE","#8C8344","#468C3F","#457F89","#AE8C91","#A76665"]
 
@@ -57,72 +87,80 @@ def exp_viridis(d:float, r:float=0.16):
         exp_viridis += ((exponential_growth(itup[0], d, r), itup[1]),)
     return exp_viridis
 
-@st.cache(show_spinner=False)
-def convert_datetime(string_from,format_to:str="%m/%d"):
-    if type(string_from) == "str":
-        date = datetime.strptime(string_from, "%Y-%m-%dT%H:%M:%S")
-        return date
-    else:
-        dates = [datetime.strptime(x, "%Y-%m-%dT%H:%M:%S") for x in string_from]
-        return np.array(dates)
+def normalize_dates(df, format_to:str="%m/%d"):
+    '''
+        Converte la colonna "data" dei CSV DPC in datetime64 con un formato esplicito e aggiunge
+            indice_giorno: numero di giorni dal primo rilevamento DPC (int)
+            giorno: data formattata per le mappe animate (categorica, ordinata per data)
+        Le etichette vengono formattate una sola volta per ogni giorno distinto.
+        Se "data" è già datetime64 (per esempio dati letti dallo store) vengono ricalcolate solo le colonne derivate.
+    '''
+    if not np.issubdtype(df["data"].dtype, np.datetime64):
+        df["data"] = pd.to_datetime(df["data"], format=DPC_DATE_FORMAT)
 
-@st.cache(show_spinner=False)
-def calcolo_giorni_da_min_positivi(df_regioni, min_positivi=100):
-    regione_piu_colpita = df_regioni[df_regioni["data"] == df_regioni["data"].max()][df_regioni["totale_casi"] == df_regioni["totale_casi"].max()]["denominazione_regione"].tolist()[0]
-    temp = df_regioni[df_regioni["totale_casi"] > min_positivi]
-    temp = temp[temp["denominazione_regione"] == regione_piu_colpita]
-    return len(temp['data'].tolist())
+    day_codes, days = pd.factorize(df["data"].dt.normalize(), sort=True)
+    df["indice_giorno"] = ((days - DPC_FIRST_DAY).days.values[day_codes]).astype(np.int32)
 
+    day_labels = days.strftime(format_to)
+    #su più anni la stessa etichetta (es. 03/01) corrisponde a più giorni: le categorie restano uniche
+    categories = pd.unique(day_labels)
+    label_codes = pd.Index(categories).get_indexer(day_labels)
+    df["giorno"] = pd.Categorical.from_codes(label_codes[day_codes], categories=categories, ordered=True)
+    return df
 
 
-@st.cache(suppress_st_warning=True,show_spinner=False)
-def get_map_json():
+@versioned_cache(max_entries=4)
+def get_map_json(level:str="low"):
+    '''
+        Confini di province e regioni. Si usano i GeoJSON compatti del livello richiesto
+        (generati con geojson_tools.py), o gli originali se non sono stati generati.
+    '''
     #st.write("Cache miss: Getting the geoJSON")
-    province_map_path = os.path.join("map","GeoJSON","limits_IT_provinces_simple.json")
-    regions_map_path = os.path.join("map","GeoJSON","limits_IT_regions_simplified.json")
-    with open(province_map_path) as map_file:
-        province_map_json = json.load(map_file)
-    
-    with open(regions_map_path) as map_file:
-        regions_map_json = json.load(map_file)
+    maps = []
+    for name, (filename, _) in GEOJSON_SOURCES.items():
+        map_path = compact_path(name, level)
+        if not os.path.exists(map_path):
+            map_path = os.path.join("map","GeoJSON",filename)
+        with open(map_path) as map_file:
+            maps.append(json.load(map_file))
+    province_map_json, regions_map_json = maps
     return province_map_json,regions_map_json
 
+@versioned_cache(max_entries=4)
+def get_region_geometry_index(level:str):
+    province_map_json, _ = get_map_json(level)
+    return RegionGeometryIndex(province_map_json)
+
+@versioned_cache(max_entries=1)
+def get_area_hierarchy():
+    _, conversioni_regioni = get_conversion_indexes()
+    return get_hierarchy(conversioni_regioni)
+
+def rollup_areas(df, parent, area_column:str = "denominazione_regione"):
+    '''
+        Aggrega df (province o regioni) in un livello della gerarchia ("regione", "ripartizione", "nazione")
+        o in gruppi di regioni definiti dall'utente, e ricalcola le statistiche sulle aree aggregate
+    '''
+    df = rollup(df, parent_index(get_area_hierarchy(), parent), area_column)
+    return add_area_statistics(df, area_column)
+
+def national_series(df_regioni):
+    '''
+        Serie nazionale derivata dai dati regionali, al posto del file nazionale della Protezione Civile
+    '''
+    df_nazione = rollup_areas(df_regioni, "nazione", "nazione")
+    df_nazione["NUTS3"] = "IT"
+    return df_nazione
+
 def group_trentino(df):
-    trentino = df[df["codice_regione"] == 4]
-    trentino = trentino.groupby("data").apply(aggregate_trentino)
-    trentino = trentino.reset_index(drop=True)
-    df = df.append(trentino).sort_values(["data","denominazione_regione"])
+    '''
+        Aggiunge a df le righe del Trentino Alto Adige, aggregando le due province autonome
+    '''
+    trentino = rollup_areas(df, TRENTINO_ALTO_ADIGE)
+    df = pd.concat([df, trentino], ignore_index=True, sort=False).sort_values(["data","denominazione_regione"])
     df = df.reset_index(drop=True)
     df = df.infer_objects()
     return df
-    
-def aggregate_trentino(x):
-    #st.write("prima",type(x))
-    x = x.agg(
-        {"data":"max",
-        "stato":"max",
-        "codice_regione":"max",
-        "denominazione_regione":"max",
-        "lat":"mean",
-        "long":"mean",
-        "ricoverati_con_sintomi":"sum",
-        "terapia_intensiva":"sum",
-        "totale_ospedalizzati":"sum",
-        "isolamento_domiciliare":"sum",
-        "totale_positivi":"sum",
-        "variazione_totale_positivi":"sum",
-        "nuovi_positivi":"sum",
-        "dimessi_guariti":"sum",
-        "deceduti":"sum",
-        "totale_casi":"sum",
-        "tamponi":"sum",
-
-        }
-    )
-    x = x.to_frame().transpose()
-    x["denominazione_regione"] = "Trentino Alto Adige"
-    
-    return x
 
 def check_ds_istat():
     if (not os.path.exists(os.path.join("ISTAT_DATA","DCCV_AVQ_FAMIGLIE_01042020194245399.csv")) or
@@ -133,59 +171,133 @@ def check_ds_istat():
             # Extract all the contents of zip file in current directory
             zipObj.extractall("ISTAT_DATA")
 
-@st.cache(show_spinner=False)
+@versioned_cache(max_entries=1)
 def get_population_df():
     return import_ISTAT_dataset("DCIS_POPRES1_29032020143754329",sep=",")
 
-@st.cache(suppress_st_warning=True,show_spinner=False)
+@timer.timed()
+@versioned_cache(max_entries=2)
 def get_dataset(current_date: datetime.date):
-    df = pd.read_csv("https://raw.githubusercontent.com/pcm-dpc/COVID-19/master/dati-province/dpc-covid19-ita-province.csv", keep_default_na=False, na_values=[''])
-    df_regioni = pd.read_csv("https://raw.githubusercontent.com/pcm-dpc/COVID-19/master/dati-regioni/dpc-covid19-ita-regioni.csv")
-    df_nazione = pd.read_csv("https://raw.githubusercontent.com/pcm-dpc/COVID-19/master/dati-andamento-nazionale/dpc-covid19-ita-andamento-nazionale.csv")
+    return build_dataset(current_date)
 
-    check_ds_istat()
+@versioned_cache(max_entries=1)
+def get_dataset_cache():
+    return DatasetCache(DATASET_CACHE_DIR)
 
-    #df_regioni = group_trentino(df_regioni)
+def dataset_fingerprint(source: DPCSource) -> str:
+    '''
+        Impronta del contenuto di tutti gli input della pipeline (source deve essere locale)
+    '''
+    checksums = {f"dpc/{level}": source.checksum(level) for level in DATASET_LEVELS}
+    checksums.update({f"istat/{name}": checksum for name, checksum in IstatStore("ISTAT_DATA").source_checksums().items()})
+    checksums.update({path: file_checksum(path) for path in DATASET_INPUT_FILES})
+    return fingerprint(checksums)
 
-    conversioni_province, conversioni_regioni = read_conversion_tables()
-    
-    conversioni_regioni = conversioni_regioni.set_index("denominazione_regione")
-    conversioni_province = conversioni_province.set_index("codice_provincia")
-    df_regioni = df_regioni.join(conversioni_regioni, on="denominazione_regione")
-    df_nazione['NUTS3'] = 'IT'
-    
-    df = df.join(conversioni_province.drop(columns="denominazione_provincia"), on="codice_provincia")
+def build_dataset(current_date: datetime.date):
+    '''
+        Dataset elaborato. Senza store incrementale il risultato viene cercato nella cache su disco
+        per impronta degli input, e ricostruito solo se gli input sono cambiati.
+    '''
+    if DATA_STORE_DIR or not DATASET_CACHE_DIR:
+        return process_dataset(DPCSource(DATA_SOURCE), current_date)
+
+    with tempfile.TemporaryDirectory() as download_dir:
+        source = DPCSource(DATA_SOURCE).mirror(download_dir, DATASET_LEVELS)
+        with timer.stage("dataset_fingerprint"):
+            key = dataset_fingerprint(source)
+        cache = get_dataset_cache()
+        #esito e tempo di caricamento sono registrati dalla fase (pannello dei tempi e DatasetCache.stats())
+        with timer.stage("dataset_cache", cache=cache, key=key[:12]):
+            data = cache.get(key)
+        if data is not None:
+            return data
+
+        data = process_dataset(source, current_date)
+        cache.put(key, data)
+        return data
+
+def process_dataset(source: DPCSource, current_date: datetime.date):
+    with timer.stage("istat"):
+        pop, smokers, imprese = get_istat_series()
+        conversioni_province, conversioni_regioni = get_conversion_indexes()
+
+    preparers = {
+        "province": lambda x: prepare_province(x, conversioni_province, pop),
+        "regioni": lambda x: prepare_regioni(x, conversioni_regioni, pop),
+    }
+    area_columns = {"province": "sigla_provincia", "regioni": "denominazione_regione"}
+
+    if DATA_STORE_DIR:
+        #ingestione incrementale: si scaricano solo i giorni nuovi e si ricalcolano le statistiche sulla coda
+        store = PartitionedStore(DATA_STORE_DIR)
+        frames = {}
+        for level, prepare in preparers.items():
+            with timer.stage("update_store", level=level):
+                frames[level] = update_store(level, source, store, current_date,
+                                             process=lambda new_raw, context, prepare=prepare, level=level: process_increment(new_raw, context, prepare, area_columns[level]))
+            #le partizioni hanno categorie di "giorno" diverse: si ricostruiscono sul livello completo
+            with timer.stage("normalize_dates", level=level):
+                frames[level] = normalize_dates(frames[level])
+        df, df_regioni = frames["province"], frames["regioni"]
+    else:
+        raw = {}
+        for level in preparers:
+            with timer.stage("lettura_csv", level=level):
+                raw[level] = source.read_chunked(level)
+        df = prepare_province(raw["province"], conversioni_province, pop)
+        df_regioni = prepare_regioni(raw["regioni"], conversioni_regioni, pop)
+
+        with timer.stage("add_area_statistics", level="province"):
+            df = add_area_statistics(df, area_columns["province"])
+        with timer.stage("add_area_statistics", level="regioni"):
+            df_regioni = add_area_statistics(df_regioni, area_columns["regioni"])
+
+    #nomi e codici categorici, conteggi come interi stretti e tassi float32
+    frames = {"province": df, "regioni": df_regioni}
+    with timer.stage("compact_frame"):
+        compacted = {name: compact_frame(x) for name, x in frames.items()}
+    if MEMORY_REPORT:
+        print(format_memory_report(memory_report(frames, compacted)))
+
+    return compacted["province"], compacted["regioni"], smokers, imprese
+
+def dpc_has_new_day(snapshot) -> bool:
+    '''
+        True se la sorgente DPC ha pubblicato il giorno successivo all'ultimo dello snapshot
+    '''
+    _, df_regioni, _, _ = snapshot.data
+    next_day = (df_regioni["data"].max() + timedelta(days=1)).date()
+    return DPCSource(DATA_SOURCE).is_published("nazione", next_day)
 
-    df.dropna(subset = ["data"], inplace=True)
-    df = df.round({"growth_rate":2}) 
-    #streamlit vuole "lon" per la longitudine invece di "long"
-    df.columns = ["lon" if x=="long" else x for x in df.columns]
-    df = df.apply(lambda x: convert_datetime(x) if x.name == 'data' else x)
-    df_regioni = df_regioni.apply(lambda x: convert_datetime(x) if x.name == 'data' else x)
-    df_nazione = df_nazione.apply(lambda x: convert_datetime(x) if x.name == 'data' else x)
+def get_istat_series():
+    series, _ = load_istat_store()
+    return series["Popolazione"], series["Fumatori"], series["Imprese"]
 
-    #aggiungere una data formattata come colonna per le mappe
-    df_nazione["giorno"] = df_nazione["data"].apply(lambda x: x.strftime("%m/%d"))
-    df_regioni["giorno"] = df_regioni["data"].apply(lambda x: x.strftime("%m/%d"))
-    df["giorno"] = df["data"].apply(lambda x: x.strftime("%m/%d"))
+def get_istat_metadata(name:str):
+    _, metadata = load_istat_store()
+    return metadata[name]
 
+def load_istat_store():
+    #le serie vengono compilate (estrazione zip e pivot) solo quando cambiano i file in ISTAT_DATA
+    return IstatStore("ISTAT_DATA").load(build=compile_istat_series)
+
+def compile_istat_series():
     pop_path = os.path.join("ISTAT_DATA", "Popolazione.csv")
     if os.path.exists(pop_path):
         pop = pd.read_csv(pop_path).pivot_table(index="ITTER107")
     else:
+        check_ds_istat()
         df_istat = get_population_df()
         pop = ISTAT_return_filtered_series(df_istat,"ETA1","10_anni")
         pop = pd.concat([pop, ISTAT_return_filtered_series(df_istat,"Stato civile")], axis=1)
         pop = pd.concat([pop, ISTAT_return_filtered_series(df_istat,"Sesso")], axis=1)
         pop.to_csv(os.path.join("ISTAT_DATA", df_istat.metadata['main_data_type']+".csv"))
 
-    df_regioni = df_regioni.join(pop, on="NUTS3")
-    df = df.join(pop, on="NUTS3")
-
     smokers_path = os.path.join("ISTAT_DATA", "Fumatori.csv")
     if os.path.exists(smokers_path):
         smokers = pd.read_csv(smokers_path).pivot_table(index="ITTER107")
     else:
+        check_ds_istat()
         df_istat_smokers = import_ISTAT_dataset("DCCV_AVQ_PERSONE_01042020202759289",sep=",")
         smokers = ISTAT_return_filtered_series(df_istat_smokers,selected_column="Tipo dato")
         smokers.to_csv(os.path.join("ISTAT_DATA", df_istat_smokers.metadata['main_data_type']+".csv"))
@@ -195,6 +307,7 @@ def get_dataset(current_date: datetime.date):
     if os.path.exists(imprese_path):
         imprese = pd.read_csv(imprese_path).pivot_table(index="D1")
     else:
+        check_ds_istat()
         df_istat_imprese = import_ISTAT_dataset("DICA_ASIAUE1P_02042020145705482",sep=",")
         scelta_dati_imprese = [x for x in df_istat_imprese.metadata["multiindex"] if x != df_istat_imprese.metadata["data_type_column"]]
         data_types = df_istat_imprese[df_istat_imprese.metadata["data_type_column"]].unique()
@@ -222,27 +335,112 @@ def get_dataset(current_date: datetime.date):
         with open(os.path.join("ISTAT_DATA", df_istat_imprese.metadata['main_data_type']+"_metadata.json"),mode="w", encoding="utf-8") as f:
             f.write(json_dict)
 
-    df = df.groupby('sigla_provincia').apply(add_statistics)
-    df = format_df(df)
-    df_regioni = df_regioni.groupby('denominazione_regione').apply(add_statistics)
-    df_regioni = format_df(df_regioni)
+    metadata = {}
+    for path in glob.glob(os.path.join("ISTAT_DATA", "*_metadata.json")):
+        with open(path, encoding="utf-8") as json_file:
+            metadata[os.path.basename(path)[:-len("_metadata.json")]] = json.load(json_file)
 
-    return df, df_regioni, smokers, imprese
+    return {"Popolazione": pop, "Fumatori": smokers, "Imprese": imprese}, metadata
 
+def prepare_province(df, conversioni_province, pop):
+    with timer.stage("join_conversioni", level="province"):
+        df = df.join(conversioni_province.drop(columns="denominazione_provincia"), on="codice_provincia")
+        df = df.dropna(subset = ["data"])
+    #streamlit vuole "lon" per la longitudine invece di "long"
+    df.columns = ["lon" if x=="long" else x for x in df.columns]
+    with timer.stage("normalize_dates", level="province"):
+        df = normalize_dates(df)
+    with timer.stage("join_istat", level="province"):
+        df = df.join(pop, on="NUTS3")
+    return df
+
+def prepare_regioni(df_regioni, conversioni_regioni, pop):
+    with timer.stage("join_conversioni", level="regioni"):
+        df_regioni = df_regioni.join(conversioni_regioni, on="denominazione_regione")
+    with timer.stage("normalize_dates", level="regioni"):
+        df_regioni = normalize_dates(df_regioni)
+    with timer.stage("join_istat", level="regioni"):
+        df_regioni = df_regioni.join(pop, on="NUTS3")
+    return df_regioni
+
+def prepare_nazione(df_nazione):
+    df_nazione['NUTS3'] = 'IT'
+    with timer.stage("normalize_dates", level="nazione"):
+        df_nazione = normalize_dates(df_nazione)
+    return df_nazione
 
-@st.cache(suppress_st_warning=True,show_spinner=False)
+def add_area_statistics(df, area_column):
+    '''
+        Versione vettorizzata di df.groupby(area_column).apply(add_statistics) seguita da format_df:
+        tutte le aree vengono elaborate in un solo passaggio con diff/shift/rolling raggruppati
+        su un indice ordinato per (area, data). Le righe senza area vengono scartate come faceva
+        il groupby, e la pulizia di NaN e inf viene fatta direttamente sulle colonne numeriche.
+    '''
+    df = df[df[area_column].notna()].copy()
+
+    columns = [area_column, "data", "totale_casi"] + (["tamponi"] if "tamponi" in df else [])
+    ordered = df[columns].sort_values([area_column, "data"], kind="mergesort")
+    area_codes = pd.Series(pd.factorize(ordered[area_column])[0], index=ordered.index)
+    #prima riga di ogni area: lo shift non deve prendere il valore dell'area precedente
+    first_row = area_codes != area_codes.shift(1)
+
+    increased_cases = ordered["totale_casi"].diff().mask(first_row)
+    growth_rate = increased_cases / increased_cases.shift(1).mask(first_row)
+    #Growth rate mediata sugli ultimi 3 giorni
+    smooth_growth_rate = growth_rate.groupby(area_codes, sort=False).rolling(min_periods=1,window=3).mean().reset_index(level=0, drop=True)
+
+    df['increased_cases'] = increased_cases
+    df['growth_rate'] = growth_rate
+    df['smooth_growth_rate'] = smooth_growth_rate
+    if "tamponi" in df:
+        df['totale_casi/tamponi'] = df.totale_casi / df.tamponi
+        df['increased_tamponi'] = ordered["tamponi"].diff().mask(first_row)
+    if "deceduti" in df:
+        df['suscettibili'] = df["Popolazione_ETA1_Total"]-df["totale_positivi"]-df["deceduti"]-df["dimessi_guariti"]
+
+    df = df.fillna(0)
+    floats = df.select_dtypes(include=[np.floating]).columns
+    df[floats] = df[floats].mask(np.isinf(df[floats]), 0)
+    return df
+
+def process_increment(new_raw, context, prepare, area_column=None):
+    '''
+        Prepara le righe dei giorni nuovi e ricalcola le statistiche solo sulla coda:
+        le righe di context (gli ultimi giorni già elaborati) servono per shift e rolling.
+    '''
+    new = prepare(new_raw)
+    if area_column is None:
+        return new
+    first_new_day = new["data"].min()
+    if context is not None and not context.empty:
+        new = pd.concat([context, new], ignore_index=True, sort=False)
+    new = add_area_statistics(new, area_column)
+    return new[new["data"] >= first_new_day]
+
+@versioned_cache(max_entries=1)
+def get_conversion_indexes():
+    conversioni_province, conversioni_regioni = read_conversion_tables()
+    return conversioni_province.set_index("codice_provincia"), conversioni_regioni.set_index("denominazione_regione")
+
+def dataset_version(*frames) -> str:
+    '''
+        Identificativo di una versione dei dati dal contenuto di ogni frame (colonne e valori di
+        tutte le righe): cambia anche quando la sorgente corregge deceduti, tamponi o ricoverati
+        già pubblicati senza toccare totale_casi
+    '''
+    sha = hashlib.sha1()
+    for x in frames:
+        sha.update(json.dumps([str(column) for column in x.columns]).encode("utf-8"))
+        sha.update(pd.util.hash_pandas_object(x, index=False).values.tobytes())
+    return sha.hexdigest()[:12]
+
+@versioned_cache(max_entries=1)
 def read_conversion_tables():
     conversioni_province = pd.read_csv("codici_province.CSV",encoding = "ISO-8859-1",sep=";")
     conversioni_regioni = pd.read_csv("codici_regioni.CSV",encoding = "ISO-8859-1",sep=";")
     
     return conversioni_province, conversioni_regioni
 
-@st.cache(show_spinner=False)
-def get_areas(df):
-    regions = df["denominazione_regione"].unique()
-    provinces = df["denominazione_provincia"].unique()
-    return regions,provinces
-
 def add_statistics(df):
     df['increased_cases'] = df.totale_casi - df.totale_casi.shift(1)
     df['growth_rate'] = df.increased_cases / df.increased_cases.shift(1)
@@ -255,7 +453,7 @@ def add_statistics(df):
     return df
 
 
-@st.cache(suppress_st_warning=True,show_spinner=False)
+@versioned_cache(max_entries=8)
 def import_ISTAT_dataset(filename_without_extension:str,sep=","):
     df = pd.read_csv(os.path.join("ISTAT_DATA",f"{filename_without_extension}.csv"),sep=sep)
     path = os.path.join("ISTAT_DATA",f"{filename_without_extension}_metadata.json")
@@ -275,7 +473,6 @@ def group_labels(x,prefix,ranges):
             return f"{prefix}{group}"
     raise Exception(f"Problem in aggregating column {x}")
 
-@st.cache(suppress_st_warning=True,show_spinner=False)
 def ISTAT_return_filtered_series(df,selected_column:str,aggregate=None,selected_data_type=None):
     metadata = df.metadata
 
@@ -0,0 +1,182 @@
+"""Cache in memoria con chiavi esplicite al posto di st.cache.
+
+st.cache calcola l'hash di tutti gli argomenti (DataFrame e GeoJSON compresi) e del
+valore restituito ad ogni rerun. Con @versioned_cache la chiave è costruita solo dagli
+argomenti piccoli (versione del dataset, selezioni dell'utente, parametri); gli
+argomenti grandi vanno elencati in ignore e non vengono mai letti per la chiave.
+
+Ogni funzione decorata ha la sua cache LRU con numero massimo di entry e TTL
+opzionale; cache_stats() restituisce hit, miss, tempo speso a costruire le chiavi
+e byte occupati per funzione.
+"""
+
+import functools
+import hashlib
+import inspect
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+CACHE_REGISTRY = {}
+_registry_lock = threading.Lock()
+
+
+def freeze(value):
+    '''
+        Converte un argomento piccolo in un valore hashable da usare nella chiave
+    '''
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(x) for x in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(freeze(x) for x in value))
+    if isinstance(value, np.ndarray):
+        return tuple(freeze(x) for x in value.tolist())
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def code_fingerprint(code) -> str:
+    sha = hashlib.sha1(code.co_code)
+    for const in code.co_consts:
+        #le funzioni annidate (lambda) contengono l'indirizzo in memoria nel repr
+        sha.update(code_fingerprint(const).encode("utf-8") if inspect.iscode(const) else repr(const).encode("utf-8"))
+    return sha.hexdigest()
+
+
+#oltre questa lunghezza liste e tuple vengono stimate da un campione dei primi elementi
+SIZEOF_SAMPLE = 32
+
+
+def sizeof(value, seen: set = None) -> int:
+    '''
+        Stima dei byte occupati senza serializzare il valore: DataFrame e array dalla loro memoria,
+        dizionari e sequenze sommando gli elementi (le sequenze lunghe da un campione), figure
+        plotly dai dizionari di tracce, layout e frame che contengono già. Gli oggetti condivisi
+        (per esempio il GeoJSON di tutti i frame di una mappa) sono contati una volta sola.
+    '''
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True).sum()) if isinstance(value, pd.DataFrame) else int(value.memory_usage(deep=True))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(k, seen) + sizeof(v, seen) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        sample = value[:SIZEOF_SAMPLE]
+        items = sum(sizeof(x, seen) for x in sample)
+        return sys.getsizeof(value) + (items * len(value) // len(sample) if sample else 0)
+    if hasattr(value, "_data") and hasattr(value, "_layout") and hasattr(value, "_frame_objs"):
+        return sizeof(value._data, seen) + sizeof(value._layout, seen) + sizeof([x._props for x in value._frame_objs], seen)
+    return sys.getsizeof(value)
+
+
+class VersionedCache(object):
+    def __init__(self, name: str, max_entries: int = 128, ttl: float = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.hashing_time = 0.0
+        self.code_hash = None
+        self._lock = threading.Lock()
+        #esito dell'ultima lettura per thread, usato dalla misura dei tempi
+        self._local = threading.local()
+
+    def get(self, key):
+        '''
+            (True, valore) se la chiave è presente e non scaduta, altrimenti (False, None)
+        '''
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                self._local.hit = True
+                return True, entry[0]
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            self._local.hit = False
+            return False, None
+
+    def last_hit(self):
+        '''
+            True/False se l'ultima lettura fatta dal thread corrente ha trovato la chiave, None se non ce ne sono state
+        '''
+        return getattr(self._local, "hit", None)
+
+    def put(self, key, value):
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        size = sizeof(value)
+        with self._lock:
+            self.entries[key] = (value, expires, size)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self.entries), "bytes": sum(x[2] for x in self.entries.values()),
+                    "hashing_time": self.hashing_time}
+
+
+def versioned_cache(max_entries: int = 128, ttl: float = None, ignore=()):
+    '''
+        Decoratore: la chiave è data dagli argomenti della funzione tranne quelli in ignore.
+        Gli argomenti ignorati devono essere determinati da quelli nella chiave
+        (per esempio un DataFrame determinato dalla versione del dataset e dalla selezione).
+    '''
+    def decorator(func):
+        signature = inspect.signature(func)
+        #lo script streamlit ridefinisce le sue funzioni ad ogni rerun: la cache viene
+        #riutilizzata finché il codice della funzione non cambia
+        name = f"{func.__module__}.{func.__qualname__}"
+        code_hash = code_fingerprint(func.__code__)
+        with _registry_lock:
+            cache = CACHE_REGISTRY.get(name)
+            if cache is None or cache.code_hash != code_hash:
+                cache = VersionedCache(name, max_entries=max_entries, ttl=ttl)
+                cache.code_hash = code_hash
+                CACHE_REGISTRY[name] = cache
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            key = tuple((arg, freeze(value)) for arg, value in bound.arguments.items() if arg not in ignore)
+            cache.hashing_time += time.perf_counter() - start
+
+            found, value = cache.get(key)
+            if not found:
+                value = func(*args, **kwargs)
+                cache.put(key, value)
+            return value
+
+        wrapper.cache = cache
+        return wrapper
+    return decorator
+
+
+def cache_stats() -> dict:
+    return {name: cache.stats() for name, cache in CACHE_REGISTRY.items()}